@@ -1,24 +1,207 @@
-import streamlit as st
+import sys
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
+import streamlit as st
 
-st.set_page_config(page_title="Revenue Leakage Dashboard", layout="wide")
+# `streamlit run app/streamlit_app.py` only puts app/ on sys.path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-st.title("💸 Revenue Leakage Review")
+from src.explainability import similar_cases  # noqa: E402
+from src.pipeline.checkpoint import file_key  # noqa: E402
+from src.storage import case_db, rollups  # noqa: E402
 
-uploaded = st.file_uploader("Upload leakage results CSV", type=["csv"])
+# ---------------- PATHS ----------------
+PATTERNS_PATH = Path("data/processed/leakage_patterns.csv")
+DB_PATH = case_db.DB_PATH
+INDEX_PATH = similar_cases.INDEX_PATH
+ROLLUP_PATH = rollups.ROLLUP_DB_PATH
 
-if uploaded is not None:
-    df = pd.read_csv(uploaded)
-
-    required_cols = [
-        "invoice_id",
-        "leakage_baseline",
-        "leakage_pattern",
-        "explanation_text",
-    ]
-    missing = [c for c in required_cols if c not in df.columns]
+# ---------------- CONFIG ----------------
+REQUIRED_COLS = [
+    "invoice_id",
+    "leakage_baseline",
+    "leakage_pattern",
+    "explanation_text",
+]
+PAGE_SIZES = [25, 50, 100, 250]
+EXPORT_LIMIT = 100_000
+
+
+# ---------------- DATA ACCESS ----------------
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_cases(cache_key: str, _source) -> pd.DataFrame:
+    """
+    Parse once per file version. `cache_key` is the pipeline file's
+    file_key (path, size, mtime) or the upload's file_id, so a rerun
+    neither reads nor hashes the file; `_source` (a path or the uploaded
+    file) is excluded from the key. cache_resource hands every rerun the
+    same frame rather than a copy, so the view must not modify it.
+    Returned frame is sorted by leakage_baseline (ascending) so filters can
+    binary-search it. Rows without a leakage estimate never pass the
+    filter, so they are dropped here.
+    """
+    if hasattr(_source, "seek"):
+        _source.seek(0)
+    df = pd.read_csv(_source)
+
+    missing = [c for c in REQUIRED_COLS if c not in df.columns]
     if missing:
-        st.error(f"Missing required columns: {missing}")
+        raise ValueError(f"Missing required columns: {missing}")
+
+    df["leakage_baseline"] = pd.to_numeric(df["leakage_baseline"], errors="coerce")
+    df = df.dropna(subset=["leakage_baseline"])
+    df = df.sort_values("leakage_baseline", kind="mergesort")
+    return df.reset_index(drop=True)
+
+
+def filter_start(sorted_leakage: np.ndarray, min_leakage: float) -> int:
+    # first row with leakage_baseline >= min_leakage
+    return int(np.searchsorted(sorted_leakage, min_leakage, side="left"))
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def filtered_csv(cache_key: str, min_leakage: float, _df: pd.DataFrame) -> bytes:
+    start = filter_start(_df["leakage_baseline"].to_numpy(), min_leakage)
+    return _df.iloc[start:][::-1].to_csv(index=False).encode("utf-8")
+
+
+# ---------------- DATA ACCESS (CASE DATABASE) ----------------
+@st.cache_resource
+def db_connection(db_mtime: float):
+    # one read-only connection per published database version
+    return case_db.connect(DB_PATH)
+
+
+@st.cache_resource
+def rollup_connection(rollup_mtime: float):
+    return rollups.connect(ROLLUP_PATH)
+
+
+@st.cache_resource
+def similar_case_index(index_mtime: float):
+    # loaded once per Level 6 run
+    return similar_cases.SimilarCaseIndex.load(INDEX_PATH)
+
+
+@st.cache_data(show_spinner=False)
+def db_options(db_mtime: float) -> dict:
+    con = db_connection(db_mtime)
+    return {
+        col: case_db.distinct_values(con, col)
+        for col in ["customer_id", "product_id", "leakage_pattern"]
+    }
+
+
+def paginate(n_matches: int) -> tuple[int, int, int]:
+    page_size = st.sidebar.selectbox("Rows per page", PAGE_SIZES, index=1)
+    n_pages = max(1, -(-n_matches // page_size))
+    # Keyed on the result size so the page resets when the result set changes
+    page = st.sidebar.number_input(
+        "Page",
+        min_value=1,
+        max_value=n_pages,
+        value=1,
+        step=1,
+        key=f"page_{n_matches}_{page_size}",
+    )
+    return int(page), int(page_size), n_pages
+
+
+# ---------------- UI ----------------
+def render_database_view():
+    db_mtime = DB_PATH.stat().st_mtime
+    con = db_connection(db_mtime)
+    options = db_options(db_mtime)
+
+    st.caption(f"Querying case database: `{DB_PATH}`")
+
+    st.sidebar.header("Filters")
+    filters = {
+        "min_leakage": st.sidebar.number_input(
+            "Minimum leakage ($)", min_value=0.0, value=0.0, step=5.0,
+        ),
+        "customer_ids": st.sidebar.multiselect("Customer", options["customer_id"]),
+        "product_ids": st.sidebar.multiselect("Product", options["product_id"]),
+        "patterns": st.sidebar.multiselect("Leakage pattern", options["leakage_pattern"]),
+        "rule_flags": st.sidebar.multiselect("Rule triggered", case_db.RULE_FLAGS),
+        "validated_only": st.sidebar.checkbox("Validated leakage only", value=False),
+    }
+    date_range = st.sidebar.date_input("Invoice date range", value=())
+    if len(date_range) == 2:
+        filters["date_from"], filters["date_to"] = date_range
+
+    n_matches = case_db.count_cases(con, **filters)
+
+    st.subheader("Filtered Leakage Cases")
+    st.write(f"Showing {n_matches} invoices")
+
+    page, page_size, n_pages = paginate(n_matches)
+    window = case_db.query_cases(
+        con,
+        columns=REQUIRED_COLS + ["leakage_ensemble", "model_disagreement", "customer_id", "product_id", "invoice_date"],
+        limit=page_size,
+        offset=(page - 1) * page_size,
+        **filters,
+    )
+    st.dataframe(window, use_container_width=True, hide_index=True)
+    st.caption(f"Page {page} of {n_pages}")
+
+    if INDEX_PATH.exists() and not window.empty:
+        with st.expander("Similar past cases"):
+            invoice_id = st.selectbox("Invoice", window["invoice_id"])
+            k = st.slider("Cases", min_value=3, max_value=25, value=5)
+            index = similar_case_index(INDEX_PATH.stat().st_mtime)
+            try:
+                st.dataframe(
+                    similar_cases.similar_cases(invoice_id, k=k, index=index, con=con),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            except KeyError as e:
+                st.info(str(e))
+
+    with st.expander("Leakage summary by pattern"):
+        st.dataframe(
+            case_db.summarize_cases(con, ["leakage_pattern"], **filters),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+    if ROLLUP_PATH.exists():
+        with st.expander("Leakage rollup (customer / product / pattern / month)"):
+            group_by = st.multiselect("Group by", rollups.DIMENSIONS, default=["invoice_month"])
+            st.caption("Customer, product, pattern and date filters apply; totals come from the rollup cube.")
+            st.dataframe(
+                rollups.query_rollup(
+                    rollup_connection(ROLLUP_PATH.stat().st_mtime),
+                    group_by,
+                    customer_ids=filters["customer_ids"],
+                    product_ids=filters["product_ids"],
+                    patterns=filters["patterns"],
+                    month_from=filters.get("date_from"),
+                    month_to=filters.get("date_to"),
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+
+    if st.button("Prepare filtered report"):
+        export = case_db.query_cases(con, limit=EXPORT_LIMIT, **filters)
+        st.download_button(
+            "Download filtered report",
+            data=export.to_csv(index=False).encode("utf-8"),
+            file_name="leakage_report.csv",
+            mime="text/csv",
+        )
+
+
+def render_csv_view(cache_key: str, source):
+    try:
+        df = load_cases(cache_key, source)
+    except ValueError as e:
+        st.error(str(e))
         st.stop()
 
     st.sidebar.header("Filters")
@@ -29,29 +212,47 @@ if uploaded is not None:
         step=5.0,
     )
 
-    filtered = df[df["leakage_baseline"] >= min_leakage]
+    # Sorted ascending -> matching rows are the tail [start:], largest last
+    start = filter_start(df["leakage_baseline"].to_numpy(), min_leakage)
+    n_matches = len(df) - start
 
     st.subheader("Filtered Leakage Cases")
-    st.write(f"Showing {len(filtered)} invoices")
+    st.write(f"Showing {n_matches} invoices")
+
+    page, page_size, n_pages = paginate(n_matches)
+
+    # Page 1 = largest leakage first; only the visible window is materialized
+    hi = len(df) - (page - 1) * page_size
+    lo = max(start, hi - page_size)
+    window = df.iloc[lo:hi][REQUIRED_COLS][::-1]
 
     st.dataframe(
-        filtered[
-            [
-                "invoice_id",
-                "leakage_baseline",
-                "leakage_pattern",
-                "explanation_text",
-            ]
-        ],
+        window,
         use_container_width=True,
+        hide_index=True,
     )
+    st.caption(f"Page {page} of {n_pages}")
 
-    csv = filtered.to_csv(index=False).encode("utf-8")
     st.download_button(
         "Download filtered report",
-        data=csv,
+        data=filtered_csv(cache_key, float(min_leakage), df),
         file_name="leakage_report.csv",
         mime="text/csv",
     )
+
+
+st.set_page_config(page_title="Revenue Leakage Dashboard", layout="wide")
+
+st.title("💸 Revenue Leakage Review")
+
+uploaded = st.file_uploader("Upload leakage results CSV (optional)", type=["csv"])
+
+if uploaded is not None:
+    render_csv_view(f"upload:{uploaded.file_id}", uploaded)
+elif DB_PATH.exists():
+    render_database_view()
+elif PATTERNS_PATH.exists():
+    st.caption(f"Reading pipeline output: `{PATTERNS_PATH}`")
+    render_csv_view(file_key(PATTERNS_PATH), PATTERNS_PATH)
 else:
-    st.info("Upload `leakage_patterns.csv` to begin.")
+    st.info("Run the pipeline or upload `leakage_patterns.csv` to begin.")
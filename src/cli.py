@@ -0,0 +1,123 @@
+"""
+Single command-line entry point for every level.
+
+    python -m src.cli <command> [options]     # options go to that level's own parser
+    python -m src.cli --help                  # list commands
+
+Only the module behind the chosen command is imported, so heavy frameworks
+(sklearn, xgboost, torch, shap) load only for the levels that use them.
+Commands run from the project root, wherever they are launched from.
+"""
+from __future__ import annotations
+
+import importlib
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# command -> ("module:function", help)
+COMMANDS = {
+    "generate-data": ("src.data.generate_synthetic_data:main", "Level 0 - generate synthetic raw data"),
+    "validate": ("src.data.load_validate:main", "Level 1 - load and validate raw inputs"),
+    "merge": ("src.data.merge_tables:merge_all", "Level 1 - build billing_unified.csv"),
+    "features": ("src.features.build_features:main", "Level 2 - feature engineering"),
+    "feature-matrix": ("src.features.feature_matrix:main", "Level 2 - rebuild the memory-mapped feature matrix"),
+    "anomaly": ("src.models.anomaly_detection:run_anomaly_detection", "Level 3 - anomaly scores (IsolationForest by default)"),
+    "detectors": ("src.models.detector_benchmark:main", "Level 3 - compare anomaly detectors on injected leakage"),
+    "sampling": ("src.models.training_sample:main", "Levels 3/5A - training-sample speedup vs accuracy"),
+    "rules": ("src.models.context_validation:run_context_validation", "Level 4 - context-aware validation"),
+    "baseline": ("src.models.revenue_baseline_xgb:main", "Level 5A - XGBoost expected revenue"),
+    "aggregate": ("src.models.revenue_baseline_aggregate:main", "Level 5A - re-aggregate legacy row-level estimates"),
+    "torch": ("src.models.revenue_model_torch:main", "Level 5B - PyTorch benchmark"),
+    "ensemble": ("src.models.revenue_ensemble:main", "Level 5C - ensemble expected revenue"),
+    "explain": ("src.explainability.run_level6_explainability:main", "Level 6 - SHAP drivers + narratives"),
+    "similar": ("src.explainability.similar_cases:main", "Level 6 - similar past cases for an invoice"),
+    "patterns": ("src.models.run_level7_pattern_discovery:main", "Level 7 - pattern discovery"),
+    "publish": ("src.storage.case_db:main", "Level 8 - publish cases to the SQLite store"),
+    "rollups": ("src.storage.rollups:main", "Level 8 - update the leakage rollup cube incrementally"),
+    "stress-test": ("src.models.run_level9_stress_test:main", "Level 9 - injected-leakage stress test"),
+    "partitioned": ("src.pipeline.partitioned:main", "Levels 2-4 over partitions"),
+    "score": ("src.serving.score_invoice:main", "Score sample invoices in-process"),
+    "stream": ("src.serving.stream_scoring:main", "Streaming anomaly scoring"),
+}
+
+# batch levels in dependency order, run by `all`
+PIPELINE = [
+    "merge", "features", "anomaly", "rules", "baseline",
+    "explain", "patterns", "stress-test", "publish", "rollups",
+]
+
+# commands that accept --resume (continue from their checkpoints)
+RESUMABLE = {"explain", "partitioned", "torch"}
+
+
+def _usage() -> str:
+    width = max(len(c) for c in COMMANDS) + 2
+    lines = [
+        "usage: python -m src.cli <command> [options]",
+        "",
+        "commands:",
+        *(f"  {name:<{width}}{help_}" for name, (_, help_) in COMMANDS.items()),
+        f"  {'all':<{width}}Run {' -> '.join(PIPELINE)} (--resume: continue checkpointed levels)",
+        f"  {'dashboard':<{width}}Launch the Streamlit dashboard",
+        "",
+        "Run `python -m src.cli <command> --help` for a command's options.",
+    ]
+    return "\n".join(lines)
+
+
+def run_command(name: str, args: list[str]) -> None:
+    """Import the command's module and call its entry point with `args` as argv."""
+    target, _ = COMMANDS[name]
+    module_name, func_name = target.split(":")
+    func = getattr(importlib.import_module(module_name), func_name)
+
+    argv = sys.argv
+    sys.argv = [f"src.cli {name}", *args]
+    try:
+        func()
+    finally:
+        sys.argv = argv
+
+
+def run_pipeline(resume: bool = False) -> None:
+    for name in PIPELINE:
+        started = time.perf_counter()
+        print(f"[cli] {name} ...")
+        run_command(name, ["--resume"] if resume and name in RESUMABLE else [])
+        print(f"[cli] {name} done in {time.perf_counter() - started:.1f}s")
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        print(_usage())
+        return 0
+
+    name, args = argv[0], argv[1:]
+
+    # every level's default paths are relative to the project root
+    os.chdir(ROOT)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    if name == "all":
+        run_pipeline(resume="--resume" in args)
+    elif name == "dashboard":
+        return subprocess.call(
+            [sys.executable, "-m", "streamlit", "run", str(ROOT / "app" / "streamlit_app.py"), *args]
+        )
+    elif name in COMMANDS:
+        run_command(name, args)
+    else:
+        print(f"Unknown command: {name}\n\n{_usage()}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import logging
 from pathlib import Path
@@ -5,6 +6,9 @@ from pathlib import Path
 # ---------------- CONFIG ----------------
 RAW_DATA_PATH = Path("data/raw")
 LOG_PATH = Path("data/processed/ingestion_errors.log")
+QUARANTINE_PATH = Path("data/processed/quarantine")
+
+CHUNK_SIZE = 500_000   # rows validated per vectorized pass
 
 REQUIRED_SCHEMAS = {
     "invoices": [
@@ -26,18 +30,74 @@ REQUIRED_SCHEMAS = {
     ]
 }
 
+# ---------------- ROW CHECKS ----------------
+KEY_COLS = {
+    "invoices": ["invoice_id", "customer_id", "product_id"],
+    "contracts": ["customer_id", "product_id"],
+    "usage": ["customer_id", "product_id"],
+    "pricing": ["product_id"],
+}
+DATE_COLS = {
+    "invoices": ["invoice_date"],
+    "contracts": ["contract_start", "contract_end"],
+    "usage": ["usage_date"],
+    "pricing": [],
+}
+NUMERIC_COLS = {
+    "invoices": ["quantity", "unit_price", "discount_pct", "billed_amount"],
+    "contracts": ["contract_price", "max_discount_pct"],
+    "usage": ["actual_usage"],
+    "pricing": ["list_price"],
+}
+NON_NEGATIVE_COLS = {
+    "invoices": ["quantity", "unit_price"],
+    "contracts": ["contract_price"],
+    "usage": ["actual_usage"],
+    "pricing": ["list_price"],
+}
+PERCENT_COLS = {
+    "invoices": ["discount_pct"],
+    "contracts": ["max_discount_pct"],
+}
+
+# billed_amount must match quantity * unit_price * (1 - discount) within
+# a cent plus half a cent per unit (unit prices are rounded to cents)
+BILLED_ABS_TOLERANCE = 0.01
+BILLED_UNIT_TOLERANCE = 0.005
+
+# One bit per reason; a row's mask holds every check it failed
+REASON_CODES = [
+    "null_key",
+    "bad_date",
+    "bad_number",
+    "negative_value",
+    "percent_out_of_range",
+    "billed_mismatch",
+    "duplicate_invoice_id",
+    "contract_dates_inverted",
+]
+REASON_BITS = {reason: np.uint16(1 << i) for i, reason in enumerate(REASON_CODES)}
+
+
 # ---------------- LOGGING ----------------
-logging.basicConfig(
-    filename=LOG_PATH,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+def configure_logging():
+    # configured on first load, not at import (importing must not create files)
+    LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        filename=LOG_PATH,
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
 
 # ---------------- FUNCTIONS ----------------
-def load_csv(name):
-    path = RAW_DATA_PATH / f"{name}.csv"
-    df = pd.read_csv(path)
-    return df
+def read_chunks(name, chunk_size=CHUNK_SIZE, raw_path=RAW_DATA_PATH):
+    path = Path(raw_path) / f"{name}.csv"
+    try:
+        return pd.read_csv(path, chunksize=chunk_size)
+    except pd.errors.EmptyDataError:
+        # 0-byte file: no header and no rows, so no chunks
+        return iter(())
 
 
 def validate_schema(df, name):
@@ -48,27 +108,174 @@ def validate_schema(df, name):
     return df
 
 
-def validate_values(df, name):
+class SeenIds:
+    """
+    Invoice IDs seen so far, kept as a sorted array of unique 64-bit hashes
+    (a Python set lookup per chunk grows too slow on large files). Each
+    chunk's new hashes are merged in at their searchsorted positions, a
+    linear copy rather than a re-sort of everything seen.
+    """
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def duplicated(self, ids):
+        """True for IDs already seen in an earlier chunk or earlier in this one."""
+        h = pd.util.hash_pandas_object(ids, index=False, categorize=False).to_numpy()
+        order = np.argsort(h, kind="stable")
+        h_sorted = h[order]
+
+        dup_sorted = np.zeros(len(h), dtype=bool)
+        dup_sorted[1:] = h_sorted[1:] == h_sorted[:-1]
+        if len(self.hashes):
+            pos = np.searchsorted(self.hashes, h_sorted).clip(max=len(self.hashes) - 1)
+            dup_sorted |= self.hashes[pos] == h_sorted
+
+        new = h_sorted[~dup_sorted]
+        self.hashes = np.insert(self.hashes, np.searchsorted(self.hashes, new), new)
+        duplicated = np.empty(len(h), dtype=bool)
+        duplicated[order] = dup_sorted
+        return duplicated
+
+
+def row_checks(df, name, seen_ids=None):
+    """
+    Every row check for one chunk in a single vectorized pass.
+
+    Returns (df, mask): `df` with date columns parsed and numeric columns
+    coerced, and a uint16 reason mask per row (0 = clean).
+    `seen_ids` carries invoice IDs across chunks for the duplicate check.
+    """
+    df = df.copy()
+    mask = np.zeros(len(df), dtype=np.uint16)
+
+    def flag(reason, failed):
+        np.bitwise_or(mask, REASON_BITS[reason], out=mask, where=np.asarray(failed, dtype=bool))
+
+    for col in KEY_COLS[name]:
+        key = df[col]
+        flag("null_key", key.isna() | (key.astype(str).str.strip() == ""))
+
+    for col in DATE_COLS[name]:
+        df[col] = pd.to_datetime(df[col], errors="coerce", format="ISO8601")
+        flag("bad_date", df[col].isna())
+
+    for col in NUMERIC_COLS[name]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+        flag("bad_number", df[col].isna())
+
+    for col in NON_NEGATIVE_COLS.get(name, []):
+        flag("negative_value", df[col] < 0)
+
+    for col in PERCENT_COLS.get(name, []):
+        flag("percent_out_of_range", (df[col] < 0) | (df[col] > 100))
+
     if name == "invoices":
-        bad = df[(df["quantity"] < 0) | (df["unit_price"] < 0)]
-        if not bad.empty:
-            logging.warning(f"invoices: {len(bad)} rows with negative values")
+        expected = df["quantity"] * df["unit_price"] * (1 - df["discount_pct"] / 100)
+        tolerance = BILLED_ABS_TOLERANCE + BILLED_UNIT_TOLERANCE * df["quantity"].abs()
+        flag("billed_mismatch", (df["billed_amount"] - expected).abs() > tolerance)
 
-    if name == "usage":
-        bad = df[df["actual_usage"] < 0]
-        if not bad.empty:
-            logging.warning(f"usage: {len(bad)} rows with negative usage")
+        seen_ids = seen_ids if seen_ids is not None else SeenIds()
+        flag("duplicate_invoice_id", seen_ids.duplicated(df["invoice_id"].astype(str)))
 
-    return df
+    if name == "contracts":
+        flag("contract_dates_inverted", df["contract_end"] < df["contract_start"])
+
+    return df, mask
+
+
+def describe_reasons(mask):
+    """Pipe-joined reason codes for each (non-zero) mask value."""
+    codes = pd.Series("", index=range(len(mask)), dtype=object)
+    for reason, bit in REASON_BITS.items():
+        hit = (mask & bit) != 0
+        codes[hit] = codes[hit] + np.where(codes[hit] == "", "", "|") + reason
+    return codes.to_numpy()
+
+
+def load_and_validate(name, chunk_size=CHUNK_SIZE, raw_path=RAW_DATA_PATH):
+    """
+    Clean rows of one raw table, plus its quarantined rows (original
+    values, `source_row`, `reason_mask`, `reason_codes`).
+    """
+    clean, quarantined = [], []
+    seen_ids = SeenIds() if name == "invoices" else None
+    offset = 0
+
+    for chunk in read_chunks(name, chunk_size, raw_path):
+        if offset == 0:
+            validate_schema(chunk, name)
+        parsed, mask = row_checks(chunk, name, seen_ids)
+        bad = mask != 0
+
+        clean.append(parsed[~bad])
+        if bad.any():
+            q = chunk[bad].copy()
+            q.insert(0, "source_row", np.arange(offset, offset + len(chunk))[bad])
+            q["reason_mask"] = mask[bad]
+            q["reason_codes"] = describe_reasons(mask[bad])
+            quarantined.append(q)
+        offset += len(chunk)
+
+    if clean:
+        clean = pd.concat(clean, ignore_index=True)
+    else:
+        # empty file: no rows, but the same columns and dtypes as a loaded table
+        logging.warning(f"{name}: empty file, no rows loaded")
+        clean = row_checks(pd.DataFrame(columns=REQUIRED_SCHEMAS[name]), name)[0]
+    quarantined = pd.concat(quarantined, ignore_index=True) if quarantined else None
+    return clean, quarantined
+
+
+def write_quarantine(name, quarantined):
+    path = QUARANTINE_PATH / f"{name}.csv.gz"
+    if quarantined is None:
+        path.unlink(missing_ok=True)   # no stale rows from an earlier run
+        return None
+    QUARANTINE_PATH.mkdir(parents=True, exist_ok=True)
+    quarantined.to_csv(path, index=False, compression="gzip")
+    return path
+
+
+def reason_counts(quarantined):
+    if quarantined is None:
+        return {}
+    mask = quarantined["reason_mask"].to_numpy(dtype=np.uint16)
+    counts = {reason: int(((mask & bit) != 0).sum()) for reason, bit in REASON_BITS.items()}
+    return {reason: n for reason, n in counts.items() if n}
+
+
+def validate_table(name):
+    """Load one table, write its quarantine artifact and log what was held back."""
+    df, quarantined = load_and_validate(name)
+    path = write_quarantine(name, quarantined)
+    if path is not None:
+        logging.warning(
+            f"{name}: {len(quarantined)} rows quarantined → {path} {reason_counts(quarantined)}"
+        )
+    return df, quarantined, path
 
 
 def load_and_validate_all():
+    configure_logging()
     data = {}
 
     for name in ["invoices", "contracts", "usage", "pricing"]:
-        df = load_csv(name)
-        df = validate_schema(df, name)
-        df = validate_values(df, name)
-        data[name] = df
+        data[name], _, _ = validate_table(name)
 
     return data
+
+
+def main():
+    configure_logging()
+    for name in ["invoices", "contracts", "usage", "pricing"]:
+        df, quarantined, path = validate_table(name)
+        n_bad = 0 if quarantined is None else len(quarantined)
+        print(f"{name}: {len(df)} clean rows, {n_bad} quarantined {reason_counts(quarantined) or ''}".rstrip())
+        if path is not None:
+            print(f"  Quarantine → {path}")
+    print(f"Warnings (if any) logged → {LOG_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,30 @@
-import pandas as pd
 from pathlib import Path
-from load_validate import load_and_validate_all
+
+from src.data.load_validate import load_and_validate_all
+from src.data.reference_tables import ReferenceTables
+from src.data.schema import UNIFIED_DATES, UNIFIED_SCHEMA, apply_schema
 
 OUTPUT_PATH = Path("data/processed")
-OUTPUT_PATH.mkdir(exist_ok=True)
 
 def merge_all():
     data = load_and_validate_all()
 
     invoices = data["invoices"]
-    contracts = data["contracts"]
-    usage = data["usage"]
-    pricing = data["pricing"]
 
     # ---------------- MERGES ----------------
-
-    # Invoice ↔ Contract
-    df = invoices.merge(
-        contracts,
-        on=["customer_id", "product_id"],
-        how="left",
-        suffixes=("", "_contract")
-    )
-
-    df["off_contract"] = df["contract_price"].isna()
-
-    # Invoice ↔ Usage
-    df = df.merge(
-        usage,
-        on=["customer_id", "product_id"],
-        how="left",
-        suffixes=("", "_usage")
+    # Invoice ↔ Contract (valid on invoice_date), Usage (fan-out), Pricing
+    # via keyed array lookups instead of three pandas merges
+    refs = ReferenceTables(
+        contracts=data["contracts"],
+        pricing=data["pricing"],
+        usage=data["usage"],
     )
-
-    df["usage_missing"] = df["actual_usage"].isna()
-
-    # Invoice ↔ Pricing
-    df = df.merge(
-        pricing,
-        on="product_id",
-        how="left"
-    )
-
-    df["pricing_missing"] = df["list_price"].isna()
+    df = refs.unify(invoices)
 
     # ---------------- FINAL CLEAN ----------------
-    df["invoice_date"] = pd.to_datetime(df["invoice_date"], errors="coerce")
-    df["usage_date"] = pd.to_datetime(df["usage_date"], errors="coerce")
+    df = apply_schema(df, UNIFIED_SCHEMA, UNIFIED_DATES)
 
+    OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
     df.to_csv(OUTPUT_PATH / "billing_unified.csv", index=False)
     print("Unified dataset saved → data/processed/billing_unified.csv")
 
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data.load_validate import load_and_validate
+
+# ---------------- PATHS ----------------
+RAW_DATA_PATH = Path("data/raw")
+
+
+class ReferenceTables:
+    """
+    Contracts, pricing and usage loaded once into sorted, array-backed
+    tables keyed by integer (customer, product) codes.
+
+    Lookups are vectorized: IDs are hashed to codes with pandas Index
+    lookups, key ranges are found with np.searchsorted. Used by the batch
+    merge (merge_tables), Level 4 validation and online scoring, instead of
+    repeating large pandas merges.
+    """
+
+    def __init__(self, contracts: pd.DataFrame, pricing: pd.DataFrame, usage: pd.DataFrame):
+        self.customers = pd.Index(
+            pd.unique(pd.concat([contracts["customer_id"], usage["customer_id"]], ignore_index=True))
+        )
+        self.products = pd.Index(
+            pd.unique(pd.concat([pricing["product_id"], contracts["product_id"], usage["product_id"]], ignore_index=True))
+        )
+
+        # ---------------- CONTRACTS (sorted by key, start) ----------------
+        key = self._keys(contracts["customer_id"], contracts["product_id"])
+        start = pd.to_datetime(contracts["contract_start"], errors="coerce").to_numpy("datetime64[D]")
+        end = pd.to_datetime(contracts["contract_end"], errors="coerce").to_numpy("datetime64[D]")
+        order = np.lexsort((start, key))
+
+        self.contract_key = key[order]
+        self.contract_start = start[order]
+        self.contract_end = end[order]
+        self.contract_price = contracts["contract_price"].to_numpy(np.float64)[order]
+        self.max_discount_pct = contracts["max_discount_pct"].to_numpy(np.float64)[order]
+        self.contract_start_raw = contracts["contract_start"].to_numpy(object)[order]
+        self.contract_end_raw = contracts["contract_end"].to_numpy(object)[order]
+        self.max_contracts_per_key = int(np.bincount(np.unique(key, return_inverse=True)[1]).max()) if len(key) else 0
+
+        # ---------------- PRICING (dense by product code) ----------------
+        self.list_price = np.full(len(self.products), np.nan)
+        self.list_price[self.products.get_indexer(pricing["product_id"])] = pricing["list_price"].to_numpy(np.float64)
+
+        # ---------------- USAGE (CSR: sorted by key, original order kept) ----------------
+        ukey = self._keys(usage["customer_id"], usage["product_id"])
+        uorder = np.argsort(ukey, kind="stable")
+        self.usage_key = ukey[uorder]
+        self.usage_date = usage["usage_date"].to_numpy(object)[uorder]
+        self.actual_usage = usage["actual_usage"].to_numpy()[uorder]
+
+        # per-key max usage (segments of the sorted key array are non-empty)
+        self.usage_max_key, seg_start = np.unique(self.usage_key, return_index=True)
+        self.usage_max_value = (
+            np.fmax.reduceat(self.actual_usage, seg_start) if len(seg_start) else np.array([])
+        )
+
+    @classmethod
+    def from_raw(cls, path: Path = RAW_DATA_PATH) -> "ReferenceTables":
+        # same clean rows as Level 1 (quarantined rows never reach lookups)
+        path = Path(path)
+        return cls(
+            contracts=load_and_validate("contracts", raw_path=path)[0],
+            pricing=load_and_validate("pricing", raw_path=path)[0],
+            usage=load_and_validate("usage", raw_path=path)[0],
+        )
+
+    # ---------------- KEYS ----------------
+    @staticmethod
+    def _codes(index: pd.Index, values) -> np.ndarray:
+        values = pd.Series(values) if not isinstance(values, pd.Series) else values
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # hash only the categories, then gather by category code
+            cat_codes = index.get_indexer(values.cat.categories)
+            codes = values.cat.codes.to_numpy()
+            return np.where(codes >= 0, cat_codes[codes], -1)
+        return index.get_indexer(pd.Index(values))
+
+    def _keys(self, customer_ids, product_ids) -> np.ndarray:
+        """int64 key per (customer, product); -1 when either ID is unknown."""
+        c = self._codes(self.customers, customer_ids)
+        p = self._codes(self.products, product_ids)
+        key = c.astype(np.int64) * len(self.products) + p
+        key[(c < 0) | (p < 0)] = -1
+        return key
+
+    # ---------------- LOOKUPS ----------------
+    def contract_rows(self, customer_ids, product_ids, dates=None) -> np.ndarray:
+        """
+        Index of the matching contract row per query (-1 = no contract).
+        With `dates`, only contracts with start <= date <= end match
+        (earliest valid start wins); without, the first contract for the key.
+        """
+        key = self._keys(customer_ids, product_ids)
+        lo = np.searchsorted(self.contract_key, key, side="left")
+        hi = np.searchsorted(self.contract_key, key, side="right")
+        hi[key < 0] = lo[key < 0]
+
+        if dates is None:
+            return np.where(hi > lo, lo, -1)
+
+        d = pd.to_datetime(pd.Series(dates), errors="coerce").to_numpy("datetime64[D]")
+        found = np.full(len(key), -1, dtype=np.int64)
+        for k in range(self.max_contracts_per_key):
+            cand = lo + k
+            has = (cand < hi) & (found < 0)
+            if not has.any():
+                break
+            c = np.where(has, cand, 0)
+            ok = has & (self.contract_start[c] <= d) & (d <= self.contract_end[c])
+            found[ok] = cand[ok]
+        return found
+
+    def lookup_contracts(self, customer_ids, product_ids, dates=None) -> pd.DataFrame:
+        rows = self.contract_rows(customer_ids, product_ids, dates)
+        hit = rows >= 0
+        r = np.where(hit, rows, 0)
+
+        def _take(arr, fill):
+            out = arr[r] if len(arr) else np.full(len(rows), fill, dtype=object)
+            return np.where(hit, out, fill)
+
+        return pd.DataFrame({
+            "contract_price": _take(self.contract_price, np.nan).astype(np.float64),
+            "max_discount_pct": _take(self.max_discount_pct, np.nan).astype(np.float64),
+            "contract_start": _take(self.contract_start_raw, np.nan),
+            "contract_end": _take(self.contract_end_raw, np.nan),
+            "off_contract": ~hit,
+        })
+
+    def lookup_list_price(self, product_ids) -> np.ndarray:
+        p = self._codes(self.products, product_ids)
+        return np.where(p >= 0, self.list_price[np.maximum(p, 0)], np.nan)
+
+    def usage_ranges(self, customer_ids, product_ids) -> tuple[np.ndarray, np.ndarray]:
+        key = self._keys(customer_ids, product_ids)
+        lo = np.searchsorted(self.usage_key, key, side="left")
+        hi = np.searchsorted(self.usage_key, key, side="right")
+        hi[key < 0] = lo[key < 0]
+        return lo, hi
+
+    def usage_max(self, customer_ids, product_ids) -> np.ndarray:
+        """Largest actual_usage recorded for each (customer, product); NaN if none."""
+        key = self._keys(customer_ids, product_ids)
+        if len(self.usage_max_key) == 0:
+            return np.full(len(key), np.nan)
+        pos = np.minimum(np.searchsorted(self.usage_max_key, key), len(self.usage_max_key) - 1)
+        hit = (key >= 0) & (self.usage_max_key[pos] == key)
+        return np.where(hit, self.usage_max_value[pos], np.nan)
+
+    # ---------------- UNIFY (invoice rows fanned out over usage) ----------------
+    def unify(self, invoices: pd.DataFrame, contract_dates: bool = True) -> pd.DataFrame:
+        """
+        Same rows and columns as the Level 1 merge: one row per
+        (invoice, usage record for its customer/product), or one row with
+        missing usage. Contracts only match when valid on invoice_date
+        unless `contract_dates` is False.
+        """
+        cust = invoices["customer_id"].to_numpy()
+        prod = invoices["product_id"].to_numpy()
+        dates = invoices["invoice_date"] if contract_dates else None
+
+        contracts = self.lookup_contracts(cust, prod, dates)
+        list_price = self.lookup_list_price(prod)
+
+        lo, hi = self.usage_ranges(cust, prod)
+        counts = hi - lo
+        reps = np.maximum(counts, 1)
+
+        inv_idx = np.repeat(np.arange(len(invoices)), reps)
+        within = np.arange(len(inv_idx)) - np.repeat(np.cumsum(reps) - reps, reps)
+        has_usage = np.repeat(counts > 0, reps)
+        u = np.where(has_usage, np.repeat(lo, reps) + within, 0)
+
+        df = invoices.iloc[inv_idx].reset_index(drop=True)
+        for col in contracts.columns:
+            df[col] = contracts[col].to_numpy()[inv_idx]
+
+        if len(self.actual_usage):
+            df["usage_date"] = np.where(has_usage, self.usage_date[u], None)
+            usage_vals = self.actual_usage[u]
+            # keep the source dtype when nothing is missing (as a pandas merge would)
+            df["actual_usage"] = usage_vals if has_usage.all() else np.where(has_usage, usage_vals, np.nan)
+        else:
+            df["usage_date"] = None
+            df["actual_usage"] = np.nan
+        df["usage_missing"] = ~has_usage
+
+        df["list_price"] = list_price[inv_idx]
+        df["pricing_missing"] = np.isnan(df["list_price"].to_numpy())
+        return df
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ---------------- DTYPE PLAN ----------------
+# IDs -> category, 0/1 flags -> int8, calendar -> small ints,
+# money, ratios and quantities -> float32 (quantities can be fractional,
+# e.g. metered usage; an int cast would truncate 12.5 to 12).
+# Dates are parsed separately.
+ID_COLS = ["invoice_id", "customer_id", "product_id"]
+
+UNIFIED_SCHEMA = {
+    "invoice_id": "category",
+    "customer_id": "category",
+    "product_id": "category",
+    "quantity": "float32",
+    "unit_price": "float32",
+    "discount_pct": "float32",
+    "billed_amount": "float32",
+    "contract_price": "float32",
+    "max_discount_pct": "float32",
+    "off_contract": "int8",
+    "actual_usage": "float32",      # NaN when usage is missing
+    "usage_missing": "int8",
+    "list_price": "float32",
+    "pricing_missing": "int8",
+}
+UNIFIED_DATES = ["invoice_date", "usage_date", "contract_start", "contract_end"]
+
+FEATURE_SCHEMA = {
+    "invoice_id": "category",
+    "unit_price": "float32",
+    "quantity": "float32",
+    "discount_pct": "float32",
+    "price_gap_contract": "float32",
+    "discount_violation": "int8",
+    "off_contract": "int8",
+    "usage_gap": "float32",
+    "usage_ratio": "float32",
+    "usage_missing": "int8",
+    "cust_avg_unit_price": "float32",
+    "cust_avg_quantity": "float32",
+    "cust_avg_discount": "float32",
+    "unit_price_vs_cust_avg": "float32",
+    "invoice_month": "int8",
+    "invoice_dayofweek": "int8",
+    "invoice_age_days": "int32",
+    "pricing_missing": "int8",
+}
+
+
+def _to_flag(s: pd.Series) -> pd.Series:
+    # flags may arrive as bools, "True"/"False" strings or 0/1
+    if s.dtype == object or pd.api.types.is_string_dtype(s):
+        s = s.astype(str).str.strip().str.lower().map({"true": 1, "false": 0, "1": 1, "0": 0})
+    return s.fillna(0).astype(np.int8)
+
+
+def apply_schema(df: pd.DataFrame, schema: dict, dates: list[str] | None = None) -> pd.DataFrame:
+    """
+    Cast columns present in `df` to the planned dtypes (in place; returns df).
+    Integer columns that contain NaN fall back to float32 rather than fail.
+    """
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if dtype == "category":
+            df[col] = s.astype("category")
+        elif dtype == "int8" and not pd.api.types.is_numeric_dtype(s):
+            df[col] = _to_flag(s)
+        elif dtype.startswith("int"):
+            df[col] = s.astype(dtype) if s.notna().all() else s.astype("float32")
+        else:
+            df[col] = s.astype(dtype)
+
+    for col in dates or []:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    return df
+
+
+def _read_dtypes(schema: dict, usecols) -> dict:
+    # IDs and floats can be parsed straight into their dtype; ints/flags
+    # are cast afterwards (older files hold True/False or NaN there)
+    wanted = set(usecols) if usecols is not None else None
+    return {
+        c: t for c, t in schema.items()
+        if (t == "category" or t.startswith("float")) and (wanted is None or c in wanted)
+    }
+
+
+def read_unified(path: Path, usecols: list[str] | None = None) -> pd.DataFrame:
+    df = pd.read_csv(path, usecols=usecols, dtype=_read_dtypes(UNIFIED_SCHEMA, usecols))
+    return apply_schema(df, UNIFIED_SCHEMA, UNIFIED_DATES)
+
+
+def read_features(path: Path, usecols: list[str] | None = None) -> pd.DataFrame:
+    df = pd.read_csv(path, usecols=usecols, dtype=_read_dtypes(FEATURE_SCHEMA, usecols))
+    return apply_schema(df, FEATURE_SCHEMA)
+
+
+def memory_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1e6
@@ -2,23 +2,35 @@ from __future__ import annotations
 
 import argparse
 import os
+from pathlib import Path
 
 import joblib
 import pandas as pd
 
 from .shap_explainer import (
+    SHAP_BATCH_ROWS,
+    SHAP_CACHE_MAX_MB,
+    SHAP_CACHE_PATH,
     prepare_feature_matrix,
-    compute_shap_values_tree,
+    compute_shap_values_batched,
+    model_fingerprint,
     aggregate_invoice_level_shap,
+    invoice_level_vectors,
 )
+from .similar_cases import INDEX_PATH, VECTORS_PATH, build_index, save_case_vectors
 from .prompt_builder import build_rule_violation_summary
 from .llm_agent import generate_explanations, LLMConfig
+from src.features.feature_matrix import load_features
+from src.models import registry
+from src.models.revenue_baseline_xgb import MODEL_NAME as REVENUE_MODEL_NAME
+from src.pipeline.checkpoint import Checkpoint, atomic_to_csv, run_key
+from src.storage.blob_cache import BlobCache
 
 
 DEFAULT_VALIDATED = "data/processed/validated_leakage_cases.csv"
 DEFAULT_BASELINE = "data/processed/revenue_baseline_invoice_level.csv"
 DEFAULT_FEATURES = "data/processed/billing_features.csv"
-DEFAULT_MODEL = "models/revenue_xgb_baseline.joblib"
+DEFAULT_MODEL = None  # latest registered revenue_xgb_baseline
 DEFAULT_OUT = "data/processed/explained_leakage_cases.csv"
 
 
@@ -33,16 +45,27 @@ def main():
     parser.add_argument("--validated", default=DEFAULT_VALIDATED)
     parser.add_argument("--baseline", default=DEFAULT_BASELINE)
     parser.add_argument("--features", default=DEFAULT_FEATURES)
-    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--model", default=DEFAULT_MODEL,
+                        help="Path to a joblib model (default: latest registered XGBoost baseline)")
     parser.add_argument("--out", default=DEFAULT_OUT)
     parser.add_argument("--top_k", type=int, default=5)
+    parser.add_argument("--vectors-out", default=str(VECTORS_PATH),
+                        help="Dense invoice-level SHAP + feature vectors (similar-case retrieval)")
     parser.add_argument("--mode", default="template", choices=["template", "openai"])
+    parser.add_argument("--no-shap-cache", action="store_true", help="Recompute SHAP for every row")
+    parser.add_argument("--shap-cache-mb", type=float, default=SHAP_CACHE_MAX_MB)
+    parser.add_argument("--shap-batch-rows", type=int, default=SHAP_BATCH_ROWS,
+                        help="Rows per checkpointed SHAP batch")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reuse SHAP batches checkpointed by an interrupted run on the same model and features")
     args = parser.parse_args()
 
     # 1) Load core files
     validated = load_csv(args.validated)
     baseline = load_csv(args.baseline)
-    billing_features = load_csv(args.features)
+    if not os.path.exists(args.features):
+        raise FileNotFoundError(f"Missing file: {args.features}")
+    billing_features = load_features(Path(args.features))
 
     # Normalize invoice_id as string
     for df in (validated, baseline, billing_features):
@@ -51,13 +74,28 @@ def main():
         df["invoice_id"] = df["invoice_id"].astype(str)
 
     # 2) Load model
-    if not os.path.exists(args.model):
+    if args.model is None:
+        model = registry.load(REVENUE_MODEL_NAME).model
+    elif not os.path.exists(args.model):
         raise FileNotFoundError(f"Missing model: {args.model}")
-    model = joblib.load(args.model)
+    else:
+        model = joblib.load(args.model)
 
-    # 3) SHAP at row-level -> aggregate to invoice-level
+    # 3) SHAP at row-level (checkpointed batches) -> aggregate to invoice-level
     X, invoice_ids = prepare_feature_matrix(billing_features, model, invoice_id_col="invoice_id")
-    shap_values, _ = compute_shap_values_tree(model, X)
+    checkpoint = Checkpoint(
+        "level6_shap",
+        run_key(model_fingerprint(model), registry.data_fingerprint(X, invoice_ids), args.shap_batch_rows),
+        resume=args.resume,
+    )
+    if args.no_shap_cache:
+        shap_values, _ = compute_shap_values_batched(model, X, invoice_ids, checkpoint, batch_rows=args.shap_batch_rows)
+    else:
+        with BlobCache(SHAP_CACHE_PATH, max_mb=args.shap_cache_mb) as cache:
+            shap_values, _ = compute_shap_values_batched(
+                model, X, invoice_ids, checkpoint, cache, batch_rows=args.shap_batch_rows
+            )
+            print(f"[Level 6] SHAP cache: {cache.hits} invoices reused, {cache.misses} computed")
     shap_invoice = aggregate_invoice_level_shap(
         shap_values=shap_values,
         X=X,
@@ -65,6 +103,12 @@ def main():
         top_k=args.top_k,
     )
 
+    # Dense invoice-level vectors + similar-case index (all invoices, not just flagged ones)
+    invoices, shap_dense, feature_dense = invoice_level_vectors(shap_values, X, invoice_ids)
+    save_case_vectors(invoices, list(X.columns), shap_dense, feature_dense, path=args.vectors_out)
+    index = build_index(args.vectors_out, INDEX_PATH)
+    print(f"[Level 6] Similar-case index: {len(index)} invoices → {INDEX_PATH}")
+
     # 4) Merge invoice-level artifacts
     # Keep only validated leakage invoices if you want — but better to merge and then filter
     merged = baseline.merge(validated, on="invoice_id", how="left").merge(shap_invoice, on="invoice_id", how="left")
@@ -85,7 +129,8 @@ def main():
     if out_dir:
         os.makedirs(out_dir, exist_ok=True)
 
-    merged.to_csv(args.out, index=False)
+    atomic_to_csv(merged, args.out, index=False)
+    checkpoint.complete()
     print(f"[Level 6] Wrote: {args.out}")
     print(f"[Level 6] Rows: {len(merged)}")
     print("[Level 6] Sample:")
@@ -1,9 +1,20 @@
 from __future__ import annotations
 
+import hashlib
+from pathlib import Path
+from typing import Optional
+
 import numpy as np
 import pandas as pd
 import xgboost as xgb
 
+from src.pipeline.checkpoint import Checkpoint, atomic_write
+from src.storage.blob_cache import BlobCache, cached_rows, hash_groups
+
+SHAP_CACHE_PATH = Path("data/cache/shap_cache.sqlite")
+SHAP_CACHE_MAX_MB = 512
+SHAP_BATCH_ROWS = 200_000   # rows per checkpointed SHAP batch (cut at invoice boundaries)
+
 
 def _get_model_feature_names(model) -> list[str] | None:
     if hasattr(model, "feature_names_in_"):
@@ -27,12 +38,15 @@ def prepare_feature_matrix(
         raise ValueError(f"Missing '{invoice_id_col}'")
 
     invoice_ids = billing_features_df[invoice_id_col].astype(str)
-    X = billing_features_df.drop(columns=[invoice_id_col]).copy()
+    X = billing_features_df.drop(columns=[invoice_id_col])
 
+    # numeric columns (all of them for the memory-mapped matrix) are used as-is, not copied
     for c in X.columns:
-        X[c] = pd.to_numeric(X[c], errors="coerce")
+        if not pd.api.types.is_numeric_dtype(X[c]):
+            X[c] = pd.to_numeric(X[c], errors="coerce")
 
-    X = X.fillna(0.0)
+    if X.isna().any().any():
+        X = X.fillna(0.0)
 
     model_features = _get_model_feature_names(model)
     if model_features is not None:
@@ -64,6 +78,113 @@ def compute_shap_values_tree(model, X: pd.DataFrame):
     return np.asarray(shap_values), None
 
 
+def model_fingerprint(model) -> str:
+    """Hash of the serialized booster: changes whenever the trees change."""
+    raw = model.get_booster().save_raw(raw_format="ubj")
+    return hashlib.sha1(bytes(raw)).hexdigest()[:16]
+
+
+def compute_shap_values_cached(
+    model,
+    X: pd.DataFrame,
+    invoice_ids: pd.Series,
+    cache: BlobCache,
+):
+    """
+    Same result as compute_shap_values_tree, but contributions are stored
+    per invoice under (model fingerprint, hash of the invoice's feature
+    rows). Only invoices not seen with this model go through pred_contribs.
+    """
+    keys = hash_groups(X, invoice_ids, salt=model_fingerprint(model))
+
+    def compute(miss_rows):
+        shap_values, _ = compute_shap_values_tree(model, X[miss_rows])
+        return shap_values
+
+    shap_values = cached_rows(cache, keys, invoice_ids, compute, n_cols=X.shape[1], dtype=np.float32)
+    return shap_values, None
+
+
+def invoice_batches(invoice_ids: pd.Series, batch_rows: int = SHAP_BATCH_ROWS) -> list[tuple[int, int]]:
+    """
+    (start, stop) row ranges of about `batch_rows` rows, each cut where the
+    invoice changes, so an invoice's rows (and its SHAP cache key) stay in
+    one batch.
+    """
+    n = len(invoice_ids)
+    if n == 0:
+        return []
+    codes = pd.factorize(invoice_ids)[0]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    cuts = np.unique(starts[np.minimum(np.searchsorted(starts, np.arange(0, n, batch_rows)), len(starts) - 1)])
+    bounds = [*cuts.tolist(), n]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def compute_shap_values_batched(
+    model,
+    X: pd.DataFrame,
+    invoice_ids: pd.Series,
+    checkpoint: Checkpoint,
+    cache: Optional[BlobCache] = None,
+    batch_rows: int = SHAP_BATCH_ROWS,
+):
+    """
+    compute_shap_values_tree / _cached over invoice-aligned row batches.
+    Each finished batch is saved as an .npy checkpoint (and the cache is
+    committed), so a resumed run loads finished batches and only computes
+    the rest. Contributions are per row, so the result equals one big call.
+    """
+    shap_values = np.empty(X.shape, dtype=np.float32)
+    batches = invoice_batches(invoice_ids, batch_rows)
+    for i, (start, stop) in enumerate(batches):
+        unit = f"shap-{i:05d}"
+        path = checkpoint.path(f"{unit}.npy")
+        if checkpoint.is_done(unit):
+            shap_values[start:stop] = np.load(path)
+            continue
+
+        X_batch = X.iloc[start:stop]
+        if cache is None:
+            values, _ = compute_shap_values_tree(model, X_batch)
+        else:
+            values, _ = compute_shap_values_cached(model, X_batch, invoice_ids.iloc[start:stop], cache)
+            cache.commit()
+        shap_values[start:stop] = values
+
+        def write(tmp, values=values):
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(values, dtype=np.float32))
+
+        atomic_write(path, write)
+        checkpoint.mark_done(unit, rows=[start, stop])
+        print(f"[SHAP] batch {i + 1}/{len(batches)}: rows {start}-{stop} done")
+
+    return shap_values, None
+
+
+def invoice_level_vectors(
+    shap_values: np.ndarray,
+    X: pd.DataFrame,
+    invoice_ids: pd.Series,
+) -> tuple[pd.Index, np.ndarray, np.ndarray]:
+    """Dense per-invoice mean SHAP and mean feature vectors (rows in invoice order)."""
+    if shap_values.shape[0] != X.shape[0]:
+        raise ValueError("Row mismatch between SHAP and features")
+
+    codes, invoices = pd.factorize(invoice_ids, sort=True)
+    counts = np.bincount(codes, minlength=len(invoices))[:, None]
+
+    def means(values: np.ndarray) -> np.ndarray:
+        sums = np.column_stack([
+            np.bincount(codes, weights=values[:, j], minlength=len(invoices))
+            for j in range(values.shape[1])
+        ])
+        return (sums / counts).astype(np.float32)
+
+    return invoices, means(np.asarray(shap_values, dtype=np.float64)), means(X.to_numpy(dtype=np.float64))
+
+
 def aggregate_invoice_level_shap(
     shap_values: np.ndarray,
     X: pd.DataFrame,
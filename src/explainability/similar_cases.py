@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.storage import case_db
+
+# ---------------- PATHS ----------------
+VECTORS_PATH = Path("data/processed/case_vectors.npz")       # written by Level 6
+INDEX_PATH = Path("data/processed/similar_cases_index.npz")
+
+# ---------------- CONFIG ----------------
+EXACT_MAX_CASES = 50_000   # brute force up to this many cases, inverted lists beyond
+N_PROBE = 8                # lists searched per query (approximate index)
+KMEANS_SAMPLE = 100_000
+KMEANS_ITERS = 20
+SEED = 42
+
+RESULT_COLUMNS = [
+    "invoice_id",
+    "customer_id",
+    "product_id",
+    "invoice_date",
+    "billed_amount",
+    "leakage_baseline",
+    "validated_leakage",
+    "leakage_pattern",
+    "top_shap_features",
+    *case_db.RULE_FLAGS,
+]
+
+
+# ---------------- VECTORS ----------------
+def save_case_vectors(
+    invoice_ids,
+    feature_names: list[str],
+    shap: np.ndarray,
+    features: np.ndarray,
+    path: Path = VECTORS_PATH,
+) -> Path:
+    """Dense invoice-level SHAP + feature vectors (one row per invoice)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(
+        path,
+        invoice_ids=np.asarray(invoice_ids, dtype=str),
+        feature_names=np.asarray(feature_names, dtype=str),
+        shap=np.asarray(shap, dtype=np.float32),
+        features=np.asarray(features, dtype=np.float32),
+    )
+    return path
+
+
+def _standardize(block: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    mean = block.mean(axis=0)
+    scale = block.std(axis=0)
+    scale = np.where(scale > 0, scale, 1.0)
+    # each block contributes equally to the distance regardless of its width
+    scale = scale * np.sqrt(block.shape[1])
+    return (block - mean) / scale, mean, scale
+
+
+# ---------------- INDEX ----------------
+class SimilarCaseIndex:
+    """
+    Nearest-neighbour index over standardized [SHAP | feature] vectors.
+
+    Up to EXACT_MAX_CASES cases every query is a brute-force scan (one
+    matrix-vector product). Larger sets are split into k-means lists and a
+    query only scans the N_PROBE lists whose centroids are closest.
+    """
+
+    def __init__(self, invoice_ids, vectors, mean, scale, centroids=None, order=None, offsets=None):
+        self.invoice_ids = np.asarray(invoice_ids)
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self._positions = pd.Index(self.invoice_ids)
+
+    @property
+    def exact(self) -> bool:
+        return self.centroids is None
+
+    def __len__(self) -> int:
+        return len(self.invoice_ids)
+
+    @classmethod
+    def build(cls, vectors_path: Path = VECTORS_PATH, exact_max: int = EXACT_MAX_CASES) -> "SimilarCaseIndex":
+        data = np.load(vectors_path)
+        shap, shap_mean, shap_scale = _standardize(data["shap"].astype(np.float64))
+        feats, feat_mean, feat_scale = _standardize(data["features"].astype(np.float64))
+        vectors = np.hstack([shap, feats]).astype(np.float32)
+        mean = np.concatenate([shap_mean, feat_mean])
+        scale = np.concatenate([shap_scale, feat_scale])
+
+        if len(vectors) <= exact_max:
+            return cls(data["invoice_ids"], vectors, mean, scale)
+
+        centroids = _kmeans(vectors, n_lists=int(np.sqrt(len(vectors))))
+        assign = _nearest_centroid(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        return cls(data["invoice_ids"], vectors, mean, scale, centroids, order, offsets)
+
+    def save(self, path: Path = INDEX_PATH) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        extra = {} if self.exact else {
+            "centroids": self.centroids, "order": self.order, "offsets": self.offsets,
+        }
+        np.savez(path, invoice_ids=self.invoice_ids, vectors=self.vectors,
+                 mean=self.mean, scale=self.scale, **extra)
+        return path
+
+    @classmethod
+    def load(cls, path: Path = INDEX_PATH) -> "SimilarCaseIndex":
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Missing similar-case index: {path} (run Level 6 first)")
+        data = np.load(path)
+        return cls(
+            data["invoice_ids"], data["vectors"], data["mean"], data["scale"],
+            *(data[k] if k in data else None for k in ("centroids", "order", "offsets")),
+        )
+
+    # ---------------- SEARCH ----------------
+    def transform(self, shap: np.ndarray, features: np.ndarray) -> np.ndarray:
+        """Raw invoice-level SHAP + feature vectors -> index space (e.g. for a new invoice)."""
+        raw = np.hstack([np.atleast_2d(shap), np.atleast_2d(features)])
+        return ((raw - self.mean) / self.scale).astype(np.float32)
+
+    def _candidates(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        if self.exact:
+            return np.arange(len(self))
+        d = np.einsum("ij,ij->i", self.centroids, self.centroids) - 2 * self.centroids @ query
+        lists = np.argsort(d)[:n_probe]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+
+    def search(self, query: np.ndarray, k: int = 5, n_probe: int = N_PROBE, exclude=None):
+        """(positions, distances) of the k nearest cases to one index-space vector."""
+        rows = self._candidates(query, n_probe)
+        dist = self.norms[rows] - 2 * (self.vectors[rows] @ query) + query @ query
+        if exclude is not None:
+            dist = np.where(rows == exclude, np.inf, dist)
+
+        top = np.argpartition(dist, k)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(dist[top])]
+        top = top[np.isfinite(dist[top])]
+        return rows[top], np.sqrt(np.maximum(dist[top], 0.0))
+
+    def neighbours(self, invoice_id: str, k: int = 5, n_probe: int = N_PROBE) -> pd.DataFrame:
+        pos = self._positions.get_indexer([str(invoice_id)])[0]
+        if pos < 0:
+            raise KeyError(f"Invoice not in similar-case index: {invoice_id}")
+        rows, dist = self.search(self.vectors[pos], k=k, n_probe=n_probe, exclude=pos)
+        return pd.DataFrame({"invoice_id": self.invoice_ids[rows].astype(str), "distance": dist})
+
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    c_norms = np.einsum("ij,ij->i", centroids, centroids)
+    return np.argmin(c_norms[None, :] - 2 * vectors @ centroids.T, axis=1)
+
+
+def _kmeans(vectors: np.ndarray, n_lists: int) -> np.ndarray:
+    rng = np.random.default_rng(SEED)
+    sample = vectors[rng.choice(len(vectors), size=min(KMEANS_SAMPLE, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERS):
+        assign = _nearest_centroid(sample, centroids)
+        counts = np.bincount(assign, minlength=n_lists)
+        for j in range(vectors.shape[1]):
+            sums = np.bincount(assign, weights=sample[:, j], minlength=n_lists)
+            centroids[:, j] = np.where(counts > 0, sums / np.maximum(counts, 1), centroids[:, j])
+    return centroids
+
+
+# ---------------- QUERY API ----------------
+def similar_cases(
+    invoice_id: str,
+    k: int = 5,
+    index: Optional[SimilarCaseIndex] = None,
+    con=None,
+) -> pd.DataFrame:
+    """
+    The k most similar historical cases to `invoice_id`, nearest first,
+    with their patterns and outcomes from the case database when available.
+    """
+    index = index or SimilarCaseIndex.load()
+    hits = index.neighbours(invoice_id, k=k)
+
+    if con is None and case_db.DB_PATH.exists():
+        con = case_db.connect()
+    if con is None:
+        return hits
+
+    cases = case_db.query_cases(con, columns=RESULT_COLUMNS, invoice_ids=hits["invoice_id"].tolist(), limit=len(hits))
+    return hits.merge(cases, on="invoice_id", how="left")
+
+
+def build_index(vectors_path: Path = VECTORS_PATH, out: Path = INDEX_PATH) -> SimilarCaseIndex:
+    index = SimilarCaseIndex.build(vectors_path)
+    index.save(out)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar-case retrieval over SHAP + feature vectors")
+    parser.add_argument("--build", action="store_true", help=f"Rebuild {INDEX_PATH} from {VECTORS_PATH}")
+    parser.add_argument("--invoice", help="Invoice ID to find similar cases for")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.build:
+        index = build_index()
+        kind = "exact" if index.exact else f"approximate, {len(index.centroids)} lists"
+        print(f"[Similar] Indexed {len(index)} invoices ({kind}) → {INDEX_PATH}")
+
+    if args.invoice:
+        index = SimilarCaseIndex.load()
+        started = time.perf_counter()
+        result = similar_cases(args.invoice, k=args.k, index=index)
+        print(result.to_string(index=False))
+        print(f"[Similar] Query took {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
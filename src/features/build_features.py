@@ -1,13 +1,69 @@
+import argparse
+import hashlib
+
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+from src.data import schema
+from src.data.schema import FEATURE_SCHEMA, apply_schema, read_unified
+from src.features.feature_matrix import MATRIX_PATH, write_feature_matrix
+from src.storage.blob_cache import BlobCache, cached_rows, hash_groups
+
 INPUT_PATH = Path("data/processed/billing_unified.csv")
 OUTPUT_PATH = Path("data/processed/billing_features.csv")
+BASELINES_PATH = Path("data/processed/customer_baselines.csv")
+CACHE_PATH = Path("data/cache/feature_cache.sqlite")
+
+# ----------------------------
+# FINAL FEATURE SET
+# ----------------------------
+FEATURE_COLS = [
+    # Raw
+    "unit_price", "quantity", "discount_pct",
+
+    # Contract
+    "price_gap_contract", "discount_violation", "off_contract",
+
+    # Usage
+    "usage_gap", "usage_ratio", "usage_missing",
+
+    # Customer baselines
+    "cust_avg_unit_price", "cust_avg_quantity",
+    "cust_avg_discount", "unit_price_vs_cust_avg",
+
+    # Time
+    "invoice_month", "invoice_dayofweek", "invoice_age_days",
+
+    # Pricing
+    "pricing_missing"
+]
 
+BASELINE_COLS = ["cust_avg_unit_price", "cust_avg_quantity", "cust_avg_discount"]
 
-def build_features():
-    df = pd.read_csv(INPUT_PATH)
+# ----------------------------
+# BASELINE CONFIG
+# ----------------------------
+# "static"    -> all-time mean over every row (legacy; includes the future)
+# "expanding" -> mean of the customer's invoices on earlier days
+# "rolling"   -> same, limited to the trailing ROLLING_WINDOW
+# "ewm"       -> exponentially weighted, EWM_HALFLIFE half-life in days
+BASELINE_MODES = ["static", "expanding", "rolling", "ewm"]
+BASELINE_MODE = "expanding"
+ROLLING_WINDOW = "90D"
+EWM_HALFLIFE = "30D"
 
+# ----------------------------
+# FEATURE CACHE
+# ----------------------------
+CACHE_MAX_MB = 512
+# everything except invoice_age_days, which depends on the reference date
+CACHED_COLS = [c for c in FEATURE_COLS if c != "invoice_age_days"]
+
+_VALUE_COLS = {"unit_price": "cust_avg_unit_price", "quantity": "cust_avg_quantity", "discount_pct": "cust_avg_discount"}
+
+
+def _clean(df):
     # ----------------------------
     # BASIC CLEANUP
     # ----------------------------
@@ -19,6 +75,149 @@ def build_features():
     # ----------------------------
     df["quantity"] = df["quantity"].fillna(0)
     df["discount_pct"] = df["discount_pct"].fillna(0)
+    return df
+
+
+def _invoice_values(df):
+    # one row per invoice: price/quantity/discount do not vary across usage rows
+    inv = df.drop_duplicates("invoice_id")[["invoice_id", "customer_id", "invoice_date"] + list(_VALUE_COLS)].copy()
+    inv["day"] = inv["invoice_date"].dt.normalize()
+    return inv
+
+
+def compute_asof_baselines(df, mode=BASELINE_MODE, window=ROLLING_WINDOW, halflife=EWM_HALFLIFE):
+    """
+    Per-invoice customer baselines using only the customer's invoices on
+    strictly earlier days (same-day invoices never see each other).
+
+    One pass over invoices sorted by (customer, day): daily sums/counts are
+    accumulated per customer, then shifted so each day sees only its past.
+    Sorting dominates, so the cost is O(n log n) regardless of history length.
+    Invoices without history get NaN (filled by the caller).
+    """
+    if mode not in ("expanding", "rolling", "ewm"):
+        raise ValueError(f"Not an as-of baseline mode: {mode}")
+
+    inv = _invoice_values(df)
+    sum_cols = list(_VALUE_COLS) + ["n"]
+
+    daily = (
+        inv.assign(n=1)
+        .groupby(["customer_id", "day"], observed=True, sort=True)[sum_cols]
+        .sum()
+        .reset_index()
+    )
+    daily["customer_id"] = daily["customer_id"].astype(str)
+    by_cust = daily.groupby("customer_id", sort=False)
+
+    if mode == "expanding":
+        prior = by_cust[sum_cols].cumsum() - daily[sum_cols]
+
+    elif mode == "rolling":
+        # time-based window [day - window, day) over earlier days only
+        prior = (
+            daily.set_index("day")
+            .groupby("customer_id", sort=False)[sum_cols]
+            .rolling(window, closed="left")
+            .sum()
+            .reset_index(drop=True)
+            .fillna(0.0)
+        )
+
+    else:
+        # weights 0.5 ** ((t - d) / h) over earlier days d. pandas' time-aware
+        # EWM decays recursively (w_t = 0.5 ** (gap / h) * w_{t-1} + 1), so
+        # long gaps never overflow or cancel. The baseline is the decayed sum
+        # over the decayed count; normalizing both the same way leaves that
+        # ratio unchanged, so per-day EWM means of the daily sums and of `n`
+        # give it. A day's row covers days <= it, and the customer's previous
+        # day row covers exactly the days before.
+        decayed = (
+            daily.set_index("day")
+            .groupby("customer_id", sort=False)[sum_cols]
+            .ewm(halflife=halflife, times=daily["day"].to_numpy())
+            .mean()
+            .reset_index(drop=True)
+        )
+        prior = decayed.groupby(daily["customer_id"].to_numpy(), sort=False).shift(1).fillna(0.0)
+
+    n = prior["n"].to_numpy()
+    means = pd.DataFrame({
+        "customer_id": daily["customer_id"],
+        "day": daily["day"],
+    })
+    for col, out in _VALUE_COLS.items():
+        means[out] = np.where(n > 0, prior[col].to_numpy() / np.where(n > 0, n, 1), np.nan)
+
+    inv["customer_id"] = inv["customer_id"].astype(str)
+    out = inv[["invoice_id", "customer_id", "day"]].merge(means, on=["customer_id", "day"], how="left")
+    return out[["invoice_id"] + BASELINE_COLS]
+
+
+def compute_customer_baselines(df, mode="static", as_of=None, window=ROLLING_WINDOW, halflife=EWM_HALFLIFE):
+    """
+    Per-customer averages (one row per customer_id), e.g. to score new
+    invoices online. Every mode averages invoices, not usage rows: "static"
+    is the all-time mean over each customer's invoices; the as-of modes
+    summarize the invoices up to `as_of` the same way compute_asof_baselines
+    does. Expects the cleaned unified rows.
+    """
+    inv = _invoice_values(df)
+    if mode == "static":
+        means = inv.groupby(inv["customer_id"].astype(str))[list(_VALUE_COLS)].mean()
+        return means.rename(columns=_VALUE_COLS).rename_axis("customer_id").reset_index()
+
+    as_of = pd.Timestamp(as_of) if as_of is not None else inv["day"].max()
+    inv = inv[inv["day"] <= as_of]
+
+    if mode == "rolling":
+        inv = inv[inv["day"] > as_of - pd.Timedelta(window)]
+        weights = np.ones(len(inv))
+    elif mode == "ewm":
+        age = (as_of - inv["day"]) / pd.Timedelta(halflife)
+        weights = np.power(0.5, age.to_numpy(dtype=np.float64))
+    else:
+        weights = np.ones(len(inv))
+
+    weighted = inv[list(_VALUE_COLS)].mul(weights, axis=0)
+    weighted["w"] = weights
+    sums = weighted.groupby(inv["customer_id"].astype(str)).sum()
+
+    out = pd.DataFrame({"customer_id": sums.index})
+    for col, name in _VALUE_COLS.items():
+        out[name] = (sums[col] / sums["w"]).to_numpy()
+    return out
+
+
+def _resolve_baselines(df, baseline_mode, window, halflife):
+    # per-customer frame for "static", per-invoice frame for the as-of modes
+    if baseline_mode == "static":
+        return compute_customer_baselines(df)
+    return compute_asof_baselines(df, baseline_mode, window=window, halflife=halflife)
+
+
+def _baseline_key(baselines):
+    return "invoice_id" if "invoice_id" in baselines.columns else "customer_id"
+
+
+def compute_features(
+    df,
+    customer_baselines=None,
+    baseline_mode=BASELINE_MODE,
+    reference_date=None,
+    window=ROLLING_WINDOW,
+    halflife=EWM_HALFLIFE,
+):
+    """
+    Derive every feature column from unified billing rows.
+    If `customer_baselines` is given (per customer_id, e.g. precomputed for
+    online scoring, or per invoice_id), customer averages come from it. Otherwise they are computed from `df`
+    with `baseline_mode`. Invoices without history fall back to their own
+    values.
+    `invoice_age_days` is measured from `reference_date` (default: the
+    latest invoice_date in `df`), so reruns and backfills are reproducible.
+    """
+    df = _clean(df.copy())
 
     # ----------------------------
     # 2. CONTRACT vs BILLED DEVIATION
@@ -28,7 +227,7 @@ def build_features():
 
     df["discount_violation"] = (
         (df["discount_pct"] > df["max_discount_pct"]) &
-        (~df["off_contract"])
+        (~df["off_contract"].astype(bool))
     ).astype(int)
 
     # ----------------------------
@@ -43,20 +242,14 @@ def build_features():
     # ----------------------------
     # 4. CUSTOMER HISTORICAL BASELINES
     # ----------------------------
-    df["cust_avg_unit_price"] = (
-        df.groupby("customer_id")["unit_price"]
-        .transform("mean")
-    )
-
-    df["cust_avg_quantity"] = (
-        df.groupby("customer_id")["quantity"]
-        .transform("mean")
-    )
+    df = df.drop(columns=[c for c in BASELINE_COLS if c in df.columns])
+    if customer_baselines is None:
+        customer_baselines = _resolve_baselines(df, baseline_mode, window, halflife)
+    df = df.merge(customer_baselines, on=_baseline_key(customer_baselines), how="left")
 
-    df["cust_avg_discount"] = (
-        df.groupby("customer_id")["discount_pct"]
-        .transform("mean")
-    )
+    df["cust_avg_unit_price"] = df["cust_avg_unit_price"].fillna(df["unit_price"])
+    df["cust_avg_quantity"] = df["cust_avg_quantity"].fillna(df["quantity"])
+    df["cust_avg_discount"] = df["cust_avg_discount"].fillna(df["discount_pct"])
 
     df["unit_price_vs_cust_avg"] = (
         df["unit_price"] - df["cust_avg_unit_price"]
@@ -68,8 +261,12 @@ def build_features():
     df["invoice_month"] = df["invoice_date"].dt.month
     df["invoice_dayofweek"] = df["invoice_date"].dt.dayofweek
 
+    reference_date = (
+        pd.Timestamp(reference_date) if reference_date is not None
+        else df["invoice_date"].max()
+    )
     df["invoice_age_days"] = (
-        (pd.Timestamp.today() - df["invoice_date"])
+        (reference_date - df["invoice_date"])
         .dt.days
     )
 
@@ -80,36 +277,145 @@ def build_features():
     df["usage_missing"] = df["usage_missing"].astype(int)
     df["pricing_missing"] = df["pricing_missing"].astype(int)
 
-    # ----------------------------
-    # FINAL FEATURE SET
-    # ----------------------------
-    feature_cols = [
-        # Raw
-        "unit_price", "quantity", "discount_pct",
+    return df
 
-        # Contract
-        "price_gap_contract", "discount_violation", "off_contract",
 
-        # Usage
-        "usage_gap", "usage_ratio", "usage_missing",
+def feature_code_version():
+    """Fingerprint of the code that derives features; any edit invalidates cached rows."""
+    digest = hashlib.sha1()
+    for path in [__file__, schema.__file__]:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()[:16]
 
-        # Customer baselines
-        "cust_avg_unit_price", "cust_avg_quantity",
-        "cust_avg_discount", "unit_price_vs_cust_avg",
 
-        # Time
-        "invoice_month", "invoice_dayofweek", "invoice_age_days",
+def compute_features_cached(
+    df,
+    cache,
+    customer_baselines=None,
+    baseline_mode=BASELINE_MODE,
+    reference_date=None,
+    window=ROLLING_WINDOW,
+    halflife=EWM_HALFLIFE,
+):
+    """
+    Same output as compute_features (invoice_id + FEATURE_COLS, schema
+    applied), but invoices whose inputs are unchanged are read from `cache`.
 
-        # Pricing
-        "pricing_missing"
-    ]
+    The key of an invoice hashes its unified rows, the baseline values it
+    resolves to and the feature-code version. Baselines are cheap to
+    recompute and are part of the key, so with as-of baselines old invoices
+    stay cached when newer history arrives; with "static" baselines any new
+    invoice invalidates its customer's rows.
+    """
+    clean = _clean(df.copy())
+    if reference_date is None:
+        reference_date = clean["invoice_date"].max()
+    if customer_baselines is None:
+        customer_baselines = _resolve_baselines(clean, baseline_mode, window, halflife)
 
-    features = df[["invoice_id"] + feature_cols]
+    key_col = _baseline_key(customer_baselines)
+    row_baselines = df[[key_col]].merge(customer_baselines, on=key_col, how="left")[BASELINE_COLS]
+    inputs = pd.concat(
+        [df.drop(columns=[c for c in BASELINE_COLS if c in df.columns]).reset_index(drop=True), row_baselines],
+        axis=1,
+    )
+    keys = hash_groups(inputs, df["invoice_id"], salt=feature_code_version())
+
+    def compute(miss_rows):
+        computed = compute_features(
+            df[miss_rows],
+            customer_baselines=customer_baselines,
+            reference_date=reference_date,
+        )
+        return computed[CACHED_COLS].to_numpy(dtype=np.float64)
+
+    values = cached_rows(cache, keys, df["invoice_id"], compute, n_cols=len(CACHED_COLS))
+
+    features = pd.DataFrame(values, columns=CACHED_COLS)
+    features.insert(0, "invoice_id", df["invoice_id"].to_numpy())
+    features["invoice_age_days"] = (reference_date - clean["invoice_date"]).dt.days.to_numpy()
+    return apply_schema(features[["invoice_id"] + FEATURE_COLS], FEATURE_SCHEMA)
+
+
+def build_features(
+    baseline_mode=BASELINE_MODE,
+    reference_date=None,
+    window=ROLLING_WINDOW,
+    halflife=EWM_HALFLIFE,
+    use_cache=True,
+    cache_max_mb=CACHE_MAX_MB,
+):
+    df = read_unified(INPUT_PATH)
+
+    clean = _clean(df.copy())
+    if baseline_mode == "static":
+        baselines = compute_customer_baselines(clean)
+        feature_baselines = baselines
+    else:
+        # state as of the reference date, for scoring new invoices;
+        # features themselves use per-invoice as-of baselines
+        baselines = compute_customer_baselines(
+            clean,
+            mode=baseline_mode,
+            as_of=reference_date,
+            window=window,
+            halflife=halflife,
+        )
+        feature_baselines = None
+    del clean
+
+    if use_cache:
+        with BlobCache(CACHE_PATH, max_mb=cache_max_mb) as cache:
+            features = compute_features_cached(
+                df,
+                cache,
+                customer_baselines=feature_baselines,
+                baseline_mode=baseline_mode,
+                reference_date=reference_date,
+                window=window,
+                halflife=halflife,
+            )
+            print(f"Feature cache: {cache.hits} invoices reused, {cache.misses} computed ({CACHE_PATH})")
+    else:
+        df = compute_features(
+            df,
+            customer_baselines=feature_baselines,
+            baseline_mode=baseline_mode,
+            reference_date=reference_date,
+            window=window,
+            halflife=halflife,
+        )
+        features = apply_schema(df[["invoice_id"] + FEATURE_COLS].copy(), FEATURE_SCHEMA)
 
     features.to_csv(OUTPUT_PATH, index=False)
     print(f"Feature matrix saved → {OUTPUT_PATH}")
     print(f"Rows: {features.shape[0]}, Features: {features.shape[1] - 1}")
 
+    # Same features as one float32 matrix, memory-mapped by the model stages
+    write_feature_matrix([features], len(features), OUTPUT_PATH)
+    print(f"Memory-mapped feature matrix saved → {MATRIX_PATH}")
+
+    # Reused by online scoring (src/serving/score_invoice.py)
+    baselines.to_csv(BASELINES_PATH, index=False)
+    print(f"Customer baselines saved → {BASELINES_PATH}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Level 2 - Feature Engineering")
+    parser.add_argument("--baseline-mode", default=BASELINE_MODE, choices=BASELINE_MODES)
+    parser.add_argument("--window", default=ROLLING_WINDOW, help="Rolling window, e.g. 90D")
+    parser.add_argument("--halflife", default=EWM_HALFLIFE, help="EWM half-life, e.g. 30D")
+    parser.add_argument("--as-of", default=None,
+                        help="Reference date for invoice_age_days and baselines (default: latest invoice)")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every invoice")
+    parser.add_argument("--cache-mb", type=float, default=CACHE_MAX_MB, help="Feature cache size bound")
+    args = parser.parse_args()
+
+    build_features(
+        args.baseline_mode, args.as_of, args.window, args.halflife,
+        use_cache=not args.no_cache, cache_max_mb=args.cache_mb,
+    )
+
 
 if __name__ == "__main__":
-    build_features()
+    main()
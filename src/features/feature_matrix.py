@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.data.schema import FEATURE_SCHEMA, read_features
+from src.pipeline.checkpoint import atomic_write, file_key
+
+# ---------------- PATHS ----------------
+FEATURES_PATH = Path("data/processed/billing_features.csv")
+# float32 rows x feature columns; next to it (same stem):
+#   .json               manifest: columns, shape, the CSV version it mirrors
+#   .invoice_codes.npy  int32 per row, indexing .invoice_ids.npy (sorted unique IDs)
+MATRIX_PATH = Path("data/processed/billing_features.matrix.npy")
+
+# ---------------- CONFIG ----------------
+FEATURE_COLS = [c for c in FEATURE_SCHEMA if c != "invoice_id"]   # build_features.FEATURE_COLS order
+DTYPE = np.float32
+FILL_VALUE = 0.0   # every model stage fills missing features with 0
+
+
+@dataclass
+class FeatureMatrix:
+    """
+    Level 2 features as one C-contiguous float32 matrix, memory-mapped
+    read-only: processes that open it share the same page-cache copy, and
+    opening it costs no parsing. `invoice_codes[i]` indexes `invoice_ids`
+    for row i.
+    """
+
+    values: np.ndarray
+    columns: list[str]
+    invoice_codes: np.ndarray
+    invoice_ids: np.ndarray
+
+    def __len__(self) -> int:
+        return self.values.shape[0]
+
+    def columns_view(self, columns: list[str]) -> np.ndarray:
+        """Matrix restricted to `columns`: a view when they are adjacent and in order, else one gather."""
+        pos = [self.columns.index(c) for c in columns]
+        if pos == list(range(pos[0], pos[0] + len(pos))):
+            return self.values[:, pos[0]:pos[0] + len(pos)]
+        return self.values[:, pos]
+
+    def invoice_series(self) -> pd.Series:
+        return pd.Series(pd.Categorical.from_codes(self.invoice_codes, categories=self.invoice_ids), name="invoice_id")
+
+    def frame(self, columns: Optional[list[str]] = None) -> pd.DataFrame:
+        """invoice_id + feature columns, the float block backed by the mapped file (no copy for all columns)."""
+        columns = self.columns if columns is None else columns
+        df = pd.DataFrame(self.columns_view(columns), columns=columns, copy=False)
+        df.insert(0, "invoice_id", self.invoice_series())
+        return df
+
+
+# ---------------- WRITE ----------------
+def write_feature_matrix(
+    frames: Iterable[pd.DataFrame],
+    n_rows: int,
+    source: Path = FEATURES_PATH,
+    path: Path = MATRIX_PATH,
+) -> Path:
+    """
+    Stream feature frames (invoice_id + FEATURE_COLS, in CSV row order) into
+    the matrix file, then write the invoice index and, last, the manifest
+    that ties them to `source` (the CSV they mirror). Each file is replaced
+    atomically; a reader checks the manifest, so it never pairs a new CSV
+    with an old matrix.
+    """
+    path = Path(path)
+    ids = []
+
+    def write_values(tmp: Path) -> None:
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=DTYPE, shape=(n_rows, len(FEATURE_COLS)))
+        start = 0
+        for frame in frames:
+            stop = start + len(frame)
+            out[start:stop] = np.nan_to_num(frame[FEATURE_COLS].to_numpy(dtype=DTYPE), nan=FILL_VALUE)
+            ids.append(frame["invoice_id"].astype(str).to_numpy())
+            start = stop
+        if start != n_rows:
+            raise ValueError(f"Expected {n_rows} feature rows, got {start}")
+        out.flush()
+        del out
+
+    atomic_write(path, write_values)
+    codes, invoices = pd.factorize(np.concatenate(ids) if ids else np.array([], dtype=str), sort=True)
+
+    codes_path, ids_path = _index_paths(path)
+    atomic_write(codes_path, lambda tmp: _save_npy(tmp, codes.astype(np.int32)))
+    atomic_write(ids_path, lambda tmp: _save_npy(tmp, np.asarray(invoices, dtype=str)))
+
+    manifest = json.dumps({
+        "columns": FEATURE_COLS,
+        "n_rows": n_rows,
+        "dtype": np.dtype(DTYPE).name,
+        "fill_value": FILL_VALUE,
+        "source": file_key(source),
+        "invoice_codes": codes_path.name,
+        "invoice_ids": ids_path.name,
+    }, indent=1)
+    atomic_write(_manifest_path(path), lambda tmp: tmp.write_text(manifest))
+    return path
+
+
+def write_feature_matrix_parts(parts: list[Path], source: Path = FEATURES_PATH, path: Path = MATRIX_PATH) -> Path:
+    """Same matrix from partition feature CSVs (concatenated in `parts` order), one partition in memory at a time."""
+    n_rows = sum(sum(1 for _ in open(p, "rb")) - 1 for p in parts)
+    return write_feature_matrix((read_features(p) for p in parts), n_rows, source, path)
+
+
+def _save_npy(tmp: Path, array: np.ndarray) -> None:
+    # np.save would append ".npy" to a temp path
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+
+
+def _manifest_path(path: Path) -> Path:
+    return Path(path).with_suffix(".json")
+
+
+def _index_paths(path: Path) -> tuple[Path, Path]:
+    return Path(path).with_suffix(".invoice_codes.npy"), Path(path).with_suffix(".invoice_ids.npy")
+
+
+# ---------------- READ ----------------
+def open_feature_matrix(source: Path = FEATURES_PATH, path: Path = MATRIX_PATH) -> Optional[FeatureMatrix]:
+    """
+    Memory-map the matrix written alongside `source`. None when it is
+    missing or was written for a different version of the CSV.
+    """
+    manifest_path = _manifest_path(path)
+    if not (Path(path).exists() and manifest_path.exists() and Path(source).exists()):
+        return None
+    manifest = json.loads(manifest_path.read_text())
+    if manifest.get("source") != file_key(source):
+        return None
+
+    values = np.load(path, mmap_mode="r")
+    codes_path, ids_path = _index_paths(path)
+    codes = np.load(codes_path, mmap_mode="r")
+    if values.shape != (manifest["n_rows"], len(manifest["columns"])) or len(codes) != values.shape[0]:
+        return None
+    return FeatureMatrix(values, manifest["columns"], codes, np.load(ids_path))
+
+
+def load_features(source: Path = FEATURES_PATH, path: Path = MATRIX_PATH) -> pd.DataFrame:
+    """
+    billing_features as a frame: backed by the memory-mapped matrix when it
+    matches the CSV (float32 columns), else parsed from the CSV.
+    """
+    matrix = open_feature_matrix(source, path)
+    if matrix is None:
+        return read_features(source)
+    return matrix.frame()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Level 2 - build / time the memory-mapped feature matrix")
+    parser.add_argument("--features", default=str(FEATURES_PATH))
+    parser.add_argument("--out", default=str(MATRIX_PATH))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    features = read_features(Path(args.features))
+    csv_s = time.perf_counter() - started
+    write_feature_matrix([features], len(features), Path(args.features), Path(args.out))
+
+    started = time.perf_counter()
+    matrix = open_feature_matrix(Path(args.features), Path(args.out))
+    frame = matrix.frame()
+    mmap_s = time.perf_counter() - started
+    print(f"[Features] Matrix {matrix.values.shape} → {args.out}")
+    print(f"[Features] Load: CSV {csv_s * 1000:.0f} ms, memory-mapped {mmap_s * 1000:.1f} ms ({len(frame)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
+import argparse
+
 import pandas as pd
 from pathlib import Path
-from sklearn.ensemble import IsolationForest
+
 from sklearn.preprocessing import StandardScaler
+from sklearn.utils.validation import has_fit_parameter
+
+from src.features.feature_matrix import load_features
+from src.models import registry
+from src.models.detectors import DETECTORS, detector_name, make_detector, weighted_percentile
+from src.models.training_sample import training_sample
 
 # ---------------- PATHS ----------------
 INPUT_PATH = Path("data/processed/billing_features.csv")
@@ -10,39 +18,69 @@ OUTPUT_PATH = Path("data/processed/billing_anomaly_scores.csv")
 # ---------------- CONFIG ----------------
 RANDOM_STATE = 42
 CONTAMINATION = 0.05   # top 5% most abnormal
-
-def run_anomaly_detection():
-    # Load features
-    df = pd.read_csv(INPUT_PATH)
-
-    invoice_ids = df["invoice_id"]
-
-    # Drop identifier column
-    X = df.drop(columns=["invoice_id"])
-
+DETECTOR = "iforest"   # see src/models/detectors.py (hbos, ecod, robust_z)
+
+
+def model_name(detector=DETECTOR):
+    # one registry entry per detector, so versions of one never shadow another
+    return f"anomaly_{detector}"
+
+
+def load_detector(detector=DETECTOR, version=None):
+    """Registered scaler + `detector` (latest version unless given)."""
+    artifact = registry.load(model_name(detector), version)
+    found = detector_name(artifact.model)
+    if found != detector:
+        raise ValueError(
+            f"{artifact.name} {artifact.version} holds a '{found}' detector, not '{detector}'"
+        )
+    return artifact
+
+
+def fit_detector(X, detector=DETECTOR, sample_weight=None):
+    """
+    `sample_weight` (rows each training row stands for, e.g. from a
+    TrainingSample) weights the scaler's mean/variance and the
+    contamination cut-off (offset_), which is recomputed as a weighted
+    percentile of the training scores. The forest itself is not weighted:
+    IsolationForest draws each tree's subsample uniformly, and its random
+    splits and path lengths ignore the weights sklearn passes on. Detectors
+    whose fit takes no weights are fitted on the rows unweighted, and say so.
+    """
     # Scale features
     scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    X_scaled = scaler.fit(X, sample_weight=sample_weight).transform(X)
 
-    # Isolation Forest
-    iso = IsolationForest(
-        n_estimators=200,
-        contamination=CONTAMINATION,
-        random_state=RANDOM_STATE
-    )
+    # Isolation Forest (default) or one of the vectorized detectors
+    iso = make_detector(detector, contamination=CONTAMINATION)
+
+    if sample_weight is None:
+        iso.fit(X_scaled)
+    elif has_fit_parameter(iso, "sample_weight"):
+        iso.fit(X_scaled, sample_weight=sample_weight)
+        # sklearn sets offset_ from an unweighted percentile of the training scores
+        iso.offset_ = weighted_percentile(iso.score_samples(X_scaled), sample_weight, 100.0 * CONTAMINATION)
+    else:
+        print(f"[Level 3] Detector '{detector}' takes no sample weights; fitting the sampled rows unweighted")
+        iso.fit(X_scaled)
+    return scaler, iso
 
-    iso.fit(X_scaled)
+
+def score_features(df, scaler, iso):
+    X_scaled = scaler.transform(df.drop(columns=["invoice_id"]))
 
     # Scores (lower = more anomalous)
     anomaly_score = iso.decision_function(X_scaled)
     anomaly_label = iso.predict(X_scaled)  # -1 = anomaly, 1 = normal
 
-    results = pd.DataFrame({
-        "invoice_id": invoice_ids,
+    return pd.DataFrame({
+        "invoice_id": df["invoice_id"],
         "anomaly_score": anomaly_score,
         "is_anomaly": (anomaly_label == -1).astype(int)
     })
 
+
+def rank_scores(results):
     # Rank: 1 = most suspicious
     results["anomaly_rank"] = (
         results["anomaly_score"]
@@ -50,12 +88,54 @@ def run_anomaly_detection():
         .astype(int)
     )
 
-    results = results.sort_values("anomaly_rank")
+    return results.sort_values("anomaly_rank")
+
+
+def save_detector(scaler, iso, feature_cols, X_train=None):
+    # Register scaler + forest so invoices can be scored without refitting
+    return registry.register(
+        model_name(detector_name(iso)),
+        iso,
+        feature_cols,
+        scaler=scaler,
+        train_data=(X_train,) if X_train is not None else None,
+        metrics={
+            "n_train": len(X_train) if X_train is not None else None,
+            "offset": float(iso.offset_),
+        },
+        params={"detector": type(iso).__name__, **iso.get_params()},
+    )
+
+
+def run_anomaly_detection():
+    parser = argparse.ArgumentParser(description="Level 3 - anomaly detection")
+    parser.add_argument("--detector", default=DETECTOR, choices=list(DETECTORS))
+    parser.add_argument("--sample", action="store_true",
+                        help="Fit on deduplicated rows; see --max-train-rows (every row is still scored)")
+    parser.add_argument("--max-train-rows", type=int, default=None,
+                        help="With --sample: stratified (customer, product, month) sample of at most N rows")
+    args = parser.parse_args()
+
+    # Load features (memory-mapped matrix when it matches the CSV)
+    df = load_features(INPUT_PATH)
+
+    # Drop identifier column
+    X = df.drop(columns=["invoice_id"])
+
+    X_train, weight = X, None
+    if args.sample:
+        sample = training_sample(X, df["invoice_id"], args.max_train_rows, model_name(args.detector))
+        X_train, weight = X.iloc[sample.positions], sample.weight
+
+    scaler, iso = fit_detector(X_train, args.detector, weight)
+    results = rank_scores(score_features(df, scaler, iso))
 
     results.to_csv(OUTPUT_PATH, index=False)
+    version = save_detector(scaler, iso, X.columns, X_train=X_train)
 
     print("Anomaly detection complete.")
     print(f"Saved → {OUTPUT_PATH}")
+    print(f"Model registered → {registry.REGISTRY_ROOT / model_name(args.detector) / version}")
     print("Top 5 suspicious invoices:")
     print(results.head(5))
 
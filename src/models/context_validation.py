@@ -1,6 +1,9 @@
 import pandas as pd
 from pathlib import Path
 
+from src.data.reference_tables import ReferenceTables
+from src.data.schema import UNIFIED_SCHEMA, apply_schema, read_features, read_unified
+
 # ---------------- PATHS ----------------
 FEATURES_PATH = Path("data/processed/billing_features.csv")
 ANOMALY_PATH = Path("data/processed/billing_anomaly_scores.csv")
@@ -15,21 +18,21 @@ OUTPUT_VALIDATED_ONLY = Path("data/processed/validated_leakage_cases.csv")
 INVOICE_ANOMALY_PERCENTILE = 0.05  # top 5% invoices by anomaly severity
 
 
-def run_context_validation():
-    features = pd.read_csv(FEATURES_PATH)
-    anomalies = pd.read_csv(ANOMALY_PATH)
-    unified = pd.read_csv(UNIFIED_PATH)
+INVOICE_KEY_COLS = ["invoice_id", "customer_id", "product_id", "invoice_date"]
 
-    # Base = Level 2 features + Level 3 anomaly scores
-    df = features.merge(anomalies, on="invoice_id", how="inner")
+RULE_COLS = [
+    "rule_contract_price_violation",
+    "rule_discount_violation",
+    "rule_usage_underbilled",
+    "rule_price_vs_customer_norm",
+]
 
-    # Bring only fields not already in features (avoid column collisions)
-    df = df.merge(
-        unified[["invoice_id", "contract_price", "max_discount_pct", "actual_usage"]],
-        on="invoice_id",
-        how="left",
-    )
 
+def apply_rules(df):
+    """
+    Row-level business rules. Needs the Level 2 features plus
+    contract_price, max_discount_pct and actual_usage.
+    """
     # ---------------- RULE CHECKS (ROW-LEVEL) ----------------
     df["rule_contract_price_violation"] = (
         df["contract_price"].notna() &
@@ -50,17 +53,33 @@ def run_context_validation():
         df["unit_price_vs_cust_avg"] < -0.15 * df["cust_avg_unit_price"]
     )
 
-    rule_cols = [
-        "rule_contract_price_violation",
-        "rule_discount_violation",
-        "rule_usage_underbilled",
-        "rule_price_vs_customer_norm",
-    ]
-    df["num_rules_triggered"] = df[rule_cols].sum(axis=1)
+    df["num_rules_triggered"] = df[RULE_COLS].sum(axis=1)
+    return df
 
+
+def invoice_context(invoice_keys, refs):
+    """
+    Contract terms + largest recorded usage per invoice from keyed lookups.
+    One row per invoice, so joining it adds no fan-out; "any usage row above
+    quantity" is the same as "max usage above quantity".
+    """
+    contracts = refs.lookup_contracts(
+        invoice_keys["customer_id"], invoice_keys["product_id"], invoice_keys["invoice_date"]
+    )
+    context = pd.DataFrame({
+        "invoice_id": invoice_keys["invoice_id"].to_numpy(),
+        "contract_price": contracts["contract_price"].to_numpy(),
+        "max_discount_pct": contracts["max_discount_pct"].to_numpy(),
+        "actual_usage": refs.usage_max(invoice_keys["customer_id"], invoice_keys["product_id"]),
+    })
+    # same float32 precision as the billed unit_price it is compared against
+    return apply_schema(context, UNIFIED_SCHEMA)
+
+
+def aggregate_invoices(df):
     # ---------------- AGGREGATE FIRST (INVOICE-LEVEL) ----------------
     inv = (
-        df.groupby("invoice_id")
+        df.groupby("invoice_id", observed=True)
         .agg(
             # anomaly severity: smaller = more suspicious
             anomaly_score_min=("anomaly_score", "min"),
@@ -77,7 +96,19 @@ def run_context_validation():
 
     # Final validation: must have >=2 rule types triggered somewhere on invoice
     inv["validated_leakage"] = (inv["max_rules_triggered"] >= 2)
+    return inv
+
 
+def validate_invoices(features, anomalies, invoice_keys, refs):
+    # Base = Level 2 features + Level 3 anomaly scores
+    df = features.merge(anomalies, on="invoice_id", how="inner")
+    df = df.merge(invoice_context(invoice_keys, refs), on="invoice_id", how="left")
+
+    df = apply_rules(df)
+    return aggregate_invoices(df)
+
+
+def save_validation_outputs(inv):
     # Save ALL invoices (this is the “complete Level 4 view”)
     inv_sorted = inv.sort_values("anomaly_score_min", ascending=True)
     inv_sorted.to_csv(OUTPUT_ALL_INVOICES, index=False)
@@ -98,5 +129,17 @@ def run_context_validation():
     print(inv_sorted.head(10))
 
 
+def run_context_validation():
+    features = read_features(FEATURES_PATH)
+    anomalies = pd.read_csv(ANOMALY_PATH)
+    invoice_keys = (
+        read_unified(UNIFIED_PATH, usecols=INVOICE_KEY_COLS)
+        .drop_duplicates("invoice_id")
+    )
+
+    inv = validate_invoices(features, anomalies, invoice_keys, ReferenceTables.from_raw())
+    save_validation_outputs(inv)
+
+
 if __name__ == "__main__":
     run_context_validation()
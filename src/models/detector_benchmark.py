@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+
+from src.data.schema import read_unified
+from src.features.build_features import FEATURE_COLS, compute_features
+from src.models.anomaly_detection import fit_detector
+from src.models.detectors import DETECTORS
+
+# ---------------- PATHS ----------------
+UNIFIED_PATH = Path("data/processed/billing_unified.csv")
+OUTPUT_PATH = Path("data/processed/detector_benchmark.csv")
+
+# ---------------- CONFIG ----------------
+SEED = 42
+INJECT_FRAC = 0.10             # same share of invoices as the Level 9 stress test
+LEAK_PCT = (0.05, 0.15)        # same 5-15% leakage as Level 9
+LEAK_TYPES = ["quantity", "unit_price", "discount_pct"]
+RECALL_TARGET = None           # default: match the current IsolationForest's recall
+
+
+def inject_leakage(unified: pd.DataFrame, seed: int = SEED) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Level 9-style injection, applied to the billing rows so the features are
+    derived from the leaked values: 10% of invoices are underbilled by 5-15%
+    through a lower quantity, a lower unit price or a larger discount.
+    Returns the modified rows and the leak type per injected invoice.
+    """
+    rng = np.random.default_rng(seed)
+    df = unified.copy()
+    invoices = df["invoice_id"].astype(str).unique()
+    chosen = rng.choice(invoices, size=int(INJECT_FRAC * len(invoices)), replace=False)
+    leak_type = pd.Series(rng.choice(LEAK_TYPES, size=len(chosen)), index=chosen)
+    leak_pct = pd.Series(rng.uniform(*LEAK_PCT, size=len(chosen)), index=chosen)
+
+    ids = df["invoice_id"].astype(str)
+    row_type = ids.map(leak_type)
+    row_pct = ids.map(leak_pct).fillna(0.0).to_numpy()
+
+    for col in ["quantity", "unit_price", "discount_pct"]:
+        df[col] = df[col].astype(np.float64)
+    qty = (row_type == "quantity").to_numpy()
+    price = (row_type == "unit_price").to_numpy()
+    disc = (row_type == "discount_pct").to_numpy()
+    df.loc[qty, "quantity"] *= 1 - row_pct[qty]
+    df.loc[price, "unit_price"] *= 1 - row_pct[price]
+    df.loc[disc, "discount_pct"] = (df.loc[disc, "discount_pct"] + 100 * row_pct[disc]).clip(upper=100)
+
+    df["billed_amount"] = df["quantity"] * df["unit_price"] * (1 - df["discount_pct"] / 100)
+    return df, leak_type
+
+
+def benchmark_detector(name: str, X: pd.DataFrame, invoice_ids: pd.Series, injected: pd.Series) -> dict:
+    started = time.perf_counter()
+    scaler, model = fit_detector(X, name)
+    fit_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scores = model.decision_function(scaler.transform(X))
+    score_s = time.perf_counter() - started
+
+    # invoice-level, as in Level 4 / 9: an invoice is as abnormal as its worst row
+    inv = pd.Series(scores).groupby(invoice_ids.to_numpy()).min()
+    is_injected = inv.index.isin(injected.index)
+    flagged = inv.to_numpy() < 0
+
+    row = {
+        "detector": name,
+        "fit_s": fit_s,
+        "score_s": score_s,
+        "fit_rows_per_s": len(X) / fit_s,
+        "score_rows_per_s": len(X) / score_s,
+        "recall": flagged[is_injected].mean(),
+        "false_positive_rate": flagged[~is_injected].mean(),
+        "roc_auc": roc_auc_score(is_injected, -inv.to_numpy()),
+    }
+    for leak in LEAK_TYPES:
+        of_type = inv.index.isin(injected.index[injected == leak])
+        row[f"recall_{leak}"] = flagged[of_type].mean()
+    return row
+
+
+def cheapest_meeting(results: pd.DataFrame, recall_target: float):
+    """Detector with the lowest fit + score time whose recall reaches the target."""
+    ok = results[results["recall"] >= recall_target]
+    if ok.empty:
+        return None
+    return ok.assign(total_s=ok["fit_s"] + ok["score_s"]).sort_values("total_s").iloc[0]["detector"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare anomaly detectors on injected leakage")
+    parser.add_argument("--detectors", nargs="+", default=list(DETECTORS), choices=list(DETECTORS))
+    parser.add_argument("--recall-target", type=float, default=RECALL_TARGET,
+                        help="Invoice-level recall at each detector's 5%% cut (default: IsolationForest's)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    unified = read_unified(UNIFIED_PATH)
+    leaked, injected = inject_leakage(unified, args.seed)
+    features = compute_features(leaked)
+    X = features[FEATURE_COLS].fillna(0)
+    invoice_ids = features["invoice_id"].astype(str)
+    print(f"[Detectors] {len(X)} rows, {invoice_ids.nunique()} invoices, {len(injected)} injected")
+
+    results = pd.DataFrame([
+        benchmark_detector(name, X, invoice_ids, injected) for name in args.detectors
+    ])
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(OUTPUT_PATH, index=False)
+    print(results.round(3).to_string(index=False))
+    print(f"[Detectors] Wrote: {OUTPUT_PATH}")
+
+    target = args.recall_target
+    if target is None:
+        if "iforest" not in set(results["detector"]):
+            raise ValueError("--recall-target is required when iforest is not benchmarked")
+        target = float(results.loc[results["detector"] == "iforest", "recall"].iloc[0])
+
+    choice = cheapest_meeting(results, target)
+    if choice is None:
+        print(f"[Detectors] No detector reaches recall {target:.3f}")
+    else:
+        print(f"[Detectors] Cheapest detector with recall >= {target:.3f}: {choice} "
+              f"(use: python -m src.cli anomaly --detector {choice})")
+
+
+if __name__ == "__main__":
+    main()
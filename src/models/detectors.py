@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+from sklearn.base import BaseEstimator, OutlierMixin
+from sklearn.ensemble import IsolationForest
+
+# Every detector follows the IsolationForest conventions used by Level 3,
+# serving and the registry: fit(X) on scaled features, score_samples (lower
+# = more abnormal), decision_function = score_samples - offset_ (< 0 is an
+# anomaly, offset_ set from `contamination`) and predict -> -1 / 1.
+
+# ---------------- CONFIG ----------------
+DEFAULT_CONTAMINATION = 0.05
+RANDOM_STATE = 42
+ECDF_POINTS = 4096   # ECOD keeps at most this many quantiles per feature
+
+
+class _TailDetector(OutlierMixin, BaseEstimator, ABC):
+    """Shared offset / decision_function / predict for the vectorized detectors."""
+
+    contamination: float
+
+    @abstractmethod
+    def _abnormality(self, X: np.ndarray) -> np.ndarray:
+        """Per-row abnormality (higher = more abnormal)."""
+
+    @abstractmethod
+    def _fit(self, X: np.ndarray) -> None:
+        """Learn the per-feature statistics `_abnormality` needs."""
+
+    def fit(self, X, y=None):
+        X = np.asarray(X, dtype=np.float64)
+        self.n_features_in_ = X.shape[1]
+        self._fit(X)
+        self.offset_ = float(np.percentile(self.score_samples(X), 100.0 * self.contamination))
+        return self
+
+    def score_samples(self, X) -> np.ndarray:
+        return -self._abnormality(np.asarray(X, dtype=np.float64))
+
+    def decision_function(self, X) -> np.ndarray:
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X) -> np.ndarray:
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+class RobustZDetector(_TailDetector):
+    """
+    Largest robust z-score across features, |x - median| / (1.4826 * MAD).
+    One pass for the medians, one for the MADs.
+    """
+
+    def __init__(self, contamination: float = DEFAULT_CONTAMINATION):
+        self.contamination = contamination
+
+    def _fit(self, X):
+        self.median_ = np.median(X, axis=0)
+        mad = 1.4826 * np.median(np.abs(X - self.median_), axis=0)
+        # constant-ish features: fall back to the std so they still count
+        std = X.std(axis=0)
+        self.scale_ = np.where(mad > 0, mad, np.where(std > 0, std, 1.0))
+
+    def _abnormality(self, X):
+        return (np.abs(X - self.median_) / self.scale_).max(axis=1)
+
+
+class HBOSDetector(_TailDetector):
+    """
+    Histogram-based outlier score: sum over features of -log(bin density).
+    Values outside the training range get the smallest density seen.
+    """
+
+    def __init__(self, n_bins: int = 20, contamination: float = DEFAULT_CONTAMINATION):
+        self.n_bins = n_bins
+        self.contamination = contamination
+
+    def _fit(self, X):
+        n, d = X.shape
+        self.edges_ = np.empty((d, self.n_bins + 1))
+        self.log_density_ = np.empty((d, self.n_bins))
+        for j in range(d):
+            counts, edges = np.histogram(X[:, j], bins=self.n_bins)
+            density = (counts + 1.0) / (n + self.n_bins)   # +1: empty bins are rare, not impossible
+            self.edges_[j] = edges
+            self.log_density_[j] = np.log(density / density.max())
+        self.floor_ = self.log_density_.min(axis=1)
+
+    def _abnormality(self, X):
+        score = np.zeros(len(X))
+        for j in range(X.shape[1]):
+            edges = self.edges_[j]
+            b = np.searchsorted(edges, X[:, j], side="right") - 1
+            inside = (X[:, j] >= edges[0]) & (X[:, j] <= edges[-1])
+            b = np.clip(b, 0, self.n_bins - 1)
+            score -= np.where(inside, self.log_density_[j][b], self.floor_[j])
+        return score
+
+
+class ECODDetector(_TailDetector):
+    """
+    Empirical-CDF outlier detection (ECOD): per feature, -log of the left and
+    right tail probabilities from the training ECDF; the row score is the
+    largest of the summed left, right and skew-chosen tails. The ECDF is kept
+    as a quantile grid, so the fitted model stays small on large data.
+    """
+
+    def __init__(self, contamination: float = DEFAULT_CONTAMINATION):
+        self.contamination = contamination
+
+    def _fit(self, X):
+        # with n <= ECDF_POINTS the grid is exactly the sorted training data
+        points = min(len(X), ECDF_POINTS)
+        self.sorted_ = np.quantile(X, np.linspace(0.0, 1.0, points), axis=0)
+        centered = X - X.mean(axis=0)
+        std = X.std(axis=0)
+        skew = (centered ** 3).mean(axis=0) / np.where(std > 0, std ** 3, 1.0)
+        self.use_left_ = skew < 0
+
+    def _abnormality(self, X):
+        n = len(self.sorted_)
+        left = np.zeros(len(X))
+        right = np.zeros(len(X))
+        auto = np.zeros(len(X))
+        for j in range(X.shape[1]):
+            col = self.sorted_[:, j]
+            # +1 smoothing keeps unseen extremes finite
+            p_left = (np.searchsorted(col, X[:, j], side="right") + 1) / (n + 2)
+            p_right = (n - np.searchsorted(col, X[:, j], side="left") + 1) / (n + 2)
+            tail_left, tail_right = -np.log(p_left), -np.log(p_right)
+            left += tail_left
+            right += tail_right
+            auto += tail_left if self.use_left_[j] else tail_right
+        return np.maximum(np.maximum(left, right), auto)
+
+
+def weighted_percentile(values: np.ndarray, weight: np.ndarray, q: float) -> float:
+    """
+    q-th percentile of `values` where each value counts `weight` times: the
+    smallest value whose cumulative weight reaches q% of the total (inverted
+    CDF, no interpolation), so deduplicated rows weighted by their counts get
+    exactly the cut-off of the full rows.
+    """
+    order = np.argsort(values, kind="stable")
+    v, w = np.asarray(values, dtype=np.float64)[order], np.asarray(weight, dtype=np.float64)[order]
+    cum = np.cumsum(w)
+    return float(v[min(np.searchsorted(cum, q / 100.0 * cum[-1], side="left"), len(v) - 1)])
+
+
+def _iforest(contamination: float = DEFAULT_CONTAMINATION) -> IsolationForest:
+    return IsolationForest(n_estimators=200, contamination=contamination, random_state=RANDOM_STATE)
+
+
+DETECTORS = {
+    "iforest": _iforest,
+    "hbos": HBOSDetector,
+    "ecod": ECODDetector,
+    "robust_z": RobustZDetector,
+}
+
+
+def make_detector(name: str, contamination: float = DEFAULT_CONTAMINATION):
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector: {name} (choose from {', '.join(DETECTORS)})")
+    return DETECTORS[name](contamination=contamination)
+
+
+def detector_name(model) -> str:
+    """Inverse of make_detector for a fitted model."""
+    if isinstance(model, IsolationForest):
+        return "iforest"
+    for name, cls in DETECTORS.items():
+        if isinstance(cls, type) and isinstance(model, cls):
+            return name
+    raise ValueError(f"Not a known detector: {type(model).__name__}")
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+
+# ---------------- PATHS ----------------
+REFERENCE_PATH = Path("models/leakage_pattern_reference.json")
+
+# ---------------- CONFIG ----------------
+PATTERN_FEATURES = [
+    "leakage_baseline",
+    "unit_price_mean",
+    "quantity_mean",
+    "discount_pct_mean",
+    "usage_ratio_mean",
+]
+
+# Expected direction of each pattern in standardized feature space.
+# A cluster is named after the signature its centroid points towards most.
+PATTERN_SIGNATURES = {
+    "Usage Underbilling": {"usage_ratio_mean": -1.0, "quantity_mean": -0.5},
+    "Pricing / Rate Mismatch": {"unit_price_mean": -1.0, "leakage_baseline": 0.5},
+    "Discount-Driven Leakage": {"discount_pct_mean": 1.0},
+}
+FALLBACK_LABEL = "Other Leakage Pattern"
+
+
+def _scale(X: np.ndarray, reference: dict) -> np.ndarray:
+    mean = np.asarray(reference["scaler_mean"], dtype=float)
+    scale = np.asarray(reference["scaler_scale"], dtype=float)
+    return (X - mean) / np.where(scale == 0, 1.0, scale)
+
+
+def _centroids(reference: dict) -> np.ndarray:
+    return np.asarray([c["centroid"] for c in reference["clusters"]], dtype=float)
+
+
+def name_clusters(centroids_scaled: np.ndarray, features: list[str]) -> list[str]:
+    """
+    Name clusters from their feature signatures.
+    Each signature is used at most once (Hungarian assignment on signature
+    scores); clusters left over get FALLBACK_LABEL.
+    """
+    labels = list(PATTERN_SIGNATURES)
+    weights = np.zeros((len(labels), len(features)))
+    for i, label in enumerate(labels):
+        for feat, w in PATTERN_SIGNATURES[label].items():
+            if feat in features:
+                weights[i, features.index(feat)] = w
+
+    scores = centroids_scaled @ weights.T  # (clusters, signatures)
+    rows, cols = linear_sum_assignment(-scores)
+
+    names = [FALLBACK_LABEL] * len(centroids_scaled)
+    for r, c in zip(rows, cols):
+        names[r] = labels[c]
+    return names
+
+
+def match_to_reference(
+    centroids_raw: np.ndarray,
+    reference: dict,
+    scaler_mean: np.ndarray,
+    scaler_scale: np.ndarray,
+) -> dict[int, int]:
+    """
+    Match freshly fitted centroids to a persisted reference set.
+    Both sets are compared in the new scaler's space; returns
+    {new_cluster_index: reference_cluster_id} for matched clusters.
+    """
+    scale = np.where(scaler_scale == 0, 1.0, scaler_scale)
+    new_scaled = (centroids_raw - scaler_mean) / scale
+    ref_scaled = (_centroids(reference) - scaler_mean) / scale
+
+    cost = ((new_scaled[:, None, :] - ref_scaled[None, :, :]) ** 2).sum(axis=2)
+    rows, cols = linear_sum_assignment(cost)
+
+    ref_ids = [c["cluster_id"] for c in reference["clusters"]]
+    return {int(r): int(ref_ids[c]) for r, c in zip(rows, cols)}
+
+
+def build_reference(
+    centroids_raw: np.ndarray,
+    scaler_mean: np.ndarray,
+    scaler_scale: np.ndarray,
+    features: list[str],
+    previous: dict | None = None,
+    n_cases: int = 0,
+) -> dict:
+    """
+    Build a reference set from new centroids (raw feature units).
+    Clusters matched to `previous` keep its IDs and labels; unmatched
+    clusters get fresh IDs and are named from their signatures.
+    """
+    scale = np.where(scaler_scale == 0, 1.0, scaler_scale)
+    names = name_clusters((centroids_raw - scaler_mean) / scale, features)
+
+    matched: dict[int, int] = {}
+    prev_labels: dict[int, str] = {}
+    if previous is not None and previous.get("features") == features:
+        matched = match_to_reference(centroids_raw, previous, scaler_mean, scaler_scale)
+        prev_labels = {c["cluster_id"]: c["label"] for c in previous["clusters"]}
+
+    next_id = max(list(prev_labels) + [-1]) + 1
+    clusters = []
+    for i, centroid in enumerate(centroids_raw):
+        if i in matched:
+            cluster_id = matched[i]
+            label = prev_labels[cluster_id]
+        else:
+            cluster_id = next_id
+            next_id += 1
+            label = names[i]
+        clusters.append({
+            "cluster_id": cluster_id,
+            "label": label,
+            "centroid": [float(v) for v in centroid],
+        })
+
+    return {
+        "features": list(features),
+        "scaler_mean": [float(v) for v in scaler_mean],
+        "scaler_scale": [float(v) for v in scaler_scale],
+        "clusters": sorted(clusters, key=lambda c: c["cluster_id"]),
+        "n_cases": int(n_cases),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def assign_patterns(X: pd.DataFrame, reference: dict) -> pd.DataFrame:
+    """
+    Online assignment: nearest reference centroid per case.
+    Returns leakage_cluster_id, leakage_pattern and pattern_distance
+    (distance in standardized units, useful to spot drift).
+    """
+    features = reference["features"]
+    missing = [c for c in features if c not in X.columns]
+    if missing:
+        raise ValueError(f"Missing pattern features: {missing}")
+
+    X_scaled = _scale(X[features].to_numpy(dtype=float), reference)
+    C_scaled = _scale(_centroids(reference), reference)
+
+    dist = ((X_scaled[:, None, :] - C_scaled[None, :, :]) ** 2).sum(axis=2)
+    nearest = dist.argmin(axis=1)
+
+    ids = np.array([c["cluster_id"] for c in reference["clusters"]])
+    labels = np.array([c["label"] for c in reference["clusters"]], dtype=object)
+
+    return pd.DataFrame({
+        "leakage_cluster_id": ids[nearest],
+        "leakage_pattern": labels[nearest],
+        "pattern_distance": np.sqrt(dist[np.arange(len(nearest)), nearest]),
+    }, index=X.index)
+
+
+def load_reference(path: Path = REFERENCE_PATH) -> dict | None:
+    if not Path(path).exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_reference(reference: dict, path: Path = REFERENCE_PATH) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(reference, f, indent=2)
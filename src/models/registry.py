@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import joblib
+import pandas as pd
+
+# ---------------- PATHS ----------------
+REGISTRY_ROOT = Path("models/registry")
+
+# Artifacts written before the registry existed; used when a name has no versions yet
+LEGACY_PATHS = {
+    "revenue_xgb_baseline": Path("models/revenue_xgb_baseline.joblib"),
+    "anomaly_iforest": Path("models/anomaly_iforest.joblib"),
+}
+
+# ---------------- CONFIG ----------------
+METADATA_FILE = "metadata.json"
+SCALER_FILE = "scaler.joblib"
+MODEL_FILES = {"joblib": "model.joblib", "torch": "model.pt"}
+
+
+@dataclass(frozen=True)
+class ModelArtifact:
+    name: str
+    version: str
+    model: Any
+    scaler: Any = None
+    metadata: dict = field(default_factory=dict)
+
+    @property
+    def feature_cols(self) -> Optional[list[str]]:
+        return self.metadata.get("feature_cols")
+
+
+# one in-memory copy per (name, version) per process
+_LOADED: dict[tuple[str, str], ModelArtifact] = {}
+_LOCK = threading.Lock()
+
+
+# ---------------- HELPERS ----------------
+def data_fingerprint(*frames) -> str:
+    """Hash of the training data (DataFrames / Series / arrays), stored with each version."""
+    digest = hashlib.sha1()
+    for frame in frames:
+        if not isinstance(frame, (pd.DataFrame, pd.Series)):
+            frame = pd.DataFrame(frame)
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+        if isinstance(frame, pd.DataFrame):
+            digest.update("\x1f".join(map(str, frame.columns)).encode())
+    return digest.hexdigest()[:16]
+
+
+def versions(name: str, root: Path = REGISTRY_ROOT) -> list[str]:
+    model_dir = Path(root) / name
+    if not model_dir.exists():
+        return []
+    return sorted(p.name for p in model_dir.iterdir() if p.is_dir() and p.name.startswith("v"))
+
+
+def latest_version(name: str, root: Path = REGISTRY_ROOT) -> Optional[str]:
+    found = versions(name, root)
+    return found[-1] if found else None
+
+
+# ---------------- REGISTER ----------------
+def register(
+    name: str,
+    model,
+    feature_cols,
+    scaler=None,
+    train_data: Optional[tuple] = None,
+    metrics: Optional[dict] = None,
+    params: Optional[dict] = None,
+    kind: str = "joblib",
+    model_class: Optional[str] = None,
+    init_kwargs: Optional[dict] = None,
+    root: Path = REGISTRY_ROOT,
+) -> str:
+    """
+    Store a new version of `name` and return its version string.
+
+    kind="joblib" pickles the estimator (uncompressed, so numpy parts can be
+    memory-mapped on load). kind="torch" saves the state_dict; `model_class`
+    ("module:Class") and `init_kwargs` rebuild the module on load.
+    The version directory is written under a temp name and renamed into
+    place, so a half-written version is never visible.
+    """
+    if kind not in MODEL_FILES:
+        raise ValueError(f"Unknown artifact kind: {kind}")
+    if kind == "torch" and model_class is None:
+        raise ValueError("Torch artifacts need model_class='module:Class'")
+
+    model_dir = Path(root) / name
+    model_dir.mkdir(parents=True, exist_ok=True)
+    previous = latest_version(name, root)
+    version = f"v{int(previous[1:]) + 1 if previous else 1:04d}"
+
+    tmp_dir = model_dir / f".{version}.tmp"
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir()
+
+    if kind == "torch":
+        import torch
+        torch.save(model.state_dict(), tmp_dir / MODEL_FILES[kind])
+    else:
+        joblib.dump(model, tmp_dir / MODEL_FILES[kind])
+    if scaler is not None:
+        joblib.dump(scaler, tmp_dir / SCALER_FILE)
+
+    metadata = {
+        "name": name,
+        "version": version,
+        "kind": kind,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "feature_cols": list(feature_cols),
+        "has_scaler": scaler is not None,
+        "training_data_hash": data_fingerprint(*train_data) if train_data is not None else None,
+        "metrics": metrics or {},
+        "params": params or {},
+        "model_class": model_class,
+        "init_kwargs": init_kwargs or {},
+    }
+    with open(tmp_dir / METADATA_FILE, "w") as f:
+        json.dump(metadata, f, indent=2, default=str)
+
+    os.replace(tmp_dir, model_dir / version)
+    return version
+
+
+# ---------------- LOAD ----------------
+def _load_torch(path: Path, metadata: dict):
+    import torch
+
+    module_name, class_name = metadata["model_class"].split(":")
+    cls = getattr(importlib.import_module(module_name), class_name)
+    model = cls(**metadata["init_kwargs"])
+    model.load_state_dict(torch.load(path, map_location="cpu", mmap=True, weights_only=True))
+    model.eval()
+    return model
+
+
+def _load_legacy(name: str) -> ModelArtifact:
+    path = LEGACY_PATHS.get(name)
+    if path is None or not path.exists():
+        raise FileNotFoundError(f"No registered versions of '{name}' under {REGISTRY_ROOT}")
+
+    obj = joblib.load(path, mmap_mode="r")
+    if isinstance(obj, dict):
+        # {"scaler", "model", "feature_cols"} bundles from Level 3
+        return ModelArtifact(
+            name, "legacy", obj["model"], obj.get("scaler"),
+            {"feature_cols": obj.get("feature_cols"), "path": str(path)},
+        )
+    feature_cols = [str(c) for c in obj.feature_names_in_] if hasattr(obj, "feature_names_in_") else None
+    return ModelArtifact(name, "legacy", obj, None, {"feature_cols": feature_cols, "path": str(path)})
+
+
+def _load_version(name: str, version: str, root: Path) -> ModelArtifact:
+    version_dir = Path(root) / name / version
+    with open(version_dir / METADATA_FILE) as f:
+        metadata = json.load(f)
+
+    model_path = version_dir / MODEL_FILES[metadata["kind"]]
+    if metadata["kind"] == "torch":
+        model = _load_torch(model_path, metadata)
+    else:
+        model = joblib.load(model_path, mmap_mode="r")
+
+    scaler = joblib.load(version_dir / SCALER_FILE) if metadata.get("has_scaler") else None
+    return ModelArtifact(name, version, model, scaler, metadata)
+
+
+def load(name: str, version: Optional[str] = None, root: Path = REGISTRY_ROOT) -> ModelArtifact:
+    """
+    Latest (or given) version of `name`. Loaded on first use and then
+    shared by every caller in the process; numpy arrays inside joblib
+    pickles and torch tensors are memory-mapped rather than copied.
+    Falls back to the pre-registry artifact path when nothing is registered.
+    """
+    version = version or latest_version(name, root) or "legacy"
+    key = (name, version)
+
+    with _LOCK:
+        if key not in _LOADED:
+            if version == "legacy":
+                _LOADED[key] = _load_legacy(name)
+            else:
+                _LOADED[key] = _load_version(name, version, root)
+        return _LOADED[key]
+
+
+def clear_cache() -> None:
+    with _LOCK:
+        _LOADED.clear()
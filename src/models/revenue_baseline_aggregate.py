@@ -1,13 +1,24 @@
 import pandas as pd
 from pathlib import Path
 
+from src.models.revenue_baseline_xgb import QUANTILE_COLS, finalize_invoices
+
 # ---------------- PATHS ----------------
+# Row-level estimates from older runs; Level 5A now writes the
+# invoice-level file directly (reducing while it predicts), so this
+# script is only needed to re-aggregate such a file.
 INPUT_PATH = Path("data/processed/revenue_baseline_estimates.csv")
 OUTPUT_PATH = Path("data/processed/revenue_baseline_invoice_level.csv")
 
 
 def main():
+    if not INPUT_PATH.exists():
+        print(f"No row-level estimates at {INPUT_PATH}; "
+              f"revenue_baseline_xgb already writes {OUTPUT_PATH}.")
+        return
+
     df = pd.read_csv(INPUT_PATH)
+    interval_cols = [c for c in QUANTILE_COLS if c in df.columns]
 
     # ---------------- AGGREGATE ----------------
     invoice_df = (
@@ -15,20 +26,12 @@ def main():
         .agg(
             billed_amount=("billed_amount", "first"),
             expected_revenue_baseline=("expected_revenue_baseline", "mean"),
+            **{c: (c, "mean") for c in interval_cols},
         )
         .reset_index()
     )
 
-    # ---------------- COMPUTE LEAKAGE ----------------
-    invoice_df["leakage_baseline"] = (
-        invoice_df["expected_revenue_baseline"]
-        - invoice_df["billed_amount"]
-    )
-
-    # ---------------- SORT (MOST AT RISK FIRST) ----------------
-    invoice_df = invoice_df.sort_values(
-        "leakage_baseline", ascending=False
-    )
+    invoice_df = finalize_invoices(invoice_df)
 
     # ---------------- SAVE ----------------
     invoice_df.to_csv(OUTPUT_PATH, index=False)
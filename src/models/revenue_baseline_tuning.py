@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.model_selection import GroupKFold
+from xgboost import XGBRegressor
+from xgboost.callback import TrainingCallback
+
+# ---------------- PATHS ----------------
+TRIALS_PATH = Path("data/processed/xgb_tuning_trials.csv")
+
+# ---------------- CONFIG ----------------
+SEED = 42
+N_TRIALS = 27              # random configurations entering the first rung
+CV_FOLDS = 3               # grouped by invoice, so fanned-out rows never straddle folds
+MIN_ROUNDS = 50            # boosting-round budget of the first rung
+MAX_ROUNDS = 1350          # budget of the last rung
+ETA = 3                    # keep the best 1/ETA per rung, ETA x the rounds for the survivors
+EARLY_STOPPING_ROUNDS = 25
+THREADS_PER_TRIAL = 1      # xgboost threads per trial; trials run in parallel on the rest
+
+# sampled per trial; the rest of the estimator matches the fixed baseline
+SEARCH_SPACE = {
+    "max_depth": ("int", 3, 10),
+    "learning_rate": ("log", 0.02, 0.3),
+    "subsample": ("uniform", 0.6, 1.0),
+    "colsample_bytree": ("uniform", 0.5, 1.0),
+    "min_child_weight": ("log", 1.0, 20.0),
+    "reg_lambda": ("log", 0.1, 10.0),
+}
+
+
+def sample_configs(n: int, seed: int = SEED) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, (kind, low, high) in SEARCH_SPACE.items():
+            if kind == "int":
+                config[name] = int(rng.integers(low, high + 1))
+            elif kind == "log":
+                config[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                config[name] = float(rng.uniform(low, high))
+        configs.append(config)
+    return configs
+
+
+class TimeBudget(TrainingCallback):
+    """Stops boosting once a fit has used `seconds` of wall-clock time."""
+
+    def __init__(self, seconds: float):
+        super().__init__()
+        self.seconds = seconds
+
+    def before_training(self, model):
+        self.started = time.perf_counter()
+        return model
+
+    def after_iteration(self, model, epoch, evals_log) -> bool:
+        return time.perf_counter() - self.started > self.seconds
+
+
+# ---------------- TRIAL (runs in a worker process) ----------------
+def evaluate_config(
+    config: dict,
+    X: np.ndarray,
+    y: np.ndarray,
+    weight: Optional[np.ndarray],
+    folds: list[tuple[np.ndarray, np.ndarray]],
+    n_rounds: int,
+    threads: int,
+    seconds: Optional[float],
+) -> dict:
+    """Cross-validated MAE of one configuration at a boosting-round budget."""
+    started = time.perf_counter()
+    maes, rounds = [], []
+    for train_idx, val_idx in folds:
+        model = XGBRegressor(
+            n_estimators=n_rounds,
+            objective="reg:squarederror",
+            eval_metric="mae",
+            early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+            callbacks=[TimeBudget(seconds / len(folds))] if seconds else None,
+            random_state=SEED,
+            n_jobs=threads,
+            **config,
+        )
+        model.fit(
+            X[train_idx],
+            y[train_idx],
+            sample_weight=None if weight is None else weight[train_idx],
+            eval_set=[(X[val_idx], y[val_idx])],
+            sample_weight_eval_set=None if weight is None else [weight[val_idx]],
+            verbose=False,
+        )
+        curve = model.evals_result()["validation_0"]["mae"]
+        best = getattr(model, "best_iteration", None)
+        best = len(curve) - 1 if best is None else best
+        maes.append(curve[best])
+        rounds.append(best + 1)
+    return {
+        "cv_mae": float(np.mean(maes)),
+        "best_rounds": int(np.mean(rounds)),
+        "stopped_early": int(max(rounds) + EARLY_STOPPING_ROUNDS <= n_rounds),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+# ---------------- SEARCH ----------------
+def successive_halving(
+    X: pd.DataFrame,
+    y: pd.Series,
+    groups,
+    weight: Optional[np.ndarray] = None,
+    n_trials: int = N_TRIALS,
+    min_rounds: int = MIN_ROUNDS,
+    max_rounds: int = MAX_ROUNDS,
+    eta: int = ETA,
+    threads_per_trial: int = THREADS_PER_TRIAL,
+    workers: Optional[int] = None,
+    trial_seconds: Optional[float] = None,
+    seed: int = SEED,
+) -> tuple[dict, int, pd.DataFrame]:
+    """
+    Random search pruned by successive halving: every configuration gets
+    `min_rounds` boosting rounds, the best 1/eta move on with eta x the
+    rounds, until `max_rounds` or a single survivor. Each rung is scored by
+    grouped K-fold MAE with early stopping, and the configurations of a rung
+    are trained in parallel (`workers` processes x `threads_per_trial`).
+    `weight` carries training-sample weights into both fitting and scoring.
+
+    Returns (best config, boosting rounds to refit with, trial history).
+    """
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_trial)
+    X_arr = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+    y_arr = np.asarray(y, dtype=np.float32)
+    w_arr = None if weight is None else np.asarray(weight, dtype=np.float32)
+    folds = list(GroupKFold(n_splits=CV_FOLDS).split(X_arr, y_arr, groups=np.asarray(groups)))
+
+    configs = dict(enumerate(sample_configs(n_trials, seed)))
+    survivors = list(configs)
+    n_rounds = min_rounds
+    rung = 0
+    history = []
+
+    with Parallel(n_jobs=workers) as parallel:
+        while True:
+            started = time.perf_counter()
+            results = parallel(
+                delayed(evaluate_config)(configs[t], X_arr, y_arr, w_arr, folds, n_rounds, threads_per_trial, trial_seconds)
+                for t in survivors
+            )
+            for trial, result in zip(survivors, results):
+                history.append({"trial": trial, "rung": rung, "n_rounds": n_rounds, **configs[trial], **result})
+            print(
+                f"[Tuning] rung {rung}: {len(survivors)} configs x {n_rounds} rounds "
+                f"in {time.perf_counter() - started:.1f}s, best CV MAE {min(r['cv_mae'] for r in results):.2f}"
+            )
+
+            if len(survivors) == 1 or n_rounds >= max_rounds:
+                break
+            ranked = [t for _, t in sorted(zip((r["cv_mae"] for r in results), survivors))]
+            survivors = ranked[:max(1, len(survivors) // eta)]
+            n_rounds = min(n_rounds * eta, max_rounds)
+            rung += 1
+
+    trials = pd.DataFrame(history)
+    last = trials[trials["rung"] == trials["rung"].max()]
+    best = last.loc[last["cv_mae"].idxmin()]
+    return configs[int(best["trial"])], int(best["best_rounds"]), trials
+
+
+# ---------------- FINAL CHOICE ----------------
+def refit_cv_mae(
+    params: dict,
+    X: pd.DataFrame,
+    y: pd.Series,
+    groups,
+    weight: Optional[np.ndarray] = None,
+    threads: int = -1,
+) -> float:
+    """
+    Grouped K-fold MAE of `params` as it would be refit: all of its
+    `n_estimators`, no early stopping. The folds are the ones
+    `successive_halving` uses for the same `groups`.
+    """
+    X_arr = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+    y_arr = np.asarray(y, dtype=np.float32)
+    w_arr = None if weight is None else np.asarray(weight, dtype=np.float32)
+    maes = []
+    for train_idx, val_idx in GroupKFold(n_splits=CV_FOLDS).split(X_arr, y_arr, groups=np.asarray(groups)):
+        model = XGBRegressor(**params, objective="reg:squarederror", random_state=SEED, n_jobs=threads)
+        model.fit(X_arr[train_idx], y_arr[train_idx], sample_weight=None if w_arr is None else w_arr[train_idx])
+        err = np.abs(model.predict(X_arr[val_idx]) - y_arr[val_idx])
+        maes.append(float(np.average(err, weights=None if w_arr is None else w_arr[val_idx])))
+    return float(np.mean(maes))
+
+
+def choose_config(
+    tuned: dict,
+    fixed: dict,
+    X: pd.DataFrame,
+    y: pd.Series,
+    groups,
+    weight: Optional[np.ndarray] = None,
+) -> tuple[dict, dict]:
+    """
+    The searched configuration only if it beats the fixed one on the same
+    grouped folds (both refit as deployed), else the fixed one.
+    Returns (params, metrics).
+    """
+    tuned_mae = refit_cv_mae(tuned, X, y, groups, weight)
+    fixed_mae = refit_cv_mae(fixed, X, y, groups, weight)
+    won = tuned_mae < fixed_mae
+    metrics = {"cv_mae": min(tuned_mae, fixed_mae), "cv_mae_tuned": tuned_mae, "cv_mae_fixed": fixed_mae, "tuned": won}
+    return (dict(tuned) if won else dict(fixed)), metrics
+
+
+def save_trials(trials: pd.DataFrame, path: Path = TRIALS_PATH) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    trials.to_csv(path, index=False)
+    return path
+
+
+def compute_share(trials: pd.DataFrame) -> pd.Series:
+    """Share of trial time spent at each rung (later rungs = promising configs only)."""
+    seconds = trials.groupby("rung")["seconds"].sum()
+    return seconds / seconds.sum()
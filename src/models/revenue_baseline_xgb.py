@@ -1,92 +1,296 @@
+import argparse
+
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
 from xgboost import XGBRegressor
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import GroupShuffleSplit
 from sklearn.metrics import mean_absolute_error
-import joblib
+
+from src.data.schema import read_unified
+from src.features.feature_matrix import load_features
+from src.models import registry, revenue_baseline_tuning as tuning
+from src.models.training_sample import training_sample
 
 # ---------------- PATHS ----------------
 FEATURES_PATH = Path("data/processed/billing_features.csv")
 UNIFIED_PATH = Path("data/processed/billing_unified.csv")
-OUTPUT_PATH = Path("data/processed/revenue_baseline_estimates.csv")
-MODEL_PATH = Path("models/revenue_xgb_baseline.joblib")
+OUTPUT_PATH = Path("data/processed/revenue_baseline_invoice_level.csv")
+MODEL_NAME = "revenue_xgb_baseline"   # model registry entry
+QUANTILE_MODEL_NAME = "revenue_xgb_quantiles"
 
 # ---------------- CONFIG ----------------
 SEED = 42
 TEST_SIZE = 0.2
 
+# point model; --tune replaces these with the searched configuration when it beats them
+XGB_PARAMS = {
+    "n_estimators": 300,
+    "max_depth": 6,
+    "learning_rate": 0.05,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+}
 
-def main():
-    # ---------------- LOAD ----------------
-    features = pd.read_csv(FEATURES_PATH)
-    unified = pd.read_csv(UNIFIED_PATH)
-
-    # ---------------- MERGE TARGET ----------------
-    df = features.merge(
-        unified[["invoice_id", "billed_amount"]],
-        on="invoice_id",
-        how="left"
-    )
+# Prediction interval: one multi-quantile model (one output per quantile)
+QUANTILES = [0.05, 0.5, 0.95]
+QUANTILE_COLS = [f"expected_revenue_q{round(q * 100):02d}" for q in QUANTILES]
 
-    # ---------------- FEATURES & TARGET ----------------
-    feature_cols = [
-        "quantity",
-        "unit_price",
-        "discount_pct",
-        "price_gap_contract",
-        "usage_gap",
-        "usage_ratio",
-        "cust_avg_unit_price",
-        "cust_avg_quantity",
-        "cust_avg_discount",
-        "unit_price_vs_cust_avg",
-        "invoice_month",
-        "invoice_dayofweek",
-        "invoice_age_days",
-    ]
-
-    X = df[feature_cols].fillna(0)
-    y = df["billed_amount"]
+PREDICT_CHUNK = 100_000   # rows scored per batch while reducing to invoices
 
-    # ---------------- SPLIT ----------------
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=TEST_SIZE, random_state=SEED
-    )
+FEATURE_COLS = [
+    "quantity",
+    "unit_price",
+    "discount_pct",
+    "price_gap_contract",
+    "usage_gap",
+    "usage_ratio",
+    "cust_avg_unit_price",
+    "cust_avg_quantity",
+    "cust_avg_discount",
+    "unit_price_vs_cust_avg",
+    "invoice_month",
+    "invoice_dayofweek",
+    "invoice_age_days",
+]
 
-    # ---------------- MODEL ----------------
+
+def training_rows(features, unified):
+    """
+    One row per feature row with its invoice's billed_amount. Merging on the
+    unified rows instead repeats every row once per usage record of the
+    invoice; both models train on these rows.
+    """
+    billed = unified[["invoice_id", "billed_amount"]].drop_duplicates("invoice_id")
+    return features.merge(billed, on="invoice_id", how="left")
+
+
+def split_rows(rows):
+    """Train / validation positions, by invoice: rows of one invoice never straddle the split."""
+    splitter = GroupShuffleSplit(n_splits=1, test_size=TEST_SIZE, random_state=SEED)
+    return next(splitter.split(rows, groups=rows["invoice_id"].astype(str)))
+
+
+def fit_quantile_model(X_train, y_train, weight=None):
     model = XGBRegressor(
         n_estimators=300,
         max_depth=6,
         learning_rate=0.05,
         subsample=0.8,
         colsample_bytree=0.8,
+        objective="reg:quantileerror",
+        quantile_alpha=np.array(QUANTILES),
+        random_state=SEED,
+        n_jobs=-1,
+    )
+    model.fit(X_train, y_train, sample_weight=weight)
+    return model
+
+
+def predict_quantiles(model, X):
+    # sort so the bounds never cross
+    return np.sort(model.predict(X).reshape(len(X), len(QUANTILES)), axis=1)
+
+
+def predict_invoice_level(model, quantile_model, X, invoice_ids):
+    """
+    Mean expected revenue (and interval bounds) per invoice, reduced while
+    predicting: rows are scored in chunks and only per-invoice running sums
+    are kept, so no row-level prediction frame is built.
+    """
+    codes, invoices = pd.factorize(invoice_ids, sort=False)
+    n = len(invoices)
+    out_cols = ["expected_revenue_baseline"] + (QUANTILE_COLS if quantile_model is not None else [])
+    sums = np.zeros((n, len(out_cols)))
+
+    for start in range(0, len(X), PREDICT_CHUNK):
+        X_chunk = X.iloc[start:start + PREDICT_CHUNK]
+        chunk_codes = codes[start:start + PREDICT_CHUNK]
+        preds = [model.predict(X_chunk)[:, None]]
+        if quantile_model is not None:
+            preds.append(predict_quantiles(quantile_model, X_chunk))
+        preds = np.hstack(preds)
+        for j in range(preds.shape[1]):
+            sums[:, j] += np.bincount(chunk_codes, weights=preds[:, j], minlength=n)
+
+    means = sums / np.bincount(codes, minlength=n)[:, None]
+    inv = pd.DataFrame(means, columns=out_cols)
+    inv.insert(0, "invoice_id", np.asarray(invoices, dtype=object))
+    return inv
+
+
+def finalize_invoices(invoice_df):
+    """Leakage columns + ordering for the invoice-level baseline output."""
+    # ---------------- COMPUTE LEAKAGE ----------------
+    invoice_df["leakage_baseline"] = (
+        invoice_df["expected_revenue_baseline"]
+        - invoice_df["billed_amount"]
+    )
+
+    # ---------------- INTERVAL-RELATIVE LEAKAGE ----------------
+    # from the quantile model alone: its median and its own lower band
+    if all(c in invoice_df.columns for c in QUANTILE_COLS):
+        lower = invoice_df[QUANTILE_COLS[0]]
+        median = invoice_df[QUANTILE_COLS[len(QUANTILES) // 2]]
+        # > 0 only when billing falls below the lower prediction bound
+        invoice_df["leakage_below_interval"] = (lower - invoice_df["billed_amount"]).clip(lower=0)
+        # gap below the median in units of the lower half-width (at least $1)
+        half_width = (median - lower).clip(lower=1.0)
+        invoice_df["leakage_interval_score"] = (median - invoice_df["billed_amount"]) / half_width
+
+    # ---------------- SORT (MOST AT RISK FIRST) ----------------
+    return invoice_df.sort_values(
+        "leakage_baseline", ascending=False
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Level 5A - XGBoost expected revenue baseline")
+    parser.add_argument("--tune", action="store_true",
+                        help="Search hyperparameters (successive halving + early stopping) before training")
+    parser.add_argument("--trials", type=int, default=tuning.N_TRIALS)
+    parser.add_argument("--max-rounds", type=int, default=tuning.MAX_ROUNDS)
+    parser.add_argument("--workers", type=int, default=None, help="Parallel trials (default: cores / threads)")
+    parser.add_argument("--threads-per-trial", type=int, default=tuning.THREADS_PER_TRIAL)
+    parser.add_argument("--trial-seconds", type=float, default=None,
+                        help="Wall-clock budget per trial and rung (boosting stops when used up)")
+    parser.add_argument("--sample", action="store_true",
+                        help="Train on deduplicated rows (weighted by their count); see --max-train-rows")
+    parser.add_argument("--max-train-rows", type=int, default=None,
+                        help="With --sample: stratified (customer, product, month) sample of at most N rows")
+    args = parser.parse_args()
+
+    # ---------------- LOAD ----------------
+    features = load_features(FEATURES_PATH)
+    unified = read_unified(UNIFIED_PATH, usecols=["invoice_id", "billed_amount"])
+
+    # ---------------- FEATURES & TARGET ----------------
+    feature_cols = FEATURE_COLS
+    rows = training_rows(features, unified)
+    X = rows[feature_cols].fillna(0)
+    y = rows["billed_amount"]
+    invoice_ids = rows["invoice_id"].astype(str)
+
+    # ---------------- SPLIT ----------------
+    # one split for the point and the quantile model
+    train_idx, val_idx = split_rows(rows)
+    X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
+    y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
+
+    # ---------------- TRAINING SAMPLE (OPTIONAL) ----------------
+    # validation and inference still use every row
+    weight = None
+    if args.sample:
+        sample = training_sample(
+            pd.concat([X_train, y_train], axis=1),
+            invoice_ids.iloc[train_idx],
+            args.max_train_rows,
+            MODEL_NAME,
+        )
+        X_train, y_train = X_train.iloc[sample.positions], y_train.iloc[sample.positions]
+        weight = sample.weight
+
+    # ---------------- TUNE (OPTIONAL) ----------------
+    params = dict(XGB_PARAMS)
+    tuning_metrics = {}
+    tuned = False
+    if args.tune:
+        groups = invoice_ids.loc[X_train.index]
+        config, n_rounds, trials = tuning.successive_halving(
+            X_train,
+            y_train,
+            groups=groups,
+            weight=weight,
+            n_trials=args.trials,
+            max_rounds=args.max_rounds,
+            threads_per_trial=args.threads_per_trial,
+            workers=args.workers,
+            trial_seconds=args.trial_seconds,
+        )
+        share = tuning.compute_share(trials)
+        print("[Tuning] Time share per rung: " + ", ".join(f"{r}: {s:.0%}" for r, s in share.items()))
+        print(f"[Tuning] Trials saved → {tuning.save_trials(trials)}")
+
+        # registered only if it beats the fixed configuration on the same folds
+        searched = {**XGB_PARAMS, **config, "n_estimators": n_rounds}
+        params, tuning_metrics = tuning.choose_config(searched, XGB_PARAMS, X_train, y_train, groups, weight)
+        tuning_metrics["tuning_trials"] = int(args.trials)
+        tuned = tuning_metrics.pop("tuned")
+        if tuned:
+            print(f"[Tuning] Searched config wins: CV MAE {tuning_metrics['cv_mae_tuned']:.2f} "
+                  f"vs {tuning_metrics['cv_mae_fixed']:.2f} fixed; using {params}")
+        else:
+            print(f"[Tuning] Searched config does not beat the fixed one (CV MAE {tuning_metrics['cv_mae_tuned']:.2f} "
+                  f"vs {tuning_metrics['cv_mae_fixed']:.2f}); keeping XGB_PARAMS")
+
+    # ---------------- MODEL ----------------
+    model = XGBRegressor(
+        **params,
         objective="reg:squarederror",
         random_state=SEED,
         n_jobs=-1,
     )
 
     # ---------------- TRAIN ----------------
-    model.fit(X_train, y_train)
+    model.fit(X_train, y_train, sample_weight=weight)
 
     # ---------------- EVALUATE ----------------
     val_preds = model.predict(X_val)
     mae = mean_absolute_error(y_val, val_preds)
     print(f"Baseline XGBoost MAE: {mae:.2f}")
 
-    # ---------------- FULL INFERENCE ----------------
-    df["expected_revenue_baseline"] = model.predict(X)
-    df["leakage_baseline"] = df["expected_revenue_baseline"] - df["billed_amount"]
+    # ---------------- QUANTILE MODEL ----------------
+    # same rows, split and weights as the point model
+    quantile_model = fit_quantile_model(X_train, y_train, weight)
+
+    q_val = predict_quantiles(quantile_model, X_val)
+    coverage = float(((y_val >= q_val[:, 0]) & (y_val <= q_val[:, -1])).mean())
+    print(f"Quantile interval [{QUANTILES[0]}, {QUANTILES[-1]}] validation coverage: {coverage:.3f}")
+
+    # ---------------- FULL INFERENCE (REDUCED TO INVOICES) ----------------
+    predictions = predict_invoice_level(model, quantile_model, X, invoice_ids)
+    billed = pd.DataFrame({"invoice_id": invoice_ids, "billed_amount": y}).drop_duplicates("invoice_id")
+    invoice_df = finalize_invoices(billed.merge(predictions, on="invoice_id", how="inner"))
 
     # ---------------- SAVE OUTPUT ----------------
     OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(OUTPUT_PATH, index=False)
-    print(f"Baseline revenue estimates saved → {OUTPUT_PATH}")
+    invoice_df.to_csv(OUTPUT_PATH, index=False)
+    print(f"Invoice-level baseline saved → {OUTPUT_PATH} (rows={len(invoice_df)})")
 
-    # ---------------- SAVE MODEL ----------------
-    MODEL_PATH.parent.mkdir(parents=True, exist_ok=True)
-    joblib.dump(model, MODEL_PATH)
-    print(f"XGBoost baseline model saved → {MODEL_PATH}")
+    # ---------------- REGISTER MODEL ----------------
+    version = registry.register(
+        MODEL_NAME,
+        model,
+        feature_cols,
+        train_data=(X_train, y_train),
+        metrics={"val_mae": float(mae), "n_train": len(X_train), **tuning_metrics},
+        params={
+            **model.get_params(),
+            "tuned": tuned,
+            "train_sample": args.sample,
+            "max_train_rows": args.max_train_rows if args.sample else None,
+        },
+    )
+    print(f"XGBoost baseline model registered → {registry.REGISTRY_ROOT / MODEL_NAME / version}")
+
+    version = registry.register(
+        QUANTILE_MODEL_NAME,
+        quantile_model,
+        feature_cols,
+        train_data=(X_train, y_train),
+        metrics={
+            "val_interval_coverage": coverage,
+            "val_median_mae": float(mean_absolute_error(y_val, q_val[:, len(QUANTILES) // 2])),
+        },
+        params={
+            **quantile_model.get_params(),
+            "quantiles": QUANTILES,
+            "train_sample": args.sample,
+            "max_train_rows": args.max_train_rows if args.sample else None,
+        },
+    )
+    print(f"XGBoost quantile model registered → {registry.REGISTRY_ROOT / QUANTILE_MODEL_NAME / version}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data.schema import read_features, read_unified
+from src.models import registry
+from src.models.revenue_baseline_xgb import MODEL_NAME as XGB_MODEL_NAME
+
+# ---------------- PATHS ----------------
+FEATURES_PATH = Path("data/processed/billing_features.csv")
+UNIFIED_PATH = Path("data/processed/billing_unified.csv")
+OUTPUT_PATH = Path("data/processed/revenue_ensemble_invoice_level.csv")
+
+# ---------------- CONFIG ----------------
+TORCH_MODEL_NAME = "revenue_torch"   # registered by revenue_model_torch (not imported: it needs torch)
+TORCH_BATCH_SIZE = 65_536
+
+
+# ---------------- MEMBERS ----------------
+def _predict_xgb(artifact: registry.ModelArtifact, X: pd.DataFrame) -> np.ndarray:
+    return artifact.model.predict(X[artifact.feature_cols])
+
+
+def _predict_torch(artifact: registry.ModelArtifact, X: pd.DataFrame) -> np.ndarray:
+    import torch
+
+    X_scaled = artifact.scaler.transform(X[artifact.feature_cols]).astype(np.float32)
+    out = np.empty(len(X_scaled), dtype=np.float32)
+    with torch.inference_mode():
+        for start in range(0, len(X_scaled), TORCH_BATCH_SIZE):
+            batch = torch.from_numpy(X_scaled[start:start + TORCH_BATCH_SIZE])
+            out[start:start + len(batch)] = artifact.model(batch).squeeze(1).numpy()
+    return out
+
+
+MEMBERS = {
+    "xgb": (XGB_MODEL_NAME, _predict_xgb),
+    "torch": (TORCH_MODEL_NAME, _predict_torch),
+}
+
+
+def load_members() -> dict[str, registry.ModelArtifact]:
+    """Registered artifacts for every member that can be loaded here."""
+    loaded = {}
+    for member, (name, _) in MEMBERS.items():
+        try:
+            loaded[member] = registry.load(name)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"[Ensemble] Skipping {member}: {e}")
+    if not loaded:
+        raise RuntimeError("No ensemble members available (train Level 5A / 5B first)")
+    return loaded
+
+
+def member_weights(members: dict[str, registry.ModelArtifact]) -> dict[str, float]:
+    """Inverse validation-MAE weights from registry metadata (equal weights if unknown)."""
+    maes = {m: a.metadata.get("metrics", {}).get("val_mae") for m, a in members.items()}
+    if any(mae is None or mae <= 0 for mae in maes.values()):
+        return {m: 1.0 / len(members) for m in members}
+    inv = {m: 1.0 / mae for m, mae in maes.items()}
+    total = sum(inv.values())
+    return {m: w / total for m, w in inv.items()}
+
+
+# ---------------- SCORE ----------------
+def predict_members(members: dict[str, registry.ModelArtifact], X: pd.DataFrame) -> dict[str, np.ndarray]:
+    # XGBoost and torch both release the GIL while predicting, so threads overlap them
+    with ThreadPoolExecutor(max_workers=len(members)) as pool:
+        futures = {m: pool.submit(MEMBERS[m][1], a, X) for m, a in members.items()}
+        return {m: f.result() for m, f in futures.items()}
+
+
+def ensemble_invoices(
+    features: pd.DataFrame,
+    billed: pd.DataFrame,
+    members: dict[str, registry.ModelArtifact],
+) -> pd.DataFrame:
+    """
+    One row per invoice: each member's expected revenue (mean over the
+    invoice's rows), the weighted ensemble, its leakage, and how much the
+    members disagree (absolute spread and relative to the ensemble).
+    """
+    X = features.drop(columns=["invoice_id"]).fillna(0)
+    preds = predict_members(members, X)
+
+    rows = pd.DataFrame({f"expected_revenue_{m}": p for m, p in preds.items()})
+    rows["invoice_id"] = features["invoice_id"].to_numpy()
+    inv = rows.groupby("invoice_id", observed=True).mean().reset_index()
+
+    weights = member_weights(members)
+    member_cols = [f"expected_revenue_{m}" for m in preds]
+    inv["expected_revenue_ensemble"] = sum(
+        weights[m] * inv[f"expected_revenue_{m}"] for m in preds
+    )
+    inv["model_disagreement"] = inv[member_cols].max(axis=1) - inv[member_cols].min(axis=1)
+    inv["model_disagreement_pct"] = (
+        inv["model_disagreement"] / inv["expected_revenue_ensemble"].abs().clip(lower=1.0)
+    )
+
+    inv = inv.merge(billed, on="invoice_id", how="left")
+    inv["leakage_ensemble"] = inv["expected_revenue_ensemble"] - inv["billed_amount"]
+    return inv.sort_values("leakage_ensemble", ascending=False)
+
+
+def main():
+    # ---------------- LOAD (once for all members) ----------------
+    features = read_features(FEATURES_PATH)
+    billed = (
+        read_unified(UNIFIED_PATH, usecols=["invoice_id", "billed_amount"])
+        .drop_duplicates("invoice_id")
+    )
+
+    members = load_members()
+    print(f"[Ensemble] Members: {', '.join(f'{m} {a.version}' for m, a in members.items())}")
+    print(f"[Ensemble] Weights: {member_weights(members)}")
+
+    inv = ensemble_invoices(features, billed, members)
+
+    # ---------------- SAVE ----------------
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    inv.to_csv(OUTPUT_PATH, index=False)
+    print(f"[Ensemble] Wrote: {OUTPUT_PATH} (rows={len(inv)})")
+    print("[Ensemble] Top 10 invoices by ensemble leakage:")
+    print(inv.head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import argparse
+
+import numpy as np
 import pandas as pd
 import torch
 import torch.nn as nn
@@ -7,11 +10,16 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error
 from pathlib import Path
 
+from src.data.schema import read_unified
+from src.features.feature_matrix import load_features
+from src.models import registry
+from src.pipeline.checkpoint import Checkpoint, atomic_write, run_key
+
 # ---------------- PATHS ----------------
 FEATURES_PATH = Path("data/processed/billing_features.csv")
 UNIFIED_PATH = Path("data/processed/billing_unified.csv")
 OUTPUT_PATH = Path("data/processed/revenue_torch_estimates.csv")
-MODEL_PATH = Path("models/revenue_model_torch.pt")
+MODEL_NAME = "revenue_torch"   # model registry entry
 
 # ---------------- CONFIG ----------------
 SEED = 42
@@ -20,8 +28,6 @@ BATCH_SIZE = 128
 EPOCHS = 40
 LR = 1e-3
 
-torch.manual_seed(SEED)
-
 
 # ---------------- MODEL ----------------
 class RevenueMLP(nn.Module):
@@ -39,39 +45,13 @@ class RevenueMLP(nn.Module):
         return self.net(x)
 
 
-def main():
-    # ---------------- LOAD ----------------
-    features = pd.read_csv(FEATURES_PATH)
-    unified = pd.read_csv(UNIFIED_PATH)
-
-    df = features.merge(
-        unified[["invoice_id", "billed_amount"]],
-        on="invoice_id",
-        how="left"
-    )
-
-    feature_cols = [
-        "quantity",
-        "unit_price",
-        "discount_pct",
-        "price_gap_contract",
-        "usage_gap",
-        "usage_ratio",
-        "cust_avg_unit_price",
-        "cust_avg_quantity",
-        "cust_avg_discount",
-        "unit_price_vs_cust_avg",
-        "invoice_month",
-        "invoice_dayofweek",
-        "invoice_age_days",
-    ]
-
-    X = df[feature_cols].fillna(0)
-    y = df["billed_amount"].values
-
-    # ---------------- SCALE ----------------
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+def train(X_scaled, y, checkpoint=None):
+    """
+    With a `checkpoint`, model / optimizer / RNG state is saved after every
+    epoch and a resumed run continues from the last saved epoch; restoring
+    the RNG state keeps the shuffling, so the result equals an uninterrupted run.
+    """
+    torch.manual_seed(SEED)
 
     # ---------------- SPLIT ----------------
     X_train, X_val, y_train, y_val = train_test_split(
@@ -79,13 +59,15 @@ def main():
     )
 
     # ---------------- DATASETS ----------------
+    # float32 features (the memory-mapped matrix) stay float32 through
+    # scaling, so these wrap the arrays without another copy
     train_ds = TensorDataset(
-        torch.tensor(X_train, dtype=torch.float32),
-        torch.tensor(y_train, dtype=torch.float32).unsqueeze(1),
+        torch.from_numpy(np.asarray(X_train, dtype=np.float32)),
+        torch.from_numpy(np.asarray(y_train, dtype=np.float32)).unsqueeze(1),
     )
     val_ds = TensorDataset(
-        torch.tensor(X_val, dtype=torch.float32),
-        torch.tensor(y_val, dtype=torch.float32).unsqueeze(1),
+        torch.from_numpy(np.asarray(X_val, dtype=np.float32)),
+        torch.from_numpy(np.asarray(y_val, dtype=np.float32)).unsqueeze(1),
     )
 
     train_loader = DataLoader(train_ds, batch_size=BATCH_SIZE, shuffle=True)
@@ -96,8 +78,20 @@ def main():
     optimizer = torch.optim.Adam(model.parameters(), lr=LR)
     criterion = nn.MSELoss()
 
+    # ---------------- RESUME ----------------
+    mae = None
+    start_epoch = 0
+    state_path = checkpoint.path("state.pt") if checkpoint is not None else None
+    if checkpoint is not None and checkpoint.is_done("epoch"):
+        state = torch.load(state_path, weights_only=False)
+        model.load_state_dict(state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        torch.set_rng_state(state["rng"])
+        start_epoch, mae = state["epoch"] + 1, state["mae"]
+        print(f"Resuming after epoch {start_epoch}/{EPOCHS}")
+
     # ---------------- TRAIN ----------------
-    for epoch in range(EPOCHS):
+    for epoch in range(start_epoch, EPOCHS):
         model.train()
         for xb, yb in train_loader:
             optimizer.zero_grad()
@@ -119,15 +113,95 @@ def main():
         mae = mean_absolute_error(val_true, val_preds)
         print(f"Epoch {epoch+1}/{EPOCHS} | Val MAE: {mae:.2f}")
 
-    # ---------------- SAVE MODEL ----------------
-    MODEL_PATH.parent.mkdir(exist_ok=True)
-    torch.save(model.state_dict(), MODEL_PATH)
+        if checkpoint is not None:
+            state = {
+                "model": model.state_dict(),
+                "optimizer": optimizer.state_dict(),
+                "rng": torch.get_rng_state(),
+                "epoch": epoch,
+                "mae": mae,
+            }
+            atomic_write(state_path, lambda tmp: torch.save(state, tmp))
+            checkpoint.mark_done("epoch", epoch=epoch + 1, val_mae=float(mae))
+
+    return model, mae
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Level 5 - PyTorch revenue model")
+    parser.add_argument("--retrain", action="store_true",
+                        help="Train a new version even if one is registered")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted training run from its last completed epoch")
+    args = parser.parse_args()
+
+    # ---------------- LOAD ----------------
+    features = load_features(FEATURES_PATH)
+    unified = read_unified(UNIFIED_PATH, usecols=["invoice_id", "billed_amount"])
+
+    df = features.merge(
+        unified[["invoice_id", "billed_amount"]],
+        on="invoice_id",
+        how="left"
+    )
+
+    feature_cols = [
+        "quantity",
+        "unit_price",
+        "discount_pct",
+        "price_gap_contract",
+        "usage_gap",
+        "usage_ratio",
+        "cust_avg_unit_price",
+        "cust_avg_quantity",
+        "cust_avg_discount",
+        "unit_price_vs_cust_avg",
+        "invoice_month",
+        "invoice_dayofweek",
+        "invoice_age_days",
+    ]
+
+    X = df[feature_cols].fillna(0)
+    y = df["billed_amount"].values
+
+    if args.retrain or registry.latest_version(MODEL_NAME) is None:
+        # ---------------- SCALE ----------------
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
+
+        checkpoint = Checkpoint(
+            "revenue_torch",
+            run_key(registry.data_fingerprint(X_scaled, y), EPOCHS, BATCH_SIZE, LR, SEED),
+            resume=args.resume,
+        )
+        model, mae = train(X_scaled, y, checkpoint)
+
+        # ---------------- REGISTER MODEL ----------------
+        version = registry.register(
+            MODEL_NAME,
+            model,
+            feature_cols,
+            scaler=scaler,
+            train_data=(X, pd.Series(y)),
+            metrics={"val_mae": float(mae)},
+            params={"epochs": EPOCHS, "batch_size": BATCH_SIZE, "lr": LR, "seed": SEED},
+            kind="torch",
+            model_class="src.models.revenue_model_torch:RevenueMLP",
+            init_kwargs={"input_dim": X_scaled.shape[1]},
+        )
+        checkpoint.complete()
+        print(f"Model registered → {registry.REGISTRY_ROOT / MODEL_NAME / version}")
+    else:
+        artifact = registry.load(MODEL_NAME)
+        model, scaler, version = artifact.model, artifact.scaler, artifact.version
+        X_scaled = scaler.transform(X[artifact.feature_cols])
+        print(f"Loaded registered model {MODEL_NAME} {version} (use --retrain to refit)")
 
     # ---------------- FULL INFERENCE ----------------
     model.eval()
     with torch.no_grad():
         expected = model(
-            torch.tensor(X_scaled, dtype=torch.float32)
+            torch.from_numpy(np.asarray(X_scaled, dtype=np.float32))
         ).squeeze().numpy()
 
     df["expected_revenue_torch"] = expected
@@ -137,7 +211,6 @@ def main():
 
     print("PyTorch revenue model complete.")
     print(f"Saved → {OUTPUT_PATH}")
-    print(f"Model saved → {MODEL_PATH}")
 
 
 if __name__ == "__main__":
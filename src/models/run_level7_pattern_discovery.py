@@ -1,65 +1,110 @@
+import argparse
+
 import pandas as pd
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 
+from src.data.schema import read_features
+from src.models.pattern_labeling import (
+    PATTERN_FEATURES,
+    REFERENCE_PATH,
+    assign_patterns,
+    build_reference,
+    load_reference,
+    save_reference,
+)
+
 # Paths
 EXPLAINED = "data/processed/explained_leakage_cases.csv"
 FEATURES = "data/processed/billing_features.csv"
 OUT = "data/processed/leakage_patterns.csv"
 
-# 1) Load data
-explained = pd.read_csv(EXPLAINED)
-features = pd.read_csv(FEATURES)
-
-# 2) Aggregate billing features to invoice level (mean)
-agg = (
-    features
-    .groupby("invoice_id", as_index=False)
-    .agg({
-        "unit_price": "mean",
-        "quantity": "mean",
-        "discount_pct": "mean",
-        "usage_ratio": "mean",
-    })
-    .rename(columns={
-        "unit_price": "unit_price_mean",
-        "quantity": "quantity_mean",
-        "discount_pct": "discount_pct_mean",
-        "usage_ratio": "usage_ratio_mean",
-    })
-)
+# Config
+N_CLUSTERS = 3
+
+
+def load_pattern_frame() -> pd.DataFrame:
+    # 1) Load data
+    explained = pd.read_csv(EXPLAINED)
+    features = read_features(FEATURES)
+
+    # 2) Aggregate billing features to invoice level (mean)
+    agg = (
+        features
+        .groupby("invoice_id", as_index=False, observed=True)
+        .agg({
+            "unit_price": "mean",
+            "quantity": "mean",
+            "discount_pct": "mean",
+            "usage_ratio": "mean",
+        })
+        .rename(columns={
+            "unit_price": "unit_price_mean",
+            "quantity": "quantity_mean",
+            "discount_pct": "discount_pct_mean",
+            "usage_ratio": "usage_ratio_mean",
+        })
+    )
+
+    # 3) Merge with explained leakage cases
+    return explained.merge(agg, on="invoice_id", how="left")
+
+
+def fit_reference(X: pd.DataFrame, previous: dict | None) -> dict:
+    """
+    Re-cluster and persist a new reference set.
+    Clusters are matched to `previous` so IDs/labels stay stable across refits.
+    """
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    kmeans = KMeans(n_clusters=N_CLUSTERS, random_state=42, n_init=10)
+    kmeans.fit(X_scaled)
+    centroids_raw = scaler.inverse_transform(kmeans.cluster_centers_)
+
+    reference = build_reference(
+        centroids_raw,
+        scaler_mean=scaler.mean_,
+        scaler_scale=scaler.scale_,
+        features=PATTERN_FEATURES,
+        previous=previous,
+        n_cases=len(X),
+    )
+    save_reference(reference, REFERENCE_PATH)
+    return reference
+
 
-# 3) Merge with explained leakage cases
-df = explained.merge(agg, on="invoice_id", how="left")
+def main():
+    parser = argparse.ArgumentParser(description="Level 7 - Pattern Discovery")
+    parser.add_argument(
+        "--refit",
+        action="store_true",
+        help="Re-cluster and update the persisted pattern reference "
+             "(default: assign cases to the existing reference only)",
+    )
+    args = parser.parse_args()
 
-# 4) Select clustering features
-cluster_cols = [
-    "leakage_baseline",
-    "unit_price_mean",
-    "quantity_mean",
-    "discount_pct_mean",
-    "usage_ratio_mean",
-]
+    df = load_pattern_frame()
 
-X = df[cluster_cols].fillna(0.0)
+    # 4) Select clustering features
+    X = df[PATTERN_FEATURES].fillna(0.0)
 
-# 5) Scale + KMeans (K=3)
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
+    # 5) Label by nearest reference centroid (refit only when asked or first run)
+    reference = load_reference(REFERENCE_PATH)
+    if args.refit or reference is None:
+        reference = fit_reference(X, previous=reference)
+        print("[Level 7] Pattern reference updated:", REFERENCE_PATH)
 
-kmeans = KMeans(n_clusters=3, random_state=42, n_init=10)
-df["leakage_cluster_id"] = kmeans.fit_predict(X_scaled)
-pattern_map = {
-    0: "Usage Underbilling",
-    1: "Pricing / Rate Mismatch",
-    2: "Discount-Driven Leakage",
-}
+    assigned = assign_patterns(X, reference)
+    df = df.join(assigned)
 
-df["leakage_pattern"] = df["leakage_cluster_id"].map(pattern_map)
+    # 6) Save
+    df.to_csv(OUT, index=False)
 
+    print("[Level 7] Wrote:", OUT)
+    print(df[["invoice_id", "leakage_cluster_id", "leakage_pattern"]].head())
+    print(df["leakage_pattern"].value_counts())
 
-# 6) Save
-df.to_csv(OUT, index=False)
 
-print("[Level 7] Wrote:", OUT)
-print(df[["invoice_id", "leakage_cluster_id"]].head())
+if __name__ == "__main__":
+    main()
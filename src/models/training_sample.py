@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.data.schema import read_features, read_unified
+
+# ---------------- PATHS ----------------
+FEATURES_PATH = Path("data/processed/billing_features.csv")
+UNIFIED_PATH = Path("data/processed/billing_unified.csv")
+REPORT_DIR = Path("data/processed")
+BENCHMARK_PATH = Path("data/processed/training_sample_benchmark.csv")
+
+# ---------------- CONFIG ----------------
+SEED = 42
+STRATA = ["customer_id", "product_id", "invoice_month"]
+MIN_PER_STRATUM = 1        # every stratum keeps a row while the budget allows it
+BENCHMARK_SIZES = [2_000, 5_000, 10_000]
+
+
+@dataclass
+class TrainingSample:
+    """
+    Bounded training set drawn from a larger frame.
+
+    `positions` index the input rows, `weight` is how many input rows each
+    sampled row stands for (duplicates x inverse sampling rate of its stratum),
+    so weighted statistics of the sample estimate those of the full data.
+    """
+
+    positions: np.ndarray
+    weight: np.ndarray
+    n_rows: int
+    n_unique: int
+    n_strata: int
+    report: pd.DataFrame = field(default_factory=pd.DataFrame)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def summary(self) -> str:
+        worst = self.report.groupby("check")["value"].max() if not self.report.empty else {}
+        parts = [
+            f"{self.n_rows} rows -> {self.n_unique} unique -> {len(self)} sampled over {self.n_strata} strata",
+            *(f"max {check} {value:.3f}" for check, value in worst.items()),
+        ]
+        return ", ".join(parts)
+
+
+# ---------------- STRATA ----------------
+def invoice_strata(invoice_ids, unified_path: Path = UNIFIED_PATH) -> pd.DataFrame:
+    """customer / product / invoice month for each row, looked up by invoice_id."""
+    keys = read_unified(unified_path, usecols=["invoice_id", "customer_id", "product_id", "invoice_date"])
+    keys = keys.drop_duplicates("invoice_id")
+    keys = pd.DataFrame({
+        "customer_id": keys["customer_id"].astype(str).to_numpy(),
+        "product_id": keys["product_id"].astype(str).to_numpy(),
+        "invoice_month": keys["invoice_date"].dt.strftime("%Y-%m").to_numpy(),
+    }, index=keys["invoice_id"].astype(str).to_numpy())
+    return keys.reindex(pd.Index(invoice_ids).astype(str)).reset_index(drop=True)[STRATA]
+
+
+# ---------------- SAMPLING ----------------
+def draw_sample(
+    values: pd.DataFrame,
+    strata: pd.DataFrame,
+    max_rows: Optional[int],
+    seed: int = SEED,
+    min_per_stratum: int = MIN_PER_STRATUM,
+) -> TrainingSample:
+    """
+    Deduplicate `values` (identical rows of the same stratum collapse into
+    one, weighted by their count), then draw at most `max_rows` of the unique
+    rows, allocated to strata in proportion to the rows they represent.
+    Rows within a stratum are drawn uniformly at random. `max_rows=None`
+    keeps every unique row.
+    """
+    n_rows = len(values)
+    stratum = strata.groupby(list(strata.columns), dropna=False, sort=False).ngroup().to_numpy()
+
+    # ---------------- DEDUPLICATE ----------------
+    row_hash = pd.util.hash_pandas_object(values.assign(_stratum=stratum), index=False).to_numpy()
+    first, inverse = np.unique(row_hash, return_index=True, return_inverse=True)[1:]
+    count = np.bincount(inverse).astype(np.float64)
+    u_stratum = stratum[first]
+    n_strata = int(stratum.max()) + 1 if n_rows else 0
+
+    if max_rows is None or len(first) <= max_rows:
+        positions, weight = first, count
+    else:
+        # ---------------- ALLOCATE ----------------
+        represented = np.bincount(u_stratum, weights=count, minlength=n_strata)
+        available = np.bincount(u_stratum, minlength=n_strata)
+        target = max_rows * represented / represented.sum()
+        take = np.minimum(available, np.maximum(np.floor(target), min_per_stratum))
+        if take.sum() > max_rows:
+            # more strata than budget: proportional only, tiny strata may drop out
+            take = np.minimum(available, np.floor(target))
+        # largest remainders fill what flooring and full strata left over
+        while (left := int(max_rows - take.sum())) > 0 and (take < available).any():
+            remainder = np.where(take < available, target - take, -np.inf)
+            top = np.argsort(-remainder, kind="stable")[:left]
+            take[top[take[top] < available[top]]] += 1
+        take = take.astype(np.int64)
+
+        # ---------------- DRAW ----------------
+        rng = np.random.default_rng(seed)
+        order = np.lexsort((rng.random(len(first)), u_stratum))
+        start = np.searchsorted(u_stratum[order], np.arange(n_strata))
+        rank = np.arange(len(order)) - start[u_stratum[order]]
+        chosen = order[rank < take[u_stratum[order]]]
+
+        # ratio weights: a stratum's sampled rows sum to the rows it represents
+        drawn = np.bincount(u_stratum[chosen], weights=count[chosen], minlength=n_strata)
+        scale = np.divide(represented, drawn, out=np.zeros(n_strata), where=drawn > 0)
+        positions = first[chosen]
+        weight = count[chosen] * scale[u_stratum[chosen]]
+
+    order = np.argsort(positions)
+    sample = TrainingSample(positions[order], weight[order], n_rows, len(first), n_strata)
+    sample.report = representativeness(values, strata, sample)
+    return sample
+
+
+# ---------------- REPORT ----------------
+def _weighted_ks(population: np.ndarray, sample: np.ndarray, weight: np.ndarray) -> float:
+    """Largest gap between the population ECDF and the weighted sample ECDF."""
+    pop = np.sort(population)
+    order = np.argsort(sample, kind="stable")
+    s, cum = sample[order], np.cumsum(weight[order])
+    grid = np.unique(np.concatenate([pop, s]))
+    f_pop = np.searchsorted(pop, grid, side="right") / len(pop)
+    idx = np.searchsorted(s, grid, side="right") - 1
+    f_s = np.where(idx >= 0, cum[np.maximum(idx, 0)], 0.0) / cum[-1]
+    return float(np.abs(f_pop - f_s).max())
+
+
+def representativeness(values: pd.DataFrame, strata: pd.DataFrame, sample: TrainingSample) -> pd.DataFrame:
+    """
+    How closely the weighted sample matches the full data:
+    share_tvd  - total variation distance of row shares per stratum dimension
+    smd        - |weighted sample mean - mean| / std per column
+    ks         - weighted Kolmogorov-Smirnov distance per column
+    """
+    rows = []
+    w = sample.weight
+    for col in strata.columns:
+        full = strata[col].astype(str).value_counts(normalize=True)
+        drawn = pd.Series(w, index=strata[col].astype(str).to_numpy()[sample.positions]).groupby(level=0).sum()
+        drawn = drawn / drawn.sum()
+        tvd = 0.5 * full.subtract(drawn, fill_value=0.0).abs().sum()
+        rows.append({"check": "share_tvd", "column": col, "value": float(tvd)})
+
+    for col in values.columns:
+        full = values[col].to_numpy(dtype=np.float64)
+        drawn = full[sample.positions]
+        std = full.std()
+        smd = abs(np.average(drawn, weights=w) - full.mean()) / std if std > 0 else 0.0
+        rows.append({"check": "smd", "column": col, "value": float(smd)})
+        rows.append({"check": "ks", "column": col, "value": _weighted_ks(full, drawn, w)})
+    return pd.DataFrame(rows)
+
+
+def save_report(sample: TrainingSample, name: str, report_dir: Path = REPORT_DIR) -> Path:
+    path = Path(report_dir) / f"training_sample_report_{name}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sample.report.to_csv(path, index=False)
+    return path
+
+
+def training_sample(values: pd.DataFrame, invoice_ids, max_rows: Optional[int], name: str) -> TrainingSample:
+    """Stratified sample for a model's training rows, with its report saved and summarized."""
+    sample = draw_sample(values.reset_index(drop=True), invoice_strata(invoice_ids), max_rows)
+    path = save_report(sample, name)
+    print(f"[Sampling] {name}: {sample.summary()} → {path}")
+    return sample
+
+
+# ---------------- BENCHMARK ----------------
+def _bench_anomaly(features: pd.DataFrame, strata: pd.DataFrame, sizes: list[int]) -> list[dict]:
+    from src.models import anomaly_detection
+
+    X = features.drop(columns=["invoice_id"])
+
+    def fit_and_score(X_train, weight=None):
+        started = time.perf_counter()
+        scaler, model = anomaly_detection.fit_detector(X_train, sample_weight=weight)
+        fit_s = time.perf_counter() - started
+        return fit_s, anomaly_detection.score_features(features, scaler, model)
+
+    full_s, full = fit_and_score(X)
+    rows = [{"model": "anomaly", "train_rows": len(X), "fit_s": full_s, "speedup": 1.0,
+             "score_rank_corr": 1.0, "flagged_overlap": 1.0}]
+    for size in sizes:
+        sample = draw_sample(X, strata, size)
+        fit_s, scores = fit_and_score(X.iloc[sample.positions], sample.weight)
+        flagged, flagged_full = scores["is_anomaly"] == 1, full["is_anomaly"] == 1
+        rows.append({
+            "model": "anomaly",
+            "train_rows": len(sample),
+            "fit_s": fit_s,
+            "speedup": full_s / fit_s,
+            "score_rank_corr": float(scores["anomaly_score"].corr(full["anomaly_score"], method="spearman")),
+            "flagged_overlap": float((flagged & flagged_full).sum() / (flagged | flagged_full).sum()),
+            **sample.report.groupby("check")["value"].max().add_prefix("max_").to_dict(),
+        })
+    return rows
+
+
+def _bench_xgb(features: pd.DataFrame, sizes: list[int]) -> list[dict]:
+    from sklearn.metrics import mean_absolute_error
+    from xgboost import XGBRegressor
+
+    from src.models import revenue_baseline_xgb as level5
+
+    # same rows and split as Level 5A
+    unified = read_unified(UNIFIED_PATH, usecols=["invoice_id", "billed_amount"])
+    df = level5.training_rows(features, unified)
+    X, y = df[level5.FEATURE_COLS].fillna(0), df["billed_amount"]
+    train_idx, val_idx = level5.split_rows(df)
+    X_train, X_val, y_train, y_val = X.iloc[train_idx], X.iloc[val_idx], y.iloc[train_idx], y.iloc[val_idx]
+    strata = invoice_strata(df["invoice_id"].iloc[train_idx])
+
+    def fit_and_eval(X_fit, y_fit, weight=None):
+        model = XGBRegressor(**level5.XGB_PARAMS, objective="reg:squarederror", random_state=level5.SEED, n_jobs=-1)
+        started = time.perf_counter()
+        model.fit(X_fit, y_fit, sample_weight=weight)
+        return time.perf_counter() - started, mean_absolute_error(y_val, model.predict(X_val))
+
+    full_s, full_mae = fit_and_eval(X_train, y_train)
+    rows = [{"model": "xgb", "train_rows": len(X_train), "fit_s": full_s, "speedup": 1.0,
+             "val_mae": full_mae, "mae_change_pct": 0.0}]
+    values = pd.concat([X_train, y_train], axis=1).reset_index(drop=True)
+    for size in [None, *sizes]:
+        sample = draw_sample(values, strata, size)
+        fit_s, mae = fit_and_eval(X_train.iloc[sample.positions], y_train.iloc[sample.positions], sample.weight)
+        rows.append({
+            "model": "xgb",
+            "train_rows": len(sample),
+            "fit_s": fit_s,
+            "speedup": full_s / fit_s,
+            "val_mae": mae,
+            "mae_change_pct": 100 * (mae - full_mae) / full_mae,
+            **sample.report.groupby("check")["value"].max().add_prefix("max_").to_dict(),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training-set sampling: speedup vs accuracy loss")
+    parser.add_argument("--sizes", type=int, nargs="+", default=BENCHMARK_SIZES)
+    args = parser.parse_args()
+
+    features = read_features(FEATURES_PATH)
+    strata = invoice_strata(features["invoice_id"])
+    results = pd.DataFrame(
+        _bench_anomaly(features, strata, args.sizes) + _bench_xgb(features, args.sizes)
+    )
+
+    BENCHMARK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(BENCHMARK_PATH, index=False)
+    print(results.round(3).to_string(index=False))
+    print(f"[Sampling] Wrote: {BENCHMARK_PATH}")
+
+
+if __name__ == "__main__":
+    main()
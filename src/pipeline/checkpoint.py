@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+# ---------------- PATHS ----------------
+CHECKPOINT_ROOT = Path("data/checkpoints")
+
+# ---------------- CONFIG ----------------
+MANIFEST_FILE = "manifest.json"
+
+
+# ---------------- ATOMIC WRITES ----------------
+def atomic_write(path: Path, write: Callable[[Path], None]) -> Path:
+    """
+    Call `write(tmp_path)`, flush it to disk and rename it over `path`, so
+    readers (and a resumed run) see either the old file or the complete
+    new one, never a partial write.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp)
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return path
+
+
+def atomic_to_csv(df: pd.DataFrame, path: Path, **kwargs) -> Path:
+    return atomic_write(path, lambda tmp: df.to_csv(tmp, **kwargs))
+
+
+def run_key(*parts) -> str:
+    """Identity of a run's inputs and settings; checkpoints only resume under the same key."""
+    return hashlib.sha1(json.dumps([str(p) for p in parts]).encode()).hexdigest()[:16]
+
+
+def file_key(path: Path) -> str:
+    # size + mtime: cheap for multi-GB inputs, changes whenever the file is rewritten
+    stat = Path(path).stat()
+    return f"{Path(path).as_posix()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+# ---------------- CHECKPOINT ----------------
+class Checkpoint:
+    """
+    Progress of one chunked stage under data/checkpoints/<stage>/: a manifest
+    of finished units (partitions, epochs, SHAP batches) and their files.
+
+    With `resume=True` and the same run key, finished units are kept and
+    skipped; otherwise the stage starts clean. The manifest is rewritten
+    atomically after each unit's files are in place, so a unit is either
+    recorded with its files or not recorded at all.
+    """
+
+    def __init__(self, stage: str, key: str, resume: bool = False, root: Path = CHECKPOINT_ROOT):
+        self.stage = stage
+        self.key = key
+        self.dir = Path(root) / stage
+        self.done: dict[str, dict] = {}
+
+        manifest = self._read()
+        if resume and manifest.get("run_key") == key:
+            self.done = manifest.get("done", {})
+        else:
+            if resume and manifest:
+                print(f"[Checkpoint] {stage}: inputs or settings changed, starting over")
+            self.clear()
+        self.resumed = len(self.done)
+        if self.resumed:
+            print(f"[Checkpoint] {stage}: resuming, {self.resumed} units already done")
+
+    def _read(self) -> dict:
+        path = self.dir / MANIFEST_FILE
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    def path(self, name: str) -> Path:
+        return self.dir / name
+
+    def is_done(self, unit: str) -> bool:
+        return unit in self.done
+
+    def info(self, unit: str) -> dict:
+        return self.done[unit]
+
+    def mark_done(self, unit: str, **info) -> None:
+        self.done[unit] = info
+        manifest = json.dumps({"stage": self.stage, "run_key": self.key, "done": self.done}, indent=1)
+        atomic_write(self.dir / MANIFEST_FILE, lambda tmp: tmp.write_text(manifest))
+
+    def clear(self) -> None:
+        if self.dir.exists():
+            shutil.rmtree(self.dir)
+        self.done = {}
+
+    def complete(self) -> None:
+        """The stage's outputs are written; its checkpoints are no longer needed."""
+        self.clear()
@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+import argparse
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from src.data.reference_tables import ReferenceTables
+from src.data.schema import FEATURE_SCHEMA, apply_schema, read_features, read_unified
+from src.features.build_features import (
+    BASELINE_MODE,
+    BASELINE_MODES,
+    BASELINES_PATH,
+    EWM_HALFLIFE,
+    FEATURE_COLS,
+    OUTPUT_PATH as FEATURES_PATH,
+    ROLLING_WINDOW,
+    _clean,
+    compute_customer_baselines,
+    compute_features,
+)
+from src.features.feature_matrix import MATRIX_PATH, write_feature_matrix_parts
+from src.models import anomaly_detection, context_validation
+from src.pipeline.checkpoint import Checkpoint, atomic_to_csv, file_key, run_key
+
+# ---------------- PATHS ----------------
+UNIFIED_PATH = Path("data/processed/billing_unified.csv")
+PARTITION_ROOT = Path("data/processed/partitions")
+
+# ---------------- CONFIG ----------------
+READ_CHUNKSIZE = 200_000
+DEFAULT_PARTITIONS = 16
+TRAIN_SAMPLE_SEED = 42
+
+
+# ---------------- PARTITION ----------------
+def partition_labels(chunk: pd.DataFrame, by: str, n_partitions: int) -> pd.Series:
+    """
+    customer -> stable hash of customer_id modulo n_partitions
+    month    -> invoice month (YYYY-MM); n_partitions is ignored
+    An invoice has one customer and one date, so it never spans partitions.
+    """
+    if by == "customer":
+        h = pd.util.hash_array(chunk["customer_id"].astype(str).to_numpy())
+        return pd.Series(h % n_partitions, index=chunk.index).map(lambda k: f"{k:05d}")
+    if by == "month":
+        month = pd.to_datetime(chunk["invoice_date"], errors="coerce").dt.strftime("%Y-%m")
+        return month.fillna("unknown")
+    raise ValueError(f"Unknown partitioning: {by}")
+
+
+def write_partitions(by: str, n_partitions: int, out_dir: Path) -> tuple[list[Path], pd.Timestamp]:
+    """
+    Stream billing_unified.csv in chunks and append each row to its partition file.
+    Also returns the latest invoice_date seen, the global reference date for
+    invoice_age_days and as-of baselines. Files are appended in a scratch
+    directory that replaces `out_dir` only once the split is complete.
+    """
+    tmp_dir = out_dir.with_name(f".{out_dir.name}.tmp")
+    for d in (tmp_dir, out_dir):
+        if d.exists():
+            shutil.rmtree(d)
+    tmp_dir.mkdir(parents=True)
+
+    latest = pd.NaT
+    for chunk in pd.read_csv(UNIFIED_PATH, chunksize=READ_CHUNKSIZE):
+        chunk_latest = pd.to_datetime(chunk["invoice_date"], errors="coerce").max()
+        if pd.notna(chunk_latest) and (pd.isna(latest) or chunk_latest > latest):
+            latest = chunk_latest
+        for label, part in chunk.groupby(partition_labels(chunk, by, n_partitions), sort=False):
+            path = tmp_dir / f"part-{label}.csv"
+            part.to_csv(path, mode="a", header=not path.exists(), index=False)
+
+    tmp_dir.rename(out_dir)
+    return sorted(out_dir.glob("part-*.csv")), latest
+
+
+def concat_csv(paths: list[Path], out_path: Path) -> None:
+    """Concatenate partition CSVs byte-wise (one header), without parsing them."""
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "wb") as out:
+        for i, path in enumerate(paths):
+            with open(path, "rb") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out)
+
+
+# ---------------- MAP TASKS (run in worker processes) ----------------
+def map_customer_stats(unified_path: Path) -> pd.DataFrame:
+    # one row per invoice, as compute_customer_baselines averages; an invoice
+    # never spans partitions, so per-partition dedup is global dedup
+    df = _clean(read_unified(unified_path)).drop_duplicates("invoice_id")
+    return (
+        df.groupby("customer_id", observed=True)
+        .agg(
+            sum_unit_price=("unit_price", "sum"),
+            sum_quantity=("quantity", "sum"),
+            sum_discount=("discount_pct", "sum"),
+            n=("unit_price", "size"),
+        )
+        .reset_index()
+        .astype({"customer_id": str})
+    )
+
+
+def map_customer_state(
+    unified_path: Path, mode: str, as_of: pd.Timestamp, window: str, halflife: str
+) -> pd.DataFrame:
+    # as-of modes: a customer's whole history sits in one partition, so its
+    # state as of the reference date is final here and the reduce is a concat
+    df = _clean(read_unified(unified_path))
+    return compute_customer_baselines(df, mode=mode, as_of=as_of, window=window, halflife=halflife)
+
+
+def map_features(
+    unified_path: Path,
+    baselines: pd.DataFrame | None,
+    out_path: Path,
+    train_frac: float,
+    mode: str = BASELINE_MODE,
+    reference_date: pd.Timestamp | None = None,
+    window: str = ROLLING_WINDOW,
+    halflife: str = EWM_HALFLIFE,
+) -> pd.DataFrame:
+    df = read_unified(unified_path)
+    df["customer_id"] = df["customer_id"].astype(str)
+    df = compute_features(
+        df,
+        customer_baselines=baselines,
+        baseline_mode=mode,
+        reference_date=reference_date,
+        window=window,
+        halflife=halflife,
+    )
+
+    features = apply_schema(df[["invoice_id"] + FEATURE_COLS].copy(), FEATURE_SCHEMA)
+    atomic_to_csv(features, out_path, index=False)
+    return train_rows(features, train_frac)
+
+
+def map_train_rows(features_path: Path, train_frac: float) -> pd.DataFrame:
+    # a resumed run re-reads the training rows of partitions featurized before the interruption
+    return train_rows(read_features(features_path), train_frac)
+
+
+def train_rows(features: pd.DataFrame, train_frac: float) -> pd.DataFrame:
+    # rows this partition contributes to the global detector fit
+    return features.sample(frac=train_frac, random_state=TRAIN_SAMPLE_SEED) if train_frac < 1 else features
+
+
+def map_scores(features_path: Path, model_version: str, out_path: Path) -> Path:
+    # loaded once per worker process, shared by every partition it scores
+    detector = anomaly_detection.load_detector(anomaly_detection.DETECTOR, model_version)
+    scores = anomaly_detection.score_features(
+        read_features(features_path), detector.scaler, detector.model
+    )
+    atomic_to_csv(scores, out_path, index=False)
+    return out_path
+
+
+def map_validation(unified_path: Path, features_path: Path, scores_path: Path, out_path: Path) -> Path:
+    invoice_keys = (
+        read_unified(unified_path, usecols=context_validation.INVOICE_KEY_COLS)
+        .drop_duplicates("invoice_id")
+    )
+    inv = context_validation.validate_invoices(
+        read_features(features_path),
+        pd.read_csv(scores_path),
+        invoice_keys,
+        ReferenceTables.from_raw(),
+    )
+    atomic_to_csv(inv, out_path, index=False)
+    return out_path
+
+
+# ---------------- REDUCE STEPS ----------------
+def reduce_customer_baselines(parts: list[pd.DataFrame]) -> pd.DataFrame:
+    stats = pd.concat(parts, ignore_index=True).groupby("customer_id").sum()
+    return pd.DataFrame({
+        "customer_id": stats.index,
+        "cust_avg_unit_price": (stats["sum_unit_price"] / stats["n"]).to_numpy(),
+        "cust_avg_quantity": (stats["sum_quantity"] / stats["n"]).to_numpy(),
+        "cust_avg_discount": (stats["sum_discount"] / stats["n"]).to_numpy(),
+    })
+
+
+# ---------------- DRIVER ----------------
+def map_pending(pool, fn, step: str, names: list[str], checkpoint: Checkpoint, *arg_lists) -> dict:
+    """
+    Run `fn` for every partition whose `step` is not checkpointed yet and
+    record each one as it finishes. Returns {partition name: result}.
+    """
+    futures = {
+        pool.submit(fn, *(args[i] for args in arg_lists)): name
+        for i, name in enumerate(names)
+        if not checkpoint.is_done(f"{step}/{name}")
+    }
+    results = {}
+    for future in as_completed(futures):
+        name = futures[future]
+        results[name] = future.result()
+        checkpoint.mark_done(f"{step}/{name}")
+    if len(futures) < len(names):
+        print(f"[Partitioned] {step}: {len(names) - len(futures)} partitions resumed, {len(futures)} run")
+    return results
+
+
+def run_partitioned(
+    by: str,
+    n_partitions: int,
+    workers: int,
+    train_frac: float = 1.0,
+    baseline_mode: str = BASELINE_MODE,
+    window: str = ROLLING_WINDOW,
+    halflife: str = EWM_HALFLIFE,
+    resume: bool = False,
+) -> None:
+    if baseline_mode != "static" and by != "customer":
+        raise ValueError(
+            f"Baseline mode '{baseline_mode}' needs each customer's full history in one "
+            "partition; use --by customer (or --baseline-mode static)."
+        )
+
+    root = PARTITION_ROOT / by
+    checkpoint = Checkpoint(
+        f"partitioned_{by}",
+        run_key(file_key(UNIFIED_PATH), n_partitions, train_frac, baseline_mode, window, halflife),
+        resume=resume,
+    )
+
+    if checkpoint.is_done("split"):
+        split = checkpoint.info("split")
+        unified_parts = [root / "unified" / name for name in split["names"]]
+        reference_date = pd.Timestamp(split["reference_date"])
+    else:
+        unified_parts, reference_date = write_partitions(by, n_partitions, root / "unified")
+        checkpoint.mark_done(
+            "split", names=[p.name for p in unified_parts], reference_date=reference_date.isoformat()
+        )
+    names = [p.name for p in unified_parts]
+    n = len(names)
+    print(f"[Partitioned] {n} partitions by {by} → {root} (reference date {reference_date.date()})")
+
+    for sub in ["features", "scores", "validation"]:
+        (root / sub).mkdir(parents=True, exist_ok=True)
+    feature_parts = [root / "features" / n for n in names]
+    score_parts = [root / "scores" / n for n in names]
+    validation_parts = [root / "validation" / n for n in names]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Level 2
+        baselines_path = checkpoint.path("customer_baselines.csv")
+        if checkpoint.is_done("baselines"):
+            baselines = pd.read_csv(baselines_path, dtype={"customer_id": str}, float_precision="round_trip")
+        elif baseline_mode == "static":
+            # map partial customer sums -> reduce to global baselines -> map features
+            baselines = reduce_customer_baselines(list(pool.map(map_customer_stats, unified_parts)))
+        else:
+            # as-of baselines are computed inside each customer partition
+            baselines = pd.concat(
+                pool.map(
+                    map_customer_state,
+                    unified_parts,
+                    [baseline_mode] * n,
+                    [reference_date] * n,
+                    [window] * n,
+                    [halflife] * n,
+                ),
+                ignore_index=True,
+            )
+        if not checkpoint.is_done("baselines"):
+            atomic_to_csv(baselines, baselines_path, index=False)
+            checkpoint.mark_done("baselines")
+        atomic_to_csv(baselines, BASELINES_PATH, index=False)
+        feature_baselines = [baselines] * n if baseline_mode == "static" else [None] * n
+
+        train_parts = map_pending(
+            pool, map_features, "features", names, checkpoint,
+            unified_parts,
+            feature_baselines,
+            feature_parts,
+            [train_frac] * n,
+            [baseline_mode] * n,
+            [reference_date] * n,
+            [window] * n,
+            [halflife] * n,
+        )
+        concat_csv(feature_parts, FEATURES_PATH)
+        write_feature_matrix_parts(feature_parts, FEATURES_PATH)
+        print(f"[Partitioned] Level 2 → {FEATURES_PATH} (+ {MATRIX_PATH})")
+
+        # Level 3: fit once on the reduced training rows, score partitions in parallel
+        if checkpoint.is_done("detector"):
+            model_version = checkpoint.info("detector")["model_version"]
+        else:
+            resumed = [name for name in names if name not in train_parts]
+            train_parts.update(zip(resumed, pool.map(
+                map_train_rows,
+                [root / "features" / name for name in resumed],
+                [train_frac] * len(resumed),
+            )))
+            train = pd.concat([train_parts[name] for name in names], ignore_index=True)
+            X_train = train.drop(columns=["invoice_id"])
+            scaler, iso = anomaly_detection.fit_detector(X_train)
+            model_version = anomaly_detection.save_detector(scaler, iso, X_train.columns, X_train=X_train)
+            checkpoint.mark_done("detector", model_version=model_version)
+            del train, X_train
+        del train_parts
+
+        map_pending(
+            pool, map_scores, "scores", names, checkpoint,
+            feature_parts,
+            [model_version] * n,
+            score_parts,
+        )
+        scores = pd.concat([pd.read_csv(p) for p in score_parts], ignore_index=True)
+        atomic_to_csv(anomaly_detection.rank_scores(scores), anomaly_detection.OUTPUT_PATH, index=False)
+        print(f"[Partitioned] Level 3 → {anomaly_detection.OUTPUT_PATH}")
+        del scores
+
+        # Level 4: rules + invoice aggregation per partition, global prioritization in the reduce
+        map_pending(
+            pool, map_validation, "validation", names, checkpoint,
+            unified_parts,
+            feature_parts,
+            score_parts,
+            validation_parts,
+        )
+        inv = pd.concat([pd.read_csv(p) for p in validation_parts], ignore_index=True)
+        context_validation.save_validation_outputs(inv)
+
+    checkpoint.complete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitioned Levels 2-4 (map-reduce over partitions)")
+    parser.add_argument("--by", default="customer", choices=["customer", "month"])
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS,
+                        help="Hash partitions (customer mode only)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--train-frac", type=float, default=1.0,
+                        help="Fraction of each partition used to fit the anomaly detector")
+    parser.add_argument("--baseline-mode", default=None, choices=BASELINE_MODES,
+                        help=f"Default: {BASELINE_MODE} with --by customer, static with --by month")
+    parser.add_argument("--window", default=ROLLING_WINDOW)
+    parser.add_argument("--halflife", default=EWM_HALFLIFE)
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip partitions finished by an interrupted run with the same inputs and settings")
+    args = parser.parse_args()
+
+    # as-of baselines need each customer's full history in one partition
+    baseline_mode = args.baseline_mode or (BASELINE_MODE if args.by == "customer" else "static")
+    if baseline_mode != "static" and args.by != "customer":
+        parser.error(f"--baseline-mode {baseline_mode} needs --by customer (month partitions split customer histories)")
+    if baseline_mode != BASELINE_MODE:
+        print(f"[Partitioned] --by {args.by}: {baseline_mode} customer baselines (single-frame default: {BASELINE_MODE})")
+
+    run_partitioned(
+        args.by, args.partitions, args.workers, args.train_frac,
+        baseline_mode, args.window, args.halflife, args.resume,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.ensemble._iforest import _average_path_length
+
+
+class FlatIsolationForest:
+    """
+    A fitted sklearn IsolationForest flattened into one set of node arrays.
+
+    All trees are walked together with a handful of NumPy ops per tree level,
+    instead of one Python/joblib call per tree. For a few rows this is
+    orders of magnitude faster than `IsolationForest.decision_function`,
+    and returns the same values.
+    """
+
+    def __init__(self, forest):
+        left, right, feature, threshold, leaf_value, roots = [], [], [], [], [], []
+        offset = 0
+        subsample = forest._max_features != forest.n_features_in_
+
+        for tree, feats in zip(forest.estimators_, forest.estimators_features_):
+            t = tree.tree_
+            n = t.node_count
+            is_leaf = t.children_left == -1
+
+            depth = np.zeros(n, dtype=np.float64)
+            for node in range(n):  # children always have larger ids than parents
+                if not is_leaf[node]:
+                    depth[t.children_left[node]] = depth[node] + 1
+                    depth[t.children_right[node]] = depth[node] + 1
+
+            # same path length sklearn accumulates at a leaf
+            value = np.where(is_leaf, depth + _average_path_length(t.n_node_samples), 0.0)
+
+            feat = np.where(is_leaf, 0, t.feature)
+            if subsample:
+                feat = np.asarray(feats)[feat]
+
+            roots.append(offset)
+            left.append(np.where(is_leaf, np.arange(n), t.children_left) + offset)
+            right.append(np.where(is_leaf, np.arange(n), t.children_right) + offset)
+            feature.append(feat)
+            threshold.append(t.threshold)
+            leaf_value.append(value)
+            offset += n
+
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.feature = np.concatenate(feature)
+        self.threshold = np.concatenate(threshold)
+        self.leaf_value = np.concatenate(leaf_value)
+        self.is_leaf = self.left == np.arange(offset)
+        self.roots = np.asarray(roots)
+
+        self.denominator = len(forest.estimators_) * _average_path_length([forest._max_samples])[0]
+        self.offset_ = forest.offset_
+
+    def score_samples(self, X) -> np.ndarray:
+        # trees were grown on float32 inputs
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+
+        active = ~self.is_leaf[node]
+        while active.any():
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            nxt = np.where(go_left, self.left[node], self.right[node])
+            node = np.where(active, nxt, node)
+            active = ~self.is_leaf[node]
+
+        depths = self.leaf_value[node].sum(axis=1)
+        if self.denominator == 0:
+            return -np.ones(X.shape[0])
+        return -(2.0 ** (-depths / self.denominator))
+
+    def decision_function(self, X) -> np.ndarray:
+        # < 0 -> anomaly, same convention as IsolationForest
+        return self.score_samples(X) - self.offset_
+
+
+def fast_detector(model):
+    """Flattened copy of an IsolationForest; the other detectors are already vectorized."""
+    return FlatIsolationForest(model) if isinstance(model, IsolationForest) else model
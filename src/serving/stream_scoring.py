@@ -0,0 +1,448 @@
+from __future__ import annotations
+
+import argparse
+import json
+import queue
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.data.reference_tables import ReferenceTables
+from src.features.build_features import FEATURE_COLS, compute_features
+from src.models import anomaly_detection
+from src.models.detectors import DETECTORS, detector_name
+from src.serving.fast_forest import fast_detector
+from src.serving.score_invoice import BASELINES_PATH, INVOICE_FIELDS, RAW_DATA_PATH, AgeClock
+
+# ---------------- CONFIG ----------------
+BATCH_SIZE = 256            # max invoices per micro-batch
+MAX_WAIT_MS = 200.0         # a partial batch is scored after this long
+QUEUE_MAX = 10_000          # buffered invoices; the reader blocks beyond this
+REFIT_WINDOW = 50_000       # most recent feature rows kept for background refits
+REFIT_EVERY = 0             # refit after this many scored rows (0 = never)
+FOLLOW_POLL_S = 0.5
+NUMERIC_FIELDS = ["quantity", "unit_price", "discount_pct", "billed_amount"]
+
+_STOP = object()
+
+
+class _SourceError:
+    # queued by the reader in place of _STOP when the source raised
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+# ---------------- SOURCES ----------------
+def _parse(line: str) -> Optional[dict]:
+    line = line.strip()
+    return json.loads(line) if line else None
+
+
+def read_file(path: Path, follow: bool = False) -> Iterator[dict]:
+    """JSON-lines invoices from a file; with `follow`, keep waiting for appended lines."""
+    with open(path) as f:
+        while True:
+            line = f.readline()
+            if line:
+                record = _parse(line)
+                if record is not None:
+                    yield record
+            elif follow:
+                time.sleep(FOLLOW_POLL_S)
+            else:
+                return
+
+
+def read_socket(host: str, port: int) -> Iterator[dict]:
+    """JSON-lines invoices from TCP clients (one connection at a time), e.g. a queue bridge."""
+    with socket.create_server((host, port)) as server:
+        print(f"[Stream] Listening on {host}:{port}", file=sys.stderr)
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("r") as lines:
+                for line in lines:
+                    record = _parse(line)
+                    if record is not None:
+                        yield record
+
+
+def micro_batches(
+    records: Iterator[dict],
+    batch_size: int = BATCH_SIZE,
+    max_wait_ms: float = MAX_WAIT_MS,
+    queue_max: int = QUEUE_MAX,
+) -> Iterator[list[tuple[float, dict]]]:
+    """
+    Group a record stream into batches of at most `batch_size`, never holding
+    a record longer than `max_wait_ms`. A reader thread feeds a bounded queue,
+    so a slow scorer applies back-pressure instead of growing memory.
+    Each item is (receive time, record). If the source raises, the records
+    read before it are still batched, then the error is re-raised here.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=queue_max)
+
+    def reader():
+        try:
+            for record in records:
+                buffer.put((time.perf_counter(), record))
+        except BaseException as error:
+            buffer.put(_SourceError(error))
+        else:
+            buffer.put(_STOP)
+
+    threading.Thread(target=reader, daemon=True).start()
+
+    batch: list = []
+    deadline = None
+    while True:
+        timeout = None if deadline is None else max(deadline - time.perf_counter(), 0.0)
+        try:
+            item = buffer.get(timeout=timeout)
+        except queue.Empty:
+            item = None
+
+        while isinstance(item, tuple):
+            batch.append(item)
+            if deadline is None:
+                deadline = item[0] + max_wait_ms / 1000.0
+            if len(batch) >= batch_size:
+                break
+            # take whatever is already buffered before checking the deadline
+            try:
+                item = buffer.get_nowait()
+            except queue.Empty:
+                item = None
+        if item is _STOP or isinstance(item, _SourceError):
+            if batch:
+                yield batch
+            if isinstance(item, _SourceError):
+                raise item.error
+            return
+        if batch and (len(batch) >= batch_size or time.perf_counter() >= deadline):
+            yield batch
+            batch, deadline = [], None
+
+
+# ---------------- VALIDATION ----------------
+def invalid_reasons(invoices: pd.DataFrame) -> pd.Series:
+    """Per invoice, the fields that are missing or unparseable ("" when it can be scored)."""
+    bad = {}
+    for col in INVOICE_FIELDS:
+        if col not in invoices.columns:
+            bad[col] = np.ones(len(invoices), dtype=bool)
+        elif col == "invoice_date":
+            bad[col] = pd.to_datetime(invoices[col], errors="coerce").isna().to_numpy()
+        elif col in NUMERIC_FIELDS:
+            bad[col] = ~np.isfinite(pd.to_numeric(invoices[col], errors="coerce").to_numpy(dtype=np.float64))
+        else:
+            bad[col] = invoices[col].isna().to_numpy()
+    bad = pd.DataFrame(bad, index=invoices.index)
+    return bad.apply(lambda row: ", ".join(row.index[row]), axis=1).astype(object)
+
+
+# ---------------- NORMALIZATION ----------------
+class RunningStats:
+    """
+    Per-feature mean/variance merged batch by batch (Chan et al. parallel
+    update), seeded from the scaler the forest was trained with.
+    """
+
+    def __init__(self, scaler):
+        self.n = float(np.max(scaler.n_samples_seen_))
+        self.mean = scaler.mean_.astype(np.float64).copy()
+        self.m2 = scaler.var_.astype(np.float64) * self.n
+
+    def update(self, X: np.ndarray) -> None:
+        n_b = len(X)
+        if n_b == 0:
+            return
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        delta = mean_b - self.mean
+        total = self.n + n_b
+        self.mean = self.mean + delta * (n_b / total)
+        self.m2 = self.m2 + m2_b + delta ** 2 * (self.n * n_b / total)
+        self.n = total
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        scale = np.sqrt(self.m2 / self.n)
+        return (X - self.mean) / np.where(scale > 0, scale, 1.0)
+
+
+# ---------------- SCORER ----------------
+@dataclass
+class StreamConfig:
+    raw_data_path: Path = RAW_DATA_PATH
+    baselines_path: Path = BASELINES_PATH
+    detector: str = anomaly_detection.DETECTOR
+    model_version: Optional[str] = None       # None -> latest registered for `detector`
+    normalization: str = "persisted"          # "persisted" | "running"
+    clock: str = "event"                      # "event": ages from invoice_date | "wall": from today (live feeds); see AgeClock
+    refit_every: int = REFIT_EVERY
+    refit_window: int = REFIT_WINDOW
+    register_refits: bool = False
+    dead_letter_path: Optional[Path] = None   # JSON lines of invalid records (None: log only)
+
+
+class StreamingAnomalyScorer:
+    """
+    Scores micro-batches of raw invoices against the registered anomaly
+    detector and returns one event per anomalous invoice.
+
+    Memory is bounded by the refit window (a fixed-size ring buffer of
+    recent feature rows); refits run on a background thread and the new
+    scaler/forest is swapped in between batches. Records that cannot be
+    scored are skipped and dead-lettered; the rest of the batch is scored.
+    """
+
+    def __init__(self, cfg: Optional[StreamConfig] = None):
+        self.cfg = cfg or StreamConfig()
+        if self.cfg.normalization not in ("persisted", "running"):
+            raise ValueError(f"Unknown normalization: {self.cfg.normalization}")
+
+        self.refs = ReferenceTables.from_raw(Path(self.cfg.raw_data_path))
+        self.customer_baselines = pd.read_csv(self.cfg.baselines_path)
+
+        detector = anomaly_detection.load_detector(self.cfg.detector, self.cfg.model_version)
+        self.feature_cols = detector.feature_cols or FEATURE_COLS
+        self.model_version = detector.version
+        self._install(detector.scaler, detector.model)
+
+        n_features = len(self.feature_cols)
+        self._window = np.empty((self.cfg.refit_window, n_features), dtype=np.float32)
+        self._window_pos = 0
+        self._window_full = False
+        self._rows_since_refit = 0
+
+        self._refit_pool = ThreadPoolExecutor(max_workers=1)
+        self._refit: Optional[Future] = None
+        self.n_scored = 0
+        self.n_events = 0
+        self.n_refits = 0
+        self.n_invalid = 0
+        self.clock = AgeClock(self.cfg.clock)
+        self.dead_letter = open(self.cfg.dead_letter_path, "a") if self.cfg.dead_letter_path else None
+
+    def _install(self, scaler, forest) -> None:
+        self.scaler = scaler
+        self.detector = detector_name(forest)   # refits keep the same detector
+        self.forest = fast_detector(forest)
+        self.running = RunningStats(scaler) if self.cfg.normalization == "running" else None
+
+    # ---------------- FEATURES ----------------
+    def featurize(self, invoices: pd.DataFrame) -> pd.DataFrame:
+        unified = self.refs.unify(invoices)
+        return compute_features(
+            unified,
+            customer_baselines=self.customer_baselines,
+            reference_date=self.clock.reference_date(invoices),
+        )
+
+    def _remember(self, X: np.ndarray) -> None:
+        # ring buffer: overwrite the oldest rows once full
+        size = len(self._window)
+        X = X[-size:]
+        end = self._window_pos + len(X)
+        if end <= size:
+            self._window[self._window_pos:end] = X
+        else:
+            split = size - self._window_pos
+            self._window[self._window_pos:] = X[:split]
+            self._window[:end - size] = X[split:]
+        self._window_full = self._window_full or end >= size
+        self._window_pos = end % size
+
+    # ---------------- REFIT ----------------
+    def _maybe_refit(self) -> None:
+        if self._refit is not None and self._refit.done():
+            scaler, forest = self._refit.result()
+            self._install(scaler, forest)
+            self._refit = None
+            self.n_refits += 1
+            print(f"[Stream] Refit #{self.n_refits} installed", file=sys.stderr)
+
+        if (
+            self.cfg.refit_every
+            and self._refit is None
+            and self._rows_since_refit >= self.cfg.refit_every
+        ):
+            rows = self._window if self._window_full else self._window[:self._window_pos]
+            X = pd.DataFrame(rows.copy(), columns=self.feature_cols)
+            self._refit = self._refit_pool.submit(self._fit, X)
+            self._rows_since_refit = 0
+
+    def _fit(self, X: pd.DataFrame):
+        scaler, forest = anomaly_detection.fit_detector(X, self.detector)
+        if self.cfg.register_refits:
+            anomaly_detection.save_detector(scaler, forest, X.columns, X_train=X)
+        return scaler, forest
+
+    # ---------------- SCORE ----------------
+    def _dead_letter(self, batch: list[tuple[float, dict]], reasons: pd.Series) -> list[tuple[float, dict]]:
+        """Valid items of `batch`; the invalid ones are counted, logged and written to the dead-letter file."""
+        invalid = (reasons != "").to_numpy()
+        if not invalid.any():
+            return batch
+        self.n_invalid += int(invalid.sum())
+        print(f"[Stream] Skipped {int(invalid.sum())} invalid records (missing/unparseable fields)", file=sys.stderr)
+        if self.dead_letter is not None:
+            for (_, record), reason in zip(batch, reasons):
+                if reason:
+                    self.dead_letter.write(json.dumps({"reason": f"invalid fields: {reason}", "record": record}, default=str) + "\n")
+            self.dead_letter.flush()
+        return [item for item, bad in zip(batch, invalid) if not bad]
+
+    def score_batch(self, batch: list[tuple[float, dict]]) -> list[dict]:
+        self._maybe_refit()
+
+        batch = self._dead_letter(batch, invalid_reasons(pd.DataFrame([r for _, r in batch])))
+        if not batch:
+            return []
+        received = pd.DataFrame({
+            "invoice_id": [str(r["invoice_id"]) for _, r in batch],
+            "received_at": [t for t, _ in batch],
+        }).drop_duplicates("invoice_id")
+        invoices = pd.DataFrame([r for _, r in batch])
+        invoices["invoice_id"] = invoices["invoice_id"].astype(str)
+        invoices[NUMERIC_FIELDS] = invoices[NUMERIC_FIELDS].apply(pd.to_numeric)
+
+        df = self.featurize(invoices)
+        X_df = df[self.feature_cols].fillna(0)
+        X = X_df.to_numpy(dtype=np.float64)
+
+        if self.running is not None:
+            self.running.update(X)
+            X_scaled = self.running.transform(X)
+        else:
+            X_scaled = self.scaler.transform(X_df)
+
+        df["anomaly_score"] = self.forest.decision_function(X_scaled)
+
+        self._remember(X.astype(np.float32))
+        self._rows_since_refit += len(X)
+
+        inv = (
+            df.groupby("invoice_id", sort=False)
+            .agg(
+                customer_id=("customer_id", "first"),
+                product_id=("product_id", "first"),
+                invoice_date=("invoice_date", "first"),
+                billed_amount=("billed_amount", "first"),
+                anomaly_score_min=("anomaly_score", "min"),
+            )
+            .reset_index()
+        )
+        self.n_scored += len(inv)
+
+        anomalous = inv[inv["anomaly_score_min"] < 0].merge(received, on="invoice_id", how="left")
+        now = time.perf_counter()
+        events = [
+            {
+                "event": "anomaly",
+                "invoice_id": row["invoice_id"],
+                "customer_id": str(row["customer_id"]),
+                "product_id": str(row["product_id"]),
+                "invoice_date": str(pd.Timestamp(row["invoice_date"]).date()),
+                "billed_amount": float(row["billed_amount"]),
+                "anomaly_score": float(row["anomaly_score_min"]),
+                "model_version": self.model_version if self.n_refits == 0 else f"{self.model_version}+refit{self.n_refits}",
+                "latency_ms": round((now - row["received_at"]) * 1000.0, 3),
+            }
+            for row in anomalous.to_dict("records")
+        ]
+        self.n_events += len(events)
+        return events
+
+    def close(self) -> None:
+        self._refit_pool.shutdown(wait=False, cancel_futures=True)
+        if self.dead_letter is not None:
+            self.dead_letter.close()
+
+
+def run_stream(
+    records: Iterator[dict],
+    scorer: StreamingAnomalyScorer,
+    out,
+    batch_size: int = BATCH_SIZE,
+    max_wait_ms: float = MAX_WAIT_MS,
+) -> None:
+    batch_ms = []
+    try:
+        for batch in micro_batches(records, batch_size, max_wait_ms):
+            started = time.perf_counter()
+            for event in scorer.score_batch(batch):
+                out.write(json.dumps(event) + "\n")
+            out.flush()
+            batch_ms.append((time.perf_counter() - started) * 1000.0)
+    finally:
+        scorer.close()
+        if batch_ms:
+            print(
+                f"[Stream] Scored {scorer.n_scored} invoices in {len(batch_ms)} batches, "
+                f"{scorer.n_events} anomaly events, {scorer.n_invalid} invalid records skipped, {scorer.n_refits} refits; "
+                f"batch ms p50={np.percentile(batch_ms, 50):.1f} p99={np.percentile(batch_ms, 99):.1f}",
+                file=sys.stderr,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming anomaly scoring over invoice micro-batches")
+    parser.add_argument("--source", required=True,
+                        help="file:<path.jsonl> or socket:<host>:<port> (JSON lines, one invoice each)")
+    parser.add_argument("--follow", action="store_true", help="Keep reading appended lines (file source)")
+    parser.add_argument("--out", default="-", help="JSON-lines event output (default: stdout)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--normalization", default="persisted", choices=["persisted", "running"])
+    parser.add_argument("--clock", default=None, choices=["event", "wall"],
+                        help="Invoice ages from the records' invoice_date (event) or today (wall); "
+                             "default: wall for --follow / socket sources, event otherwise")
+    parser.add_argument("--detector", default=anomaly_detection.DETECTOR, choices=list(DETECTORS),
+                        help="Registered anomaly detector to start from (anomaly --detector)")
+    parser.add_argument("--refit-every", type=int, default=REFIT_EVERY,
+                        help="Refit the forest in the background after this many rows (0 = never)")
+    parser.add_argument("--refit-window", type=int, default=REFIT_WINDOW)
+    parser.add_argument("--register-refits", action="store_true",
+                        help="Register each background refit as a new model version")
+    parser.add_argument("--dead-letter", default=None,
+                        help="Append invalid records (with the reason) to this JSON-lines file")
+    args = parser.parse_args()
+
+    kind, _, target = args.source.partition(":")
+    if kind == "file":
+        records = read_file(Path(target), follow=args.follow)
+    elif kind == "socket":
+        host, _, port = target.rpartition(":")
+        records = read_socket(host or "127.0.0.1", int(port))
+    else:
+        raise ValueError(f"Unknown source: {args.source}")
+
+    live = kind == "socket" or args.follow
+    scorer = StreamingAnomalyScorer(StreamConfig(
+        detector=args.detector,
+        normalization=args.normalization,
+        clock=args.clock or ("wall" if live else "event"),
+        refit_every=args.refit_every,
+        refit_window=args.refit_window,
+        register_refits=args.register_refits,
+        dead_letter_path=Path(args.dead_letter) if args.dead_letter else None,
+    ))
+
+    out = sys.stdout if args.out == "-" else open(args.out, "a")
+    try:
+        run_stream(records, scorer, out, args.batch_size, args.max_wait_ms)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
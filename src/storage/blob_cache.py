@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+DEFAULT_MAX_MB = 512
+QUERY_CHUNK = 900          # stay under SQLite's bound-parameter limit
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+# ---------------- HASHING ----------------
+def text_hash(text: str) -> np.uint64:
+    """Stable 64-bit hash of a string (versions, model fingerprints)."""
+    return pd.util.hash_array(np.array([text], dtype=object))[0]
+
+
+def hash_groups(frame: pd.DataFrame, groups: pd.Series, salt: str = "") -> pd.Series:
+    """
+    One 64-bit content hash per group (e.g. per invoice) over all columns
+    of `frame`. Sensitive to values, column names and row order within the
+    group; `salt` (e.g. a code version) is mixed into every key.
+    Returns a Series indexed by group label.
+    """
+    codes, labels = pd.factorize(groups, sort=False)
+    position = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+
+    row_hash = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    row_hash = pd.util.hash_array(row_hash ^ (position.astype(np.uint64) * _MIX))
+
+    n = len(labels)
+    acc = np.zeros(n, dtype=np.uint64)
+    np.add.at(acc, codes, row_hash)           # wraps mod 2**64
+    counts = np.bincount(codes, minlength=n).astype(np.uint64)
+
+    columns = text_hash("\x1f".join(map(str, frame.columns)))
+    keys = pd.util.hash_array(acc ^ (counts * _MIX) ^ columns ^ text_hash(salt))
+    return pd.Series(keys, index=labels)
+
+
+def cached_rows(
+    cache: "BlobCache",
+    keys: pd.Series,
+    groups: pd.Series,
+    compute,
+    n_cols: int,
+    dtype=np.float64,
+) -> np.ndarray:
+    """
+    Row-aligned (len(groups), n_cols) array assembled per group: groups
+    whose key (from hash_groups) is in `cache` are read back, the rest come
+    from `compute(miss_mask)`, which must return the rows selected by the
+    boolean mask in frame order, and are stored.
+    """
+    key_values = keys.to_numpy()
+    found = cache.get_many(key_values)
+    hit = np.fromiter((int(k) in found for k in key_values), dtype=bool, count=len(key_values))
+
+    # rows of group i (first-appearance order, as in hash_groups) are order[bounds[i]:bounds[i + 1]]
+    codes, _ = pd.factorize(groups, sort=False)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(key_values)))])
+
+    values = np.empty((len(codes), n_cols), dtype=dtype)
+    miss_rows = ~hit[codes]
+    if miss_rows.any():
+        values[miss_rows] = compute(miss_rows)
+
+    new_entries = {}
+    for i, key in enumerate(key_values):
+        rows = order[bounds[i]:bounds[i + 1]]
+        if hit[i]:
+            values[rows] = np.frombuffer(found[int(key)], dtype=dtype).reshape(len(rows), n_cols)
+        else:
+            new_entries[int(key)] = values[rows].tobytes()
+    cache.put_many(new_entries)
+    return values
+
+
+# ---------------- STORE ----------------
+class BlobCache:
+    """
+    Content-addressed byte cache in a single SQLite file.
+
+    Keys are 64-bit content hashes; values are opaque blobs. Reads refresh
+    an entry's last-used stamp and `evict()` drops least-recently-used
+    entries until the stored bytes fit `max_mb`.
+    """
+
+    def __init__(self, path: Path, max_mb: float = DEFAULT_MAX_MB, table: str = "entries"):
+        self.path = Path(path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(self.path)
+        self.con.execute("PRAGMA journal_mode = WAL")
+        self.con.execute("PRAGMA synchronous = NORMAL")
+        self.con.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key INTEGER PRIMARY KEY, value BLOB NOT NULL, "
+            "nbytes INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table} (last_used)")
+
+    @staticmethod
+    def _sql_keys(keys: Iterable) -> list[int]:
+        # SQLite integers are signed 64-bit
+        return np.asarray(list(keys), dtype=np.uint64).view(np.int64).tolist()
+
+    def get_many(self, keys: Iterable) -> dict[int, bytes]:
+        """Return {key: blob} for the keys present (keys as unsigned ints)."""
+        sql_keys = self._sql_keys(keys)
+        found: dict[int, bytes] = {}
+        now = time.time_ns()
+        for start in range(0, len(sql_keys), QUERY_CHUNK):
+            chunk = sql_keys[start:start + QUERY_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = self.con.execute(
+                f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            if rows:
+                self.con.execute(
+                    f"UPDATE {self.table} SET last_used = ? WHERE key IN ({placeholders})", [now] + chunk
+                )
+            found.update(rows)
+
+        n_hits = sum(k in found for k in sql_keys)
+        self.hits += n_hits
+        self.misses += len(sql_keys) - n_hits
+        return {int(np.int64(k).view(np.uint64)): v for k, v in found.items()}
+
+    def put_many(self, items: dict) -> None:
+        if not items:
+            return
+        now = time.time_ns()
+        keys = self._sql_keys(items.keys())
+        self.con.executemany(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, nbytes, last_used) VALUES (?, ?, ?, ?)",
+            ((k, v, len(v), now) for k, v in zip(keys, items.values())),
+        )
+
+    def size_bytes(self) -> int:
+        return self.con.execute(f"SELECT COALESCE(SUM(nbytes), 0) FROM {self.table}").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop least-recently-used entries beyond the byte budget. Returns entries removed."""
+        cur = self.con.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            "  SELECT key FROM ("
+            "    SELECT key, SUM(nbytes) OVER (ORDER BY last_used DESC, key) AS kept"
+            f"    FROM {self.table}"
+            "  ) WHERE kept > ?"
+            ")",
+            (self.max_bytes,),
+        )
+        return cur.rowcount
+
+    def commit(self) -> None:
+        """Make entries written so far durable (a crashed run keeps them)."""
+        self.con.commit()
+
+    def close(self) -> None:
+        self.evict()
+        self.con.commit()
+        self.con.close()
+
+    def __enter__(self) -> "BlobCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pandas as pd
+
+from src.data.schema import read_unified
+
+# ---------------- PATHS ----------------
+UNIFIED_PATH = Path("data/processed/billing_unified.csv")
+VALIDATION_PATH = Path("data/processed/invoice_validation_all.csv")
+BASELINE_PATH = Path("data/processed/revenue_baseline_invoice_level.csv")
+EXPLAINED_PATH = Path("data/processed/explained_leakage_cases.csv")
+PATTERNS_PATH = Path("data/processed/leakage_patterns.csv")
+ENSEMBLE_PATH = Path("data/processed/revenue_ensemble_invoice_level.csv")
+DB_PATH = Path("data/processed/leakage_cases.sqlite")
+
+# ---------------- CONFIG ----------------
+TABLE = "invoice_cases"
+INSERT_CHUNK = 50_000
+
+RULE_FLAGS = [
+    "any_contract_violation",
+    "any_discount_violation",
+    "any_usage_underbilled",
+    "any_price_norm_violation",
+]
+
+# column -> SQLite type (also the whitelist for filters / group-bys / ordering)
+CASE_COLUMNS = {
+    "invoice_id": "TEXT PRIMARY KEY",
+    "customer_id": "TEXT",
+    "product_id": "TEXT",
+    "invoice_date": "TEXT",      # ISO YYYY-MM-DD, range filters compare as text
+    "invoice_month": "TEXT",     # YYYY-MM
+    "billed_amount": "REAL",
+    "expected_revenue_baseline": "REAL",
+    "leakage_baseline": "REAL",
+    "expected_revenue_ensemble": "REAL",
+    "leakage_ensemble": "REAL",
+    "model_disagreement": "REAL",
+    "anomaly_score_min": "REAL",
+    "max_rules_triggered": "INTEGER",
+    **{flag: "INTEGER" for flag in RULE_FLAGS},
+    "validated_leakage": "INTEGER",
+    "leakage_pattern": "TEXT",
+    "leakage_cluster_id": "INTEGER",
+    "top_shap_features": "TEXT",
+    "top_shap_impacts": "TEXT",
+    "explanation_text": "TEXT",
+}
+
+INDEXES = {
+    "idx_cases_customer": ["customer_id", "invoice_date"],
+    "idx_cases_product": ["product_id", "invoice_date"],
+    "idx_cases_pattern": ["leakage_pattern", "leakage_baseline"],
+    "idx_cases_date": ["invoice_date"],
+    "idx_cases_leakage": ["leakage_baseline"],
+    "idx_cases_validated": ["validated_leakage", "leakage_baseline"],
+}
+
+GROUPABLE = ["customer_id", "product_id", "invoice_month", "leakage_pattern", "validated_leakage"] + RULE_FLAGS
+
+
+# ---------------- BUILD ----------------
+def _read_optional(path: Path, usecols: list[str]) -> Optional[pd.DataFrame]:
+    if not Path(path).exists():
+        return None
+    df = pd.read_csv(path, usecols=lambda c: c in usecols)
+    df["invoice_id"] = df["invoice_id"].astype(str)
+    return df.drop_duplicates("invoice_id")
+
+
+def build_case_frame() -> pd.DataFrame:
+    """
+    One row per invoice: keys from billing_unified plus every invoice-level
+    artifact the pipeline has produced so far (missing artifacts -> NULLs).
+    """
+    cases = read_unified(
+        UNIFIED_PATH,
+        usecols=["invoice_id", "customer_id", "product_id", "invoice_date"],
+    )
+    cases = cases.drop_duplicates("invoice_id")
+    for col in ["invoice_id", "customer_id", "product_id"]:
+        cases[col] = cases[col].astype(str)
+
+    dates = cases["invoice_date"]
+    cases["invoice_date"] = dates.dt.strftime("%Y-%m-%d")
+    cases["invoice_month"] = dates.dt.strftime("%Y-%m")
+
+    sources = [
+        (VALIDATION_PATH, ["anomaly_score_min", "max_rules_triggered", "validated_leakage"] + RULE_FLAGS),
+        (BASELINE_PATH, ["billed_amount", "expected_revenue_baseline", "leakage_baseline"]),
+        (EXPLAINED_PATH, ["top_shap_features", "top_shap_impacts", "explanation_text"]),
+        (PATTERNS_PATH, ["leakage_pattern", "leakage_cluster_id"]),
+        (ENSEMBLE_PATH, ["expected_revenue_ensemble", "leakage_ensemble", "model_disagreement"]),
+    ]
+    for path, cols in sources:
+        part = _read_optional(path, ["invoice_id"] + cols)
+        if part is not None:
+            cases = cases.merge(part, on="invoice_id", how="left")
+
+    for col in CASE_COLUMNS:
+        if col not in cases.columns:
+            cases[col] = None
+
+    # Flags arrive as True/False strings or 0/1 numbers depending on the writer
+    for col in RULE_FLAGS + ["validated_leakage"]:
+        raw = cases[col]
+        flag = raw.astype(str).str.strip().str.lower().isin(["true", "1", "1.0"])
+        cases[col] = flag.astype("Int64").where(raw.notna())
+
+    return cases[list(CASE_COLUMNS)]
+
+
+def publish(db_path: Path = DB_PATH) -> int:
+    """
+    (Re)build the case database. Written to a temp file and swapped in
+    atomically so readers never see a half-built database.
+    """
+    cases = build_case_frame()
+
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = db_path.with_suffix(db_path.suffix + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    con = sqlite3.connect(tmp_path)
+    try:
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+
+        cols_sql = ", ".join(f"{c} {t}" for c, t in CASE_COLUMNS.items())
+        con.execute(f"CREATE TABLE {TABLE} ({cols_sql})")
+
+        placeholders = ", ".join("?" for _ in CASE_COLUMNS)
+        insert_sql = f"INSERT INTO {TABLE} VALUES ({placeholders})"
+        records = cases.astype(object).where(cases.notna(), None)
+        for start in range(0, len(records), INSERT_CHUNK):
+            chunk = records.iloc[start:start + INSERT_CHUNK]
+            con.executemany(insert_sql, chunk.itertuples(index=False, name=None))
+
+        # Indexes after the bulk load (much faster than maintaining them per insert)
+        for name, cols in INDEXES.items():
+            con.execute(f"CREATE INDEX {name} ON {TABLE} ({', '.join(cols)})")
+        con.execute("ANALYZE")
+        con.commit()
+    finally:
+        con.close()
+
+    os.replace(tmp_path, db_path)
+    return len(cases)
+
+
+# ---------------- QUERY API ----------------
+def connect(db_path: Path = DB_PATH) -> sqlite3.Connection:
+    if not Path(db_path).exists():
+        raise FileNotFoundError(f"Missing case database: {db_path} (run publish first)")
+    return sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True, check_same_thread=False)
+
+
+def _in_clause(col: str, values: Optional[Iterable], clauses: list[str], params: list) -> None:
+    # any iterable (list, Series, array); `values or []` would fail on the last two
+    values = [] if values is None else list(values)
+    if values:
+        clauses.append(f"{col} IN ({', '.join('?' for _ in values)})")
+        params.extend(values)
+
+
+def _where(
+    invoice_ids: Optional[Iterable[str]] = None,
+    customer_ids: Optional[Iterable[str]] = None,
+    product_ids: Optional[Iterable[str]] = None,
+    patterns: Optional[Iterable[str]] = None,
+    rule_flags: Optional[Iterable[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    min_leakage: Optional[float] = None,
+    validated_only: bool = False,
+) -> tuple[str, list]:
+    clauses: list[str] = []
+    params: list = []
+
+    _in_clause("invoice_id", invoice_ids, clauses, params)
+    _in_clause("customer_id", customer_ids, clauses, params)
+    _in_clause("product_id", product_ids, clauses, params)
+    _in_clause("leakage_pattern", patterns, clauses, params)
+
+    for flag in [] if rule_flags is None else list(rule_flags):
+        if flag not in RULE_FLAGS:
+            raise ValueError(f"Unknown rule flag: {flag}")
+        clauses.append(f"{flag} = 1")
+
+    if date_from is not None:
+        clauses.append("invoice_date >= ?")
+        params.append(str(pd.Timestamp(date_from).date()))
+    if date_to is not None:
+        clauses.append("invoice_date <= ?")
+        params.append(str(pd.Timestamp(date_to).date()))
+    if min_leakage is not None:
+        clauses.append("leakage_baseline >= ?")
+        params.append(float(min_leakage))
+    if validated_only:
+        clauses.append("validated_leakage = 1")
+
+    sql = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    return sql, params
+
+
+def query_cases(
+    con: sqlite3.Connection,
+    columns: Optional[list[str]] = None,
+    order_by: str = "leakage_baseline",
+    descending: bool = True,
+    limit: int = 100,
+    offset: int = 0,
+    **filters,
+) -> pd.DataFrame:
+    """
+    Filtered, ordered page of invoice cases. Filters are the keyword
+    arguments of `_where` (invoice_ids, customer_ids, product_ids, patterns, rule_flags,
+    date_from, date_to, min_leakage, validated_only).
+    """
+    columns = columns or list(CASE_COLUMNS)
+    bad = [c for c in columns + [order_by] if c not in CASE_COLUMNS]
+    if bad:
+        raise ValueError(f"Unknown columns: {bad}")
+
+    where, params = _where(**filters)
+    sql = (
+        f"SELECT {', '.join(columns)} FROM {TABLE}{where} "
+        f"ORDER BY {order_by} {'DESC' if descending else 'ASC'} LIMIT ? OFFSET ?"
+    )
+    return pd.read_sql_query(sql, con, params=params + [int(limit), int(offset)])
+
+
+def count_cases(con: sqlite3.Connection, **filters) -> int:
+    where, params = _where(**filters)
+    return int(con.execute(f"SELECT COUNT(*) FROM {TABLE}{where}", params).fetchone()[0])
+
+
+def summarize_cases(con: sqlite3.Connection, group_by: list[str], **filters) -> pd.DataFrame:
+    """Aggregations pushed down to the database (one row per group)."""
+    group_by = list(group_by)
+    if not group_by:
+        raise ValueError(f"summarize_cases needs at least one group_by column from {GROUPABLE}")
+    bad = [c for c in group_by if c not in GROUPABLE]
+    if bad:
+        raise ValueError(f"Cannot group by: {bad}")
+
+    where, params = _where(**filters)
+    keys = ", ".join(group_by)
+    sql = (
+        f"SELECT {keys}, COUNT(*) AS n_invoices, "
+        f"SUM(leakage_baseline) AS total_leakage, "
+        f"AVG(leakage_baseline) AS avg_leakage, "
+        f"SUM(validated_leakage) AS n_validated "
+        f"FROM {TABLE}{where} GROUP BY {keys} ORDER BY total_leakage DESC"
+    )
+    return pd.read_sql_query(sql, con, params=params)
+
+
+def distinct_values(con: sqlite3.Connection, column: str) -> list:
+    if column not in GROUPABLE:
+        raise ValueError(f"Unknown column: {column}")
+    rows = con.execute(
+        f"SELECT DISTINCT {column} FROM {TABLE} WHERE {column} IS NOT NULL ORDER BY {column}"
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish invoice-level outputs to the case database")
+    parser.add_argument("--db", default=str(DB_PATH))
+    args = parser.parse_args()
+
+    n = publish(Path(args.db))
+    print(f"[Publish] Wrote {n} invoices → {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.storage import case_db
+
+# ---------------- PATHS ----------------
+ROLLUP_DB_PATH = Path("data/processed/leakage_rollups.sqlite")
+
+# ---------------- CONFIG ----------------
+CELLS_TABLE = "leakage_rollup"
+PARTITIONS_TABLE = "rollup_partitions"   # one fingerprint per invoice month
+
+# finest grain of the cube; every summary is a roll-up of these cells
+DIMENSIONS = ["invoice_month", "customer_id", "product_id", "leakage_pattern"]
+
+RULE_COUNTS = {flag: "n_" + flag.removeprefix("any_") for flag in case_db.RULE_FLAGS}
+
+# additive measures only, so any roll-up is a SUM over cells
+MEASURES = {
+    "n_invoices": "INTEGER",
+    "billed_amount": "REAL",
+    "total_leakage": "REAL",
+    "n_validated": "INTEGER",
+    "validated_leakage_amount": "REAL",
+    **{col: "INTEGER" for col in RULE_COUNTS.values()},
+}
+
+SOURCE_COLUMNS = ["invoice_id", *DIMENSIONS, "billed_amount", "leakage_baseline",
+                  "validated_leakage", *case_db.RULE_FLAGS]
+
+
+# ---------------- STORE ----------------
+def _create_tables(con: sqlite3.Connection) -> None:
+    cols_sql = ", ".join(
+        [f"{d} TEXT" for d in DIMENSIONS] + [f"{m} {t}" for m, t in MEASURES.items()]
+    )
+    con.execute(f"CREATE TABLE IF NOT EXISTS {CELLS_TABLE} ({cols_sql})")
+    # month first: updates replace whole months, queries mostly filter on them
+    con.execute(f"CREATE INDEX IF NOT EXISTS idx_rollup_cell ON {CELLS_TABLE} ({', '.join(DIMENSIONS)})")
+    con.execute(f"CREATE INDEX IF NOT EXISTS idx_rollup_customer ON {CELLS_TABLE} (customer_id)")
+    con.execute(f"CREATE INDEX IF NOT EXISTS idx_rollup_product ON {CELLS_TABLE} (product_id)")
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {PARTITIONS_TABLE} ("
+        "invoice_month TEXT PRIMARY KEY, fingerprint TEXT, n_invoices INTEGER, updated_at TEXT)"
+    )
+
+
+def read_cases(case_con: sqlite3.Connection, months: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Invoice rows the cube is built from, optionally only for some months."""
+    clauses: list[str] = []
+    params: list = []
+    case_db._in_clause("invoice_month", months or [], clauses, params)
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    return pd.read_sql_query(
+        f"SELECT {', '.join(SOURCE_COLUMNS)} FROM {case_db.TABLE}{where}", case_con, params=params
+    )
+
+
+def month_fingerprints(cases: pd.DataFrame) -> pd.Series:
+    """
+    Order-independent content hash per invoice month: the (wrapping) uint64
+    sum of the row hashes. Any changed, added or removed invoice changes it.
+    """
+    hashes = pd.util.hash_pandas_object(cases[SOURCE_COLUMNS], index=False)
+    return hashes.groupby(cases["invoice_month"].to_numpy()).sum().map(lambda h: f"{h:016x}")
+
+
+def aggregate_cells(cases: pd.DataFrame) -> pd.DataFrame:
+    """Invoice rows -> cube cells (one row per dimension combination)."""
+    validated = cases["validated_leakage"].fillna(0).astype(np.int64)
+    df = cases[DIMENSIONS].assign(
+        billed_amount=cases["billed_amount"],
+        total_leakage=cases["leakage_baseline"],
+        n_validated=validated,
+        validated_leakage_amount=cases["leakage_baseline"].where(validated == 1, 0.0),
+        **{col: cases[flag].fillna(0).astype(np.int64) for flag, col in RULE_COUNTS.items()},
+    )
+    grouped = df.groupby(DIMENSIONS, dropna=False, sort=False)
+    cells = grouped.sum(min_count=1)
+    cells.insert(0, "n_invoices", grouped.size())
+    return cells.reset_index()[DIMENSIONS + list(MEASURES)]
+
+
+def update_rollups(
+    case_db_path: Path = case_db.DB_PATH,
+    rollup_path: Path = ROLLUP_DB_PATH,
+    months: Optional[Iterable[str]] = None,
+    rebuild: bool = False,
+) -> dict:
+    """
+    Bring the cube in line with the published case database, re-aggregating
+    only the invoice months whose content changed since the last update
+    (or only `months`, when the caller already knows what changed).
+    Cells of a month are replaced in one transaction, so readers always see
+    a whole month either before or after the update.
+    """
+    case_con = case_db.connect(case_db_path)
+    try:
+        cases = read_cases(case_con, months)
+    finally:
+        case_con.close()
+    cases = cases[cases["invoice_month"].notna()]
+
+    rollup_path = Path(rollup_path)
+    rollup_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(rollup_path)
+    try:
+        if rebuild:
+            con.execute(f"DROP TABLE IF EXISTS {CELLS_TABLE}")
+            con.execute(f"DROP TABLE IF EXISTS {PARTITIONS_TABLE}")
+        _create_tables(con)
+
+        stored = dict(con.execute(f"SELECT invoice_month, fingerprint FROM {PARTITIONS_TABLE}").fetchall())
+        current = month_fingerprints(cases)
+        changed = sorted(m for m, fp in current.items() if stored.get(m) != fp)
+        # months that no longer exist (only knowable on a full scan)
+        removed = [] if months is not None else sorted(set(stored) - set(current.index))
+
+        cells = aggregate_cells(cases[cases["invoice_month"].isin(changed)])
+        records = cells.astype(object).where(cells.notna(), None)
+        counts = cases["invoice_month"].value_counts()
+        updated_at = pd.Timestamp.now().isoformat(timespec="seconds")
+
+        with con:
+            stale = changed + removed
+            for start in range(0, len(stale), 500):
+                batch = stale[start:start + 500]
+                marks = ", ".join("?" for _ in batch)
+                con.execute(f"DELETE FROM {CELLS_TABLE} WHERE invoice_month IN ({marks})", batch)
+                con.execute(f"DELETE FROM {PARTITIONS_TABLE} WHERE invoice_month IN ({marks})", batch)
+            con.executemany(
+                f"INSERT INTO {CELLS_TABLE} VALUES ({', '.join('?' for _ in records.columns)})",
+                records.itertuples(index=False, name=None),
+            )
+            con.executemany(
+                f"INSERT INTO {PARTITIONS_TABLE} VALUES (?, ?, ?, ?)",
+                [(m, current[m], int(counts[m]), updated_at) for m in changed],
+            )
+        n_cells = con.execute(f"SELECT COUNT(*) FROM {CELLS_TABLE}").fetchone()[0]
+    finally:
+        con.close()
+
+    return {
+        "months_scanned": len(current),
+        "months_updated": changed,
+        "months_removed": removed,
+        "cells_written": len(cells),
+        "cells_total": int(n_cells),
+    }
+
+
+# ---------------- QUERY API ----------------
+def connect(rollup_path: Path = ROLLUP_DB_PATH) -> sqlite3.Connection:
+    if not Path(rollup_path).exists():
+        raise FileNotFoundError(f"Missing rollup database: {rollup_path} (run rollups first)")
+    return sqlite3.connect(f"file:{Path(rollup_path).as_posix()}?mode=ro", uri=True, check_same_thread=False)
+
+
+def query_rollup(
+    con: sqlite3.Connection,
+    group_by: Iterable[str] = ("invoice_month",),
+    customer_ids: Optional[Iterable[str]] = None,
+    product_ids: Optional[Iterable[str]] = None,
+    patterns: Optional[Iterable[str]] = None,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Leakage totals rolled up to `group_by` (any subset of DIMENSIONS; empty =
+    grand total). Reads cube cells only, so the cost scales with the number
+    of cells, not invoices. Months are YYYY-MM (dates are truncated).
+    """
+    group_by = list(group_by)
+    bad = [c for c in group_by if c not in DIMENSIONS]
+    if bad:
+        raise ValueError(f"Cannot group by: {bad}")
+
+    clauses: list[str] = []
+    params: list = []
+    case_db._in_clause("customer_id", customer_ids or [], clauses, params)
+    case_db._in_clause("product_id", product_ids or [], clauses, params)
+    case_db._in_clause("leakage_pattern", patterns or [], clauses, params)
+    if month_from is not None:
+        clauses.append("invoice_month >= ?")
+        params.append(pd.Timestamp(month_from).strftime("%Y-%m"))
+    if month_to is not None:
+        clauses.append("invoice_month <= ?")
+        params.append(pd.Timestamp(month_to).strftime("%Y-%m"))
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    sums = ", ".join(f"SUM({m}) AS {m}" for m in MEASURES)
+    keys = ", ".join(group_by)
+    sql = f"SELECT {keys + ', ' if keys else ''}{sums} FROM {CELLS_TABLE}{where}"
+    if keys:
+        sql += f" GROUP BY {keys} ORDER BY total_leakage DESC"
+    return pd.read_sql_query(sql, con, params=params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally update the leakage rollup cube")
+    parser.add_argument("--db", default=str(case_db.DB_PATH), help="Published case database")
+    parser.add_argument("--out", default=str(ROLLUP_DB_PATH))
+    parser.add_argument("--months", nargs="+", help="Only re-check these invoice months (YYYY-MM)")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the cube and rebuild every month")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = update_rollups(Path(args.db), Path(args.out), args.months, args.rebuild)
+    print(
+        f"[Rollups] {len(stats['months_updated'])}/{stats['months_scanned']} months re-aggregated, "
+        f"{len(stats['months_removed'])} removed, {stats['cells_written']} cells written "
+        f"({stats['cells_total']} total) in {time.perf_counter() - started:.2f}s → {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Levels 0-5A on the synthetic data (~20 s), for tests that need trained models
+PIPELINE = ["generate-data", "merge", "features", "anomaly", "baseline"]
+
+
+@pytest.fixture(scope="session")
+def pipeline_dir(tmp_path_factory):
+    """A project directory with raw data, processed outputs and registered models."""
+    root = tmp_path_factory.mktemp("pipeline")
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    for command in PIPELINE:
+        subprocess.run(
+            [sys.executable, "-c", f"from src.cli import run_command; run_command({command!r}, [])"],
+            cwd=root, env=env, check=True, capture_output=True,
+        )
+    return root
+
+
+@pytest.fixture
+def in_pipeline_dir(pipeline_dir, monkeypatch):
+    """Run the test from `pipeline_dir` (every level's paths are relative), with a fresh registry cache."""
+    from src.models import registry
+
+    monkeypatch.chdir(pipeline_dir)
+    registry.clear_cache()
+    yield pipeline_dir
+    registry.clear_cache()
@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+from src.serving.score_invoice import AgeClock
+
+
+def _batch(*dates):
+    return pd.DataFrame({"invoice_date": list(dates)})
+
+
+def test_event_clock_is_the_latest_invoice_date_seen():
+    clock = AgeClock("event")
+    assert clock.reference_date(_batch("2024-03-01", "2024-03-05")) == pd.Timestamp("2024-03-05")
+    # a late batch is aged against the watermark, never moves it back
+    assert clock.reference_date(_batch("2024-02-01")) == pd.Timestamp("2024-03-05")
+    assert clock.reference_date(_batch("2024-04-01", "not a date")) == pd.Timestamp("2024-04-01")
+
+
+def test_wall_clock_is_today():
+    assert AgeClock("wall").reference_date(_batch("2019-01-01")).normalize() == pd.Timestamp.today().normalize()
+
+
+def test_unknown_clock_is_rejected():
+    with pytest.raises(ValueError):
+        AgeClock("server")
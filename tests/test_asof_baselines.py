@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.features.build_features import compute_asof_baselines, compute_customer_baselines
+from src.pipeline.partitioned import map_customer_stats, reduce_customer_baselines
+
+
+def _invoices(dates, prices):
+    return pd.DataFrame({
+        "invoice_id": [f"INV{i}" for i in range(len(dates))],
+        "customer_id": "C1",
+        "invoice_date": pd.to_datetime(dates),
+        "unit_price": prices,
+        "quantity": [10.0] * len(dates),
+        "discount_pct": [0.0] * len(dates),
+    })
+
+
+def _expected_ewm(dates, prices, halflife_days):
+    # direct definition: weights 0.5 ** ((t - d) / h) over strictly earlier days
+    days = pd.to_datetime(dates)
+    out = []
+    for t in days:
+        past = days < t
+        if not past.any():
+            out.append(np.nan)
+            continue
+        w = 0.5 ** (((t - days[past]) / pd.Timedelta(days=1)) / halflife_days)
+        out.append(float(np.sum(w * np.asarray(prices)[past]) / np.sum(w)))
+    return np.array(out)
+
+
+@pytest.mark.parametrize("halflife_days, gap", [(7, "365D"), (30, "1826D")])
+def test_ewm_baseline_survives_multi_year_gap(halflife_days, gap):
+    start = pd.Timestamp("2019-01-01")
+    dates = [start, start + pd.Timedelta("3D"), start + pd.Timedelta("10D")]
+    dates.append(dates[-1] + pd.Timedelta(gap))
+    prices = [100.0, 110.0, 120.0, 90.0]
+
+    got = compute_asof_baselines(_invoices(dates, prices), mode="ewm", halflife=f"{halflife_days}D")
+
+    expected = _expected_ewm(dates, prices, halflife_days)
+    np.testing.assert_allclose(got["cust_avg_unit_price"].to_numpy(), expected, rtol=1e-9)
+    # three prior invoices: the invoice after the gap gets a real baseline, not NaN
+    assert np.isfinite(got["cust_avg_unit_price"].iloc[-1])
+
+
+def test_ewm_baseline_same_day_invoices_do_not_see_each_other():
+    dates = ["2020-01-01", "2020-01-05", "2020-01-05"]
+    got = compute_asof_baselines(_invoices(dates, [100.0, 50.0, 70.0]), mode="ewm", halflife="30D")
+    assert np.isnan(got["cust_avg_unit_price"].iloc[0])
+    np.testing.assert_allclose(got["cust_avg_unit_price"].iloc[1:], [100.0, 100.0])
+
+
+def _fanned_out(df, usage_rows):
+    # unified rows repeat each invoice once per usage record
+    return df.loc[df.index.repeat(usage_rows)].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("mode", ["static", "expanding"])
+def test_customer_baselines_weight_each_invoice_once(mode):
+    inv = _invoices(["2020-01-01", "2020-02-01", "2020-03-01"], [100.0, 200.0, 600.0])
+    got = compute_customer_baselines(_fanned_out(inv, [1, 9, 2]), mode=mode)
+    assert got["cust_avg_unit_price"].tolist() == [300.0]
+
+
+def test_partitioned_static_baselines_match_single_frame(tmp_path):
+    inv = pd.concat([
+        _invoices(["2020-01-01", "2020-01-20"], [100.0, 200.0]),
+        _invoices(["2020-02-03"], [600.0]).assign(invoice_id="INV9", customer_id="C2"),
+    ], ignore_index=True)
+    rows = _fanned_out(inv, [3, 1, 5]).assign(usage_date=lambda d: d["invoice_date"])
+    parts = []
+    for month, part in rows.groupby(rows["invoice_date"].dt.month):
+        path = tmp_path / f"{month}.csv"
+        part.to_csv(path, index=False)
+        parts.append(map_customer_stats(path))
+
+    got = reduce_customer_baselines(parts).set_index("customer_id")
+    expected = compute_customer_baselines(rows, mode="static").set_index("customer_id")
+    pd.testing.assert_frame_equal(got.sort_index(), expected.sort_index(), check_names=False)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.storage import case_db
+
+
+def _cases():
+    n = 6
+    cases = pd.DataFrame({col: [None] * n for col in case_db.CASE_COLUMNS})
+    cases["invoice_id"] = [f"INV{i}" for i in range(n)]
+    cases["customer_id"] = ["C1", "C1", "C2", "C2", "C3", "C3"]
+    cases["product_id"] = ["P1", "P2", "P1", "P2", "P1", "P2"]
+    cases["invoice_date"] = ["2024-01-05", "2024-01-20", "2024-02-03", "2024-02-28", "2024-03-01", "2024-03-15"]
+    cases["invoice_month"] = cases["invoice_date"].str[:7]
+    cases["leakage_baseline"] = [50.0, 5.0, 80.0, -10.0, 30.0, 0.0]
+    cases["validated_leakage"] = [1, 0, 1, 0, 0, 0]
+    cases["any_discount_violation"] = [1, 0, 0, 0, 1, 0]
+    cases["leakage_pattern"] = ["discount", None, "pricing", None, "discount", None]
+    return cases
+
+
+@pytest.fixture
+def con(tmp_path, monkeypatch):
+    monkeypatch.setattr(case_db, "build_case_frame", _cases)
+    db_path = tmp_path / "cases.sqlite"
+    case_db.publish(db_path)
+    con = case_db.connect(db_path)
+    yield con
+    con.close()
+
+
+def _ids(frame):
+    return sorted(frame["invoice_id"])
+
+
+@pytest.mark.parametrize("make", [list, pd.Series, np.array, tuple])
+def test_id_filters_accept_any_iterable(con, make):
+    got = case_db.query_cases(con, invoice_ids=make(["INV0", "INV2"]), customer_ids=make(["C1"]))
+    assert _ids(got) == ["INV0"]
+
+
+def test_filters_combine(con):
+    assert _ids(case_db.query_cases(con, date_from="2024-01-20", date_to="2024-03-01")) == [
+        "INV1", "INV2", "INV3", "INV4"
+    ]
+    assert _ids(case_db.query_cases(con, min_leakage=30, validated_only=True)) == ["INV0", "INV2"]
+    assert _ids(case_db.query_cases(con, rule_flags=pd.Series(["any_discount_violation"]))) == ["INV0", "INV4"]
+    assert _ids(case_db.query_cases(con, patterns=["discount"], product_ids=["P1"])) == ["INV0", "INV4"]
+    assert case_db.count_cases(con, customer_ids=["C2", "C3"], min_leakage=0) == 3
+
+
+def test_query_orders_and_pages(con):
+    page = case_db.query_cases(con, columns=["invoice_id"], limit=2, offset=1)
+    assert page["invoice_id"].tolist() == ["INV0", "INV4"]
+
+
+def test_summary_groups_in_the_database(con):
+    summary = case_db.summarize_cases(con, ["customer_id"], validated_only=False)
+    assert summary["customer_id"].tolist() == ["C2", "C1", "C3"]
+    assert summary["total_leakage"].tolist() == [70.0, 55.0, 30.0]
+    assert summary["n_validated"].tolist() == [1, 1, 0]
+
+
+def test_invalid_requests_are_rejected(con):
+    with pytest.raises(ValueError, match="at least one group_by"):
+        case_db.summarize_cases(con, [])
+    with pytest.raises(ValueError):
+        case_db.summarize_cases(con, ["explanation_text"])
+    with pytest.raises(ValueError):
+        case_db.query_cases(con, rule_flags=["not_a_flag"])
+    with pytest.raises(ValueError):
+        case_db.query_cases(con, order_by="1; DROP TABLE invoice_cases")
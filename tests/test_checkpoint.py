@@ -0,0 +1,98 @@
+import json
+import shutil
+
+import pytest
+
+from src.models import registry
+from src.pipeline import partitioned
+from src.pipeline.checkpoint import Checkpoint, atomic_write
+
+
+def test_resume_keeps_finished_units_only_under_the_same_key(tmp_path):
+    first = Checkpoint("stage", "key-1", root=tmp_path)
+    first.mark_done("part-0", rows=10)
+
+    resumed = Checkpoint("stage", "key-1", resume=True, root=tmp_path)
+    assert resumed.is_done("part-0") and resumed.info("part-0") == {"rows": 10}
+    assert resumed.resumed == 1
+
+    assert not Checkpoint("stage", "key-2", resume=True, root=tmp_path).is_done("part-0")
+    first.mark_done("part-0")
+    assert not Checkpoint("stage", "key-1", resume=False, root=tmp_path).is_done("part-0")
+
+
+def test_complete_removes_the_checkpoint(tmp_path):
+    checkpoint = Checkpoint("stage", "key", root=tmp_path)
+    checkpoint.mark_done("part-0")
+    checkpoint.complete()
+    assert not (tmp_path / "stage").exists()
+    assert not Checkpoint("stage", "key", resume=True, root=tmp_path).is_done("part-0")
+
+
+def test_failed_atomic_write_keeps_the_previous_file(tmp_path):
+    path = tmp_path / "out.csv"
+    path.write_text("old")
+
+    def crash(tmp):
+        tmp.write_text("partial")
+        raise RuntimeError("interrupted")
+
+    with pytest.raises(RuntimeError):
+        atomic_write(path, crash)
+    assert path.read_text() == "old"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.csv"]
+
+
+# ---------------- PARTITIONED RUN ----------------
+OUTPUTS = [
+    "data/processed/billing_features.csv",
+    "data/processed/billing_anomaly_scores.csv",
+    "data/processed/invoice_validation_all.csv",
+    "data/processed/validated_leakage_cases.csv",
+]
+_map_validation = partitioned.map_validation
+
+
+def _interrupted_validation(unified_path, *args):
+    # worker processes are forked after the patch, so they run this too
+    if unified_path.name == "part-00001.csv":
+        raise RuntimeError("worker lost")
+    return _map_validation(unified_path, *args)
+
+
+def _project(pipeline_dir, tmp_path, name, monkeypatch):
+    root = tmp_path / name
+    shutil.copytree(pipeline_dir, root)
+    monkeypatch.chdir(root)
+    registry.clear_cache()
+    return root
+
+
+def _run(resume=False):
+    partitioned.run_partitioned("customer", 3, 2, resume=resume)
+
+
+def test_interrupted_partitioned_run_resumes_to_the_same_outputs(pipeline_dir, tmp_path, monkeypatch, capsys):
+    straight = _project(pipeline_dir, tmp_path, "straight", monkeypatch)
+    _run()
+    expected = {path: (straight / path).read_bytes() for path in OUTPUTS}
+
+    resumed = _project(pipeline_dir, tmp_path, "resumed", monkeypatch)
+    with monkeypatch.context() as patch:
+        patch.setattr(partitioned, "map_validation", _interrupted_validation)
+        with pytest.raises(RuntimeError, match="worker lost"):
+            _run()
+    manifest = json.loads((resumed / "data/checkpoints/partitioned_customer/manifest.json").read_text())
+    assert "detector" in manifest["done"]
+    assert "validation/part-00001.csv" not in manifest["done"]
+    capsys.readouterr()
+
+    _run(resume=True)
+
+    out = capsys.readouterr().out
+    assert "features: 3 partitions resumed, 0 run" in out
+    assert "scores: 3 partitions resumed, 0 run" in out
+    # the detector is not refitted: one registered version, from the first attempt
+    assert registry.versions("anomaly_iforest") == registry.versions("anomaly_iforest", straight / "models/registry")
+    assert {path: (resumed / path).read_bytes() for path in OUTPUTS} == expected
+    assert not (resumed / "data/checkpoints/partitioned_customer").exists()
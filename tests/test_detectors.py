@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from src.models import anomaly_detection, registry
+from src.models.detectors import DETECTORS, _TailDetector, detector_name, weighted_percentile
+
+
+@pytest.fixture
+def fresh_registry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry.clear_cache()
+    yield tmp_path
+    registry.clear_cache()
+
+
+def _features(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.normal(size=(n, 3)), columns=["a", "b", "c"])
+
+
+@pytest.mark.parametrize("detector", ["iforest", "hbos"])
+def test_each_detector_has_its_own_registry_entry(fresh_registry, detector):
+    X = _features()
+    scaler, model = anomaly_detection.fit_detector(X, detector)
+    version = anomaly_detection.save_detector(scaler, model, X.columns, X_train=X)
+
+    assert registry.versions(f"anomaly_{detector}") == [version]
+    assert detector_name(anomaly_detection.load_detector(detector).model) == detector
+
+
+def test_fitting_another_detector_does_not_shadow_the_default(fresh_registry):
+    X = _features()
+    for detector in ["iforest", "ecod"]:
+        anomaly_detection.save_detector(*anomaly_detection.fit_detector(X, detector), X.columns)
+
+    assert detector_name(anomaly_detection.load_detector().model) == "iforest"
+    assert detector_name(anomaly_detection.load_detector("ecod").model) == "ecod"
+
+
+def test_entry_holding_another_detector_is_rejected(fresh_registry):
+    # e.g. an hbos model registered under the old shared name
+    X = _features()
+    scaler, model = anomaly_detection.fit_detector(X, "hbos")
+    registry.register("anomaly_iforest", model, X.columns, scaler=scaler)
+
+    with pytest.raises(ValueError, match="'hbos' detector"):
+        anomaly_detection.load_detector("iforest")
+
+
+def test_tail_detectors_implement_the_abstract_hooks():
+    with pytest.raises(TypeError):
+        _TailDetector()
+    for cls in DETECTORS.values():
+        if isinstance(cls, type):
+            assert not cls.__abstractmethods__
+
+
+def test_weighted_cutoff_on_deduplicated_rows_matches_full_data():
+    rng = np.random.default_rng(1)
+    unique = _features(n=200, seed=2)
+    counts = rng.integers(1, 8, size=len(unique))
+    full = unique.loc[unique.index.repeat(counts)].reset_index(drop=True)
+
+    # same model, so only the cut-off differs between the two paths
+    scaler, iso = anomaly_detection.fit_detector(full)
+    scores_full = iso.score_samples(scaler.transform(full))
+    scores_unique = iso.score_samples(scaler.transform(unique))
+
+    q = 100.0 * anomaly_detection.CONTAMINATION
+    expected = np.percentile(scores_full, q, method="inverted_cdf")
+    assert weighted_percentile(scores_unique, counts, q) == expected
+    assert weighted_percentile(scores_full, np.ones(len(full)), q) == expected
+
+
+def test_sample_weight_fit_uses_the_full_data_cutoff_and_scaler():
+    rng = np.random.default_rng(3)
+    unique = _features(n=200, seed=4)
+    counts = rng.integers(1, 8, size=len(unique))
+    full = unique.loc[unique.index.repeat(counts)].reset_index(drop=True)
+
+    scaler, iso = anomaly_detection.fit_detector(unique, sample_weight=counts)
+    full_scaler = StandardScaler().fit(full)
+    np.testing.assert_allclose(scaler.mean_, full_scaler.mean_)
+    np.testing.assert_allclose(scaler.var_, full_scaler.var_)
+
+    q = 100.0 * anomaly_detection.CONTAMINATION
+    scores_full = iso.score_samples(scaler.transform(full))
+    assert iso.offset_ == np.percentile(scores_full, q, method="inverted_cdf")
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from src.data.schema import FEATURE_SCHEMA, apply_schema, read_unified
+from src.features.build_features import FEATURE_COLS, INPUT_PATH, compute_features, compute_features_cached
+from src.storage.blob_cache import BlobCache
+
+
+@pytest.fixture
+def unified(in_pipeline_dir):
+    df = read_unified(INPUT_PATH)
+    # a few hundred invoices keep the test quick
+    keep = df["invoice_id"].drop_duplicates().iloc[:300]
+    df = df[df["invoice_id"].isin(keep)].reset_index(drop=True)
+    for col in df.select_dtypes("category"):
+        df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with BlobCache(tmp_path / "feature_cache.sqlite") as cache:
+        yield cache
+
+
+def _uncached(df, **kwargs):
+    features = compute_features(df.copy(), **kwargs)
+    return apply_schema(features[["invoice_id"] + FEATURE_COLS].copy(), FEATURE_SCHEMA)
+
+
+def test_cache_hits_reproduce_uncached_features(unified, cache):
+    expected = _uncached(unified)
+    n_invoices = unified["invoice_id"].nunique()
+
+    cold = compute_features_cached(unified.copy(), cache)
+    assert (cache.hits, cache.misses) == (0, n_invoices)
+    warm = compute_features_cached(unified.copy(), cache)
+    assert (cache.hits, cache.misses) == (n_invoices, n_invoices)
+
+    pd.testing.assert_frame_equal(cold, expected)
+    pd.testing.assert_frame_equal(warm, expected)
+
+
+def test_only_changed_invoices_are_recomputed(unified, cache):
+    compute_features_cached(unified.copy(), cache)
+
+    edited = unified.copy()
+    # an invoice without as-of dependents: the customer's latest one
+    target = edited.sort_values("invoice_date").drop_duplicates("customer_id", keep="last")["invoice_id"].iloc[0]
+    edited.loc[edited["invoice_id"] == target, "discount_pct"] += 5.0
+    hits_before, misses_before = cache.hits, cache.misses
+
+    got = compute_features_cached(edited.copy(), cache)
+
+    assert cache.misses - misses_before == 1
+    assert cache.hits - hits_before == unified["invoice_id"].nunique() - 1
+    pd.testing.assert_frame_equal(got, _uncached(edited))
+
+
+def test_invoice_age_follows_the_reference_date_on_hits(unified, cache):
+    compute_features_cached(unified.copy(), cache)
+    later = pd.Timestamp(unified["invoice_date"].max()) + pd.Timedelta(days=30)
+
+    got = compute_features_cached(unified.copy(), cache, reference_date=later)
+
+    assert cache.misses == unified["invoice_id"].nunique()   # nothing recomputed
+    pd.testing.assert_frame_equal(got, _uncached(unified, reference_date=later))
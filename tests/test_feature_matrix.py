@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.schema import read_features
+from src.features.feature_matrix import (
+    FEATURE_COLS,
+    FEATURES_PATH,
+    load_features,
+    open_feature_matrix,
+    write_feature_matrix,
+)
+
+
+def _features(n=40, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n, len(FEATURE_COLS))), columns=FEATURE_COLS)
+    df.iloc[3, 2] = np.nan
+    df.insert(0, "invoice_id", [f"INV{i % 15}" for i in range(n)])   # several rows per invoice
+    return df
+
+
+@pytest.fixture
+def written(tmp_path):
+    df = _features()
+    source, path = tmp_path / "features.csv", tmp_path / "features.matrix.npy"
+    df.to_csv(source, index=False)
+    # streamed in uneven chunks, as the partitioned driver does
+    write_feature_matrix([df.iloc[:7], df.iloc[7:30], df.iloc[30:]], len(df), source, path)
+    return df, source, path
+
+
+def test_matrix_round_trips_the_features(written):
+    df, source, path = written
+    matrix = open_feature_matrix(source, path)
+
+    assert matrix.columns == FEATURE_COLS
+    assert matrix.values.dtype == np.float32 and isinstance(matrix.values, np.memmap)
+    expected = np.nan_to_num(df[FEATURE_COLS].to_numpy(dtype=np.float32), nan=0.0)
+    np.testing.assert_array_equal(matrix.values, expected)
+    assert matrix.invoice_series().astype(str).tolist() == df["invoice_id"].tolist()
+
+    frame = matrix.frame()
+    assert list(frame.columns) == ["invoice_id"] + FEATURE_COLS
+    assert np.shares_memory(frame[FEATURE_COLS[0]].to_numpy(), matrix.values)
+
+
+def test_column_views_avoid_copies_when_adjacent(written):
+    _, source, path = written
+    matrix = open_feature_matrix(source, path)
+    assert np.shares_memory(matrix.columns_view(FEATURE_COLS[1:4]), matrix.values)
+    np.testing.assert_array_equal(
+        matrix.columns_view([FEATURE_COLS[4], FEATURE_COLS[0]]), matrix.values[:, [4, 0]]
+    )
+
+
+def test_rewritten_csv_makes_the_matrix_stale(written):
+    df, source, path = written
+    changed = df.assign(**{FEATURE_COLS[0]: df[FEATURE_COLS[0]] + 1})
+    changed.to_csv(source, index=False)
+    os.utime(source, ns=(0, 0))   # a new version even on coarse-mtime filesystems
+
+    assert open_feature_matrix(source, path) is None
+    np.testing.assert_allclose(load_features(source, path)[FEATURE_COLS[0]], changed[FEATURE_COLS[0]])
+
+
+def test_row_count_mismatch_is_rejected(tmp_path):
+    df = _features()
+    with pytest.raises(ValueError, match="Expected"):
+        write_feature_matrix([df], len(df) + 1, tmp_path / "features.csv", tmp_path / "m.npy")
+
+
+def test_pipeline_matrix_matches_the_csv(in_pipeline_dir):
+    mapped = load_features()
+    parsed = read_features(FEATURES_PATH)
+
+    assert mapped["invoice_id"].astype(str).tolist() == parsed["invoice_id"].astype(str).tolist()
+    np.testing.assert_allclose(
+        mapped[FEATURE_COLS].to_numpy(),
+        parsed[FEATURE_COLS].fillna(0).to_numpy(dtype=np.float32),
+    )
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.load_validate import REQUIRED_SCHEMAS, SeenIds, load_and_validate
+
+
+def test_seen_ids_matches_duplicated_across_chunks():
+    rng = np.random.default_rng(0)
+    ids = pd.Series([f"INV{i}" for i in rng.integers(0, 400, size=2000)])
+
+    seen = SeenIds()
+    got = np.concatenate([seen.duplicated(ids.iloc[i:i + 300]) for i in range(0, len(ids), 300)])
+
+    np.testing.assert_array_equal(got, ids.duplicated().to_numpy())
+    # one sorted entry per distinct id
+    assert len(seen.hashes) == ids.nunique()
+    assert (np.diff(seen.hashes.astype(np.float64)) >= 0).all()
+
+
+def _invoice_rows():
+    return pd.DataFrame({
+        "invoice_id": ["INV1", "INV2", "INV1"],
+        "customer_id": ["C1", "C1", "C2"],
+        "product_id": ["P1", "P2", "P1"],
+        "invoice_date": ["2024-01-01", "2024-01-02", "2024-01-03"],
+        "quantity": [2, 1, 3],
+        "unit_price": [10.0, 5.0, 1.0],
+        "discount_pct": [0, 0, 0],
+        "billed_amount": [20.0, 5.0, 3.0],
+    })
+
+
+def test_duplicate_invoice_ids_are_quarantined_across_chunks(tmp_path):
+    _invoice_rows().to_csv(tmp_path / "invoices.csv", index=False)
+
+    clean, quarantined = load_and_validate("invoices", chunk_size=1, raw_path=tmp_path)
+
+    assert clean["invoice_id"].tolist() == ["INV1", "INV2"]
+    assert quarantined["source_row"].tolist() == [2]
+    assert quarantined["reason_codes"].tolist() == ["duplicate_invoice_id"]
+
+
+@pytest.mark.parametrize("content", ["", ",".join(REQUIRED_SCHEMAS["invoices"]) + "\n"])
+def test_empty_file_loads_as_an_empty_table(tmp_path, content):
+    (tmp_path / "invoices.csv").write_text(content)
+
+    clean, quarantined = load_and_validate("invoices", raw_path=tmp_path)
+
+    assert clean.empty and quarantined is None
+    assert list(clean.columns) == REQUIRED_SCHEMAS["invoices"]
+    assert pd.api.types.is_datetime64_any_dtype(clean["invoice_date"])
+
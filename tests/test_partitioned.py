@@ -0,0 +1,29 @@
+import sys
+
+import pytest
+
+from src.pipeline import partitioned
+
+
+def _main(monkeypatch, *argv):
+    calls = []
+    monkeypatch.setattr(partitioned, "run_partitioned", lambda *args: calls.append(args))
+    monkeypatch.setattr(sys, "argv", ["partitioned", *argv])
+    partitioned.main()
+    return calls[0]
+
+
+def test_month_partitions_default_to_static_baselines(monkeypatch):
+    args = _main(monkeypatch, "--by", "month")
+    assert args[0] == "month" and args[4] == "static"
+
+
+def test_customer_partitions_keep_the_default_baseline_mode(monkeypatch):
+    assert _main(monkeypatch, "--by", "customer")[4] == partitioned.BASELINE_MODE
+
+
+def test_month_partitions_reject_as_of_baselines(monkeypatch, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        _main(monkeypatch, "--by", "month", "--baseline-mode", "expanding")
+    assert exit_info.value.code == 2
+    assert "--by customer" in capsys.readouterr().err
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from src.models.pattern_labeling import (
+    FALLBACK_LABEL,
+    PATTERN_FEATURES,
+    assign_patterns,
+    build_reference,
+    load_reference,
+    name_clusters,
+    save_reference,
+)
+
+# leakage_baseline, unit_price_mean, quantity_mean, discount_pct_mean, usage_ratio_mean
+CENTROIDS = np.array([
+    [0.0, 0.0, 0.0, 3.0, 0.0],    # discount
+    [0.0, 0.0, 0.0, 2.5, -1.0],   # discount-ish, but the only underbilled usage
+    [0.5, -2.0, 0.0, 0.0, 0.0],   # below-list price
+    [0.0, 0.0, 0.0, 0.0, 0.0],
+])
+MEAN = np.zeros(len(PATTERN_FEATURES))
+SCALE = np.ones(len(PATTERN_FEATURES))
+
+
+def test_each_signature_names_one_cluster():
+    # per-cluster argmax would call the first two "Discount-Driven Leakage";
+    # the assignment maximizes the total score with each name used once
+    assert name_clusters(CENTROIDS, PATTERN_FEATURES) == [
+        "Discount-Driven Leakage",
+        "Usage Underbilling",
+        "Pricing / Rate Mismatch",
+        FALLBACK_LABEL,
+    ]
+
+
+def test_refit_keeps_cluster_ids_and_labels():
+    first = build_reference(CENTROIDS, MEAN, SCALE, PATTERN_FEATURES)
+
+    # same clusters, shuffled and nudged, plus one new cluster
+    order = [2, 0, 3, 1]
+    refit = np.vstack([CENTROIDS[order] + 0.05, [[4.0, 0.0, 0.0, 0.0, 0.0]]])
+    second = build_reference(refit, MEAN, SCALE, PATTERN_FEATURES, previous=first)
+
+    before = {c["cluster_id"]: c["label"] for c in first["clusters"]}
+    after = {c["cluster_id"]: c["label"] for c in second["clusters"]}
+    assert {k: after[k] for k in before} == before
+    assert set(after) - set(before) == {4}
+
+
+def test_assign_patterns_uses_the_nearest_reference_centroid(tmp_path):
+    reference = build_reference(CENTROIDS, MEAN, SCALE, PATTERN_FEATURES)
+    save_reference(reference, tmp_path / "reference.json")
+    reference = load_reference(tmp_path / "reference.json")
+
+    X = pd.DataFrame(CENTROIDS[[2, 0]] + 0.1, columns=PATTERN_FEATURES, index=[10, 11])
+    got = assign_patterns(X, reference)
+
+    assert got.index.tolist() == [10, 11]
+    assert got["leakage_cluster_id"].tolist() == [2, 0]
+    assert got["leakage_pattern"].tolist() == ["Pricing / Rate Mismatch", "Discount-Driven Leakage"]
+    np.testing.assert_allclose(got["pattern_distance"], np.sqrt(5 * 0.1 ** 2))
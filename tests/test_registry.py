@@ -0,0 +1,87 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.preprocessing import StandardScaler
+
+from src.models import registry
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    registry.clear_cache()
+    yield
+    registry.clear_cache()
+
+
+def _fit(seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(50, 2)), columns=["a", "b"])
+    y = X["a"] * 2 + seed
+    return LinearRegression().fit(X, y), X, y
+
+
+def test_versions_are_numbered_and_pinnable(tmp_path):
+    first, X, y = _fit(0)
+    second, _, _ = _fit(1)
+    v1 = registry.register("revenue", first, X.columns, train_data=(X, y), metrics={"mae": 1.5}, root=tmp_path)
+    v2 = registry.register("revenue", second, X.columns, scaler=StandardScaler().fit(X), root=tmp_path)
+
+    assert (v1, v2) == ("v0001", "v0002")
+    assert registry.versions("revenue", tmp_path) == ["v0001", "v0002"]
+
+    latest = registry.load("revenue", root=tmp_path)
+    pinned = registry.load("revenue", "v0001", root=tmp_path)
+    assert latest.version == "v0002" and latest.scaler is not None
+    assert pinned.scaler is None
+    assert pinned.feature_cols == ["a", "b"]
+    assert pinned.metadata["metrics"] == {"mae": 1.5}
+    assert pinned.metadata["training_data_hash"] == registry.data_fingerprint(X, y)
+    np.testing.assert_allclose(pinned.model.predict(X), first.predict(X))
+
+
+def test_a_half_written_version_is_never_visible(tmp_path):
+    model, X, _ = _fit()
+    registry.register("revenue", model, X.columns, root=tmp_path)
+    # a crashed register() leaves only its temp directory behind
+    (tmp_path / "revenue" / ".v0002.tmp").mkdir()
+
+    assert registry.latest_version("revenue", tmp_path) == "v0001"
+    assert registry.register("revenue", model, X.columns, root=tmp_path) == "v0002"
+    assert sorted(p.name for p in (tmp_path / "revenue").iterdir()) == ["v0001", "v0002"]
+
+
+def test_load_is_shared_and_memory_mapped(tmp_path):
+    weights = np.arange(100_000, dtype=np.float64)
+    registry.register("table", {"weights": weights}, ["x"], root=tmp_path)
+
+    first = registry.load("table", root=tmp_path)
+    assert registry.load("table", "v0001", root=tmp_path) is first
+    assert isinstance(first.model["weights"], np.memmap)
+    np.testing.assert_array_equal(first.model["weights"], weights)
+
+    registry.clear_cache()
+    assert registry.load("table", root=tmp_path) is not first
+
+
+def test_legacy_artifact_is_the_fallback(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model, X, _ = _fit()
+    legacy = registry.LEGACY_PATHS["revenue_xgb_baseline"]
+    legacy.parent.mkdir(parents=True)
+    joblib.dump(model, legacy)
+
+    artifact = registry.load("revenue_xgb_baseline")
+    assert artifact.version == "legacy"
+    assert artifact.feature_cols == ["a", "b"]
+
+    with pytest.raises(FileNotFoundError):
+        registry.load("never_registered")
+
+
+def test_fingerprint_tracks_values_and_columns():
+    _, X, y = _fit()
+    assert registry.data_fingerprint(X, y) == registry.data_fingerprint(X.copy(), y.copy())
+    assert registry.data_fingerprint(X) != registry.data_fingerprint(X.rename(columns={"a": "c"}))
+    assert registry.data_fingerprint(X) != registry.data_fingerprint(X + 1e-9)
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from src.models.revenue_baseline_xgb import (
+    QUANTILE_COLS,
+    QUANTILES,
+    finalize_invoices,
+    fit_quantile_model,
+    predict_quantiles,
+    split_rows,
+    training_rows,
+)
+
+
+def test_training_rows_are_not_fanned_out_by_usage():
+    features = pd.DataFrame({"invoice_id": ["A", "A", "A", "B"], "quantity": [1.0, 1.0, 1.0, 2.0]})
+    # unified has one row per (invoice, usage record)
+    unified = pd.DataFrame({"invoice_id": ["A", "A", "A", "B"], "billed_amount": [10.0, 10.0, 10.0, 20.0]})
+    rows = training_rows(features, unified)
+    assert len(rows) == len(features)
+    assert rows["billed_amount"].tolist() == [10.0, 10.0, 10.0, 20.0]
+
+
+def test_split_keeps_invoices_on_one_side():
+    rows = pd.DataFrame({"invoice_id": np.repeat([f"INV{i}" for i in range(50)], 4)})
+    train_idx, val_idx = split_rows(rows)
+    assert not set(rows["invoice_id"].iloc[train_idx]) & set(rows["invoice_id"].iloc[val_idx])
+
+
+def test_interval_score_comes_from_the_quantile_model_only():
+    inv = pd.DataFrame({
+        "invoice_id": ["A", "B"],
+        "billed_amount": [80.0, 100.0],
+        # the point model disagrees with the quantile median; it must not enter the score
+        "expected_revenue_baseline": [500.0, -500.0],
+        QUANTILE_COLS[0]: [90.0, 99.5],
+        QUANTILE_COLS[1]: [100.0, 100.0],
+        QUANTILE_COLS[2]: [110.0, 100.5],
+    })
+    out = finalize_invoices(inv).set_index("invoice_id")
+    assert out.loc["A", "leakage_interval_score"] == 2.0          # (100 - 80) / (100 - 90)
+    assert out.loc["A", "leakage_below_interval"] == 10.0
+    # half-width floored at $1
+    assert out.loc["B", "leakage_interval_score"] == 0.0
+    assert out.loc["B", "leakage_below_interval"] == 0.0
+
+
+def _heteroscedastic(n, seed):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({"quantity": rng.uniform(1, 20, n), "unit_price": rng.uniform(5, 50, n)})
+    # noise grows with the amount, so a fixed-width band cannot cover it
+    mean = X["quantity"] * X["unit_price"]
+    return X, mean + rng.normal(0, 1, n) * 0.1 * mean
+
+
+def test_quantile_interval_covers_its_nominal_share():
+    X_train, y_train = _heteroscedastic(4000, seed=0)
+    X_val, y_val = _heteroscedastic(2000, seed=1)
+
+    q = predict_quantiles(fit_quantile_model(X_train, y_train), X_val)
+
+    assert (np.diff(q, axis=1) >= 0).all()                  # bounds never cross
+    coverage = ((y_val >= q[:, 0]) & (y_val <= q[:, -1])).mean()
+    assert 0.83 <= coverage <= 0.95                         # nominal 90% (0.87 here)
+    width = q[:, -1] - q[:, 0]
+    assert np.corrcoef(width, X_val["quantity"] * X_val["unit_price"])[0, 1] > 0.8
+    below_median = (y_val < q[:, len(QUANTILES) // 2]).mean()
+    assert 0.45 <= below_median <= 0.55
+
+
+def test_weighted_quantile_fit_matches_the_expanded_rows():
+    X, y = _heteroscedastic(1500, seed=2)
+    counts = np.random.default_rng(3).integers(1, 4, size=len(X))
+    expanded = X.index.repeat(counts)
+    X_val, _ = _heteroscedastic(500, seed=4)
+
+    weighted = predict_quantiles(fit_quantile_model(X, y, weight=counts), X_val)
+    full = predict_quantiles(fit_quantile_model(X.loc[expanded], y.loc[expanded]), X_val)
+
+    # subsampling draws different rows, so close rather than identical
+    scale = np.abs(full).mean()
+    assert np.abs(weighted - full).mean() / scale < 0.05
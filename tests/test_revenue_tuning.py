@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from src.models import revenue_baseline_tuning as tuning
+
+
+def _data(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({"quantity": rng.uniform(1, 50, n), "unit_price": rng.uniform(50, 200, n)})
+    y = pd.Series(X["quantity"] * X["unit_price"] + rng.normal(0, 5, n))
+    groups = pd.Series([f"INV{i // 3}" for i in range(n)])   # fanned-out rows share an invoice
+    return X, y, groups
+
+
+def test_successive_halving_promotes_the_best_of_each_rung():
+    X, y, groups = _data()
+    config, n_rounds, trials = tuning.successive_halving(
+        X, y, groups, n_trials=9, min_rounds=5, max_rounds=45, eta=3, workers=1,
+    )
+
+    assert sorted(trials["n_rounds"].unique()) == [5, 15, 45]
+    for rung in (0, 1):
+        scored = trials[trials["rung"] == rung].sort_values("cv_mae", kind="stable")
+        promoted = set(trials.loc[trials["rung"] == rung + 1, "trial"])
+        assert promoted == set(scored["trial"].head(len(scored) // 3))
+
+    last = trials[trials["rung"] == trials["rung"].max()]
+    best = last.loc[last["cv_mae"].idxmin()]
+    assert config == tuning.sample_configs(9)[int(best["trial"])]
+    assert n_rounds == best["best_rounds"]
+
+
+def test_searched_config_is_kept_only_when_it_beats_the_fixed_one():
+    X, y, groups = _data()
+    fixed = {"n_estimators": 200, "max_depth": 4, "learning_rate": 0.1}
+    worse = {"n_estimators": 2, "max_depth": 1, "learning_rate": 0.02}
+
+    params, metrics = tuning.choose_config(worse, fixed, X, y, groups)
+    assert params == fixed and not metrics["tuned"]
+    assert metrics["cv_mae_tuned"] > metrics["cv_mae_fixed"] == metrics["cv_mae"]
+
+    params, metrics = tuning.choose_config(fixed, worse, X, y, groups)
+    assert params == fixed and metrics["tuned"]
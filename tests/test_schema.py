@@ -0,0 +1,9 @@
+import pandas as pd
+
+from src.data.schema import FEATURE_SCHEMA, UNIFIED_SCHEMA, apply_schema
+
+
+def test_fractional_quantity_is_not_truncated():
+    for schema in (UNIFIED_SCHEMA, FEATURE_SCHEMA):
+        df = apply_schema(pd.DataFrame({"quantity": [12.5, 3.0]}), schema)
+        assert df["quantity"].tolist() == [12.5, 3.0]
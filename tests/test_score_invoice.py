@@ -0,0 +1,35 @@
+import pandas as pd
+
+from src.serving.score_invoice import LEAKAGE_THRESHOLD, RAW_DATA_PATH, InvoiceScorer, ScorerConfig
+
+
+def _sample(n):
+    return pd.read_csv(RAW_DATA_PATH / "invoices.csv").head(n).to_dict("records")
+
+
+def test_every_invoice_gets_a_model_verdict(in_pipeline_dir):
+    scorer = InvoiceScorer(ScorerConfig(explain=True))
+    results = pd.DataFrame(scorer.score_invoices(_sample(300)))
+
+    # nothing is short-circuited: every invoice has its anomaly and leakage scores
+    assert results["anomaly_score"].notna().all()
+    assert results["leakage_estimate"].notna().all()
+
+    material = results["leakage_estimate"] >= LEAKAGE_THRESHOLD
+    flagged = results["is_anomaly"] | material | (results["rules_triggered"] >= 2)
+    assert ((results["verdict"] != "pass") == flagged).all()
+    # only invoices that do not pass are explained with SHAP
+    assert ((results["tier"] == "explained") == flagged).all()
+
+    report = scorer.tier_report()
+    assert report["invoices"].sum() == 300
+    assert report.loc["explained", "invoices"] == flagged.sum()
+
+
+def test_single_invoice_matches_batch_scoring(in_pipeline_dir):
+    records = _sample(50)
+    scorer = InvoiceScorer(ScorerConfig(explain=False))
+    batch = pd.DataFrame(scorer.score_invoices(records)).set_index("invoice_id")
+    for record in records[:5]:
+        single = scorer.score_invoice(record)
+        assert single["verdict"] == batch.loc[str(record["invoice_id"]), "verdict"]
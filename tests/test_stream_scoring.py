@@ -0,0 +1,42 @@
+import json
+
+import pandas as pd
+import pytest
+
+from src.serving.stream_scoring import invalid_reasons, micro_batches
+
+
+def _source(n, error=None):
+    for i in range(n):
+        yield {"invoice_id": f"INV{i}"}
+    if error is not None:
+        raise error
+
+
+def test_micro_batches_reraise_source_errors_after_the_records_read():
+    batches = micro_batches(_source(5, json.JSONDecodeError("bad line", "{oops", 1)), batch_size=2, max_wait_ms=50)
+    seen = []
+    with pytest.raises(json.JSONDecodeError):
+        for batch in batches:
+            seen.extend(r["invoice_id"] for _, r in batch)
+    assert seen == [f"INV{i}" for i in range(5)]
+
+
+def test_micro_batches_end_normally():
+    batches = list(micro_batches(_source(5), batch_size=2, max_wait_ms=50))
+    assert sum(len(b) for b in batches) == 5
+
+
+def test_invalid_reasons_names_missing_and_unparseable_fields():
+    good = {
+        "invoice_id": "INV0", "customer_id": "C1", "product_id": "P1", "invoice_date": "2024-07-08",
+        "quantity": 12.5, "unit_price": 10.0, "discount_pct": 0, "billed_amount": 125.0,
+    }
+    no_qty = {k: v for k, v in good.items() if k != "quantity"}
+    reasons = invalid_reasons(pd.DataFrame([
+        good,
+        no_qty,
+        {**good, "invoice_date": "not a date"},
+        {**good, "billed_amount": "abc", "customer_id": None},
+    ]))
+    assert reasons.tolist() == ["", "quantity", "invoice_date", "customer_id, billed_amount"]